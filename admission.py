@@ -0,0 +1,198 @@
+"""Admission control in front of generations, and what each session's generations cost.
+
+A generation needs one of MAX_CONCURRENT_GENERATIONS slots and budget in two token
+buckets, one per session and one for the process. The buckets are charged with the
+tokens LLM calls actually used, fixes included, so a session sending messages in
+quick succession (or the same one again and again) runs out of budget and waits,
+while other sessions keep being served. Waiting requests are admitted in priority
+order: first messages of a conversation, then follow-ups, then resent messages, and
+within a priority the sessions with the most budget left first.
+
+Identical concurrent requests share one generation (see singleflight). Only the request
+that starts it is admitted and holds a slot, and its LLM calls are charged to that
+request's session; the requests that join it cost nothing.
+"""
+import time
+import heapq
+import asyncio
+import itertools
+import contextvars
+from collections import OrderedDict
+from metrics import ADMISSION_WAIT_SECONDS, LLM_COST
+from config import (MAX_CONCURRENT_GENERATIONS, GENERATION_QUEUE_TIMEOUT, SESSION_TOKENS_PER_MINUTE, SESSION_TOKEN_BURST,
+                    GLOBAL_TOKENS_PER_MINUTE, GLOBAL_TOKEN_BURST, TOKEN_PRICES, CONVERSATION_STORE_SIZE, MODEL_NAME)
+
+# Priorities, lowest first
+FIRST_MESSAGE, FOLLOW_UP, RETRY = 0, 1, 2
+PRIORITY_NAMES = {FIRST_MESSAGE: "first_message", FOLLOW_UP: "follow_up", RETRY: "retry"}
+
+# Session the current generation is for; tasks it starts (fix candidates, shared flights) inherit it
+current_session = contextvars.ContextVar("current_session", default=None)
+
+class Throttled(Exception):
+    """A generation that was not admitted: its session is over budget, or no slot freed up in time"""
+
+    def __init__(self, reason: str, retry_after: float = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Refills at `rate` tokens per second up to `capacity`. Usage is charged after the fact,
+    so the level can go below zero; nothing is admitted until it is positive again.
+    A rate of 0 means no limit."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def charge(self, tokens: int, now: float):
+        if self.rate > 0:
+            self._refill(now)
+            self.level -= tokens
+
+    def wait_time(self, now: float):
+        """Seconds until there is budget left"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        return 0.0 if self.level > 0 else (1 - self.level) / self.rate
+
+def token_cost(model: str, tokens: dict, prices: dict = TOKEN_PRICES):
+    """USD cost of an LLM call, 0 for a model without a price"""
+    prompt_price, completion_price = prices.get(model) or prices.get("*") or (0.0, 0.0)
+    return (tokens.get("prompt", 0) * prompt_price + tokens.get("completion", 0) * completion_price) / 1_000_000
+
+class AdmissionScheduler:
+    """Generation slots handed out by priority, gated by per-session and global token buckets"""
+
+    def __init__(self, slots: int = MAX_CONCURRENT_GENERATIONS, timeout: float = GENERATION_QUEUE_TIMEOUT,
+                 session_rate: float = SESSION_TOKENS_PER_MINUTE / 60, session_burst: int = SESSION_TOKEN_BURST,
+                 global_rate: float = GLOBAL_TOKENS_PER_MINUTE / 60, global_burst: int = GLOBAL_TOKEN_BURST,
+                 max_sessions: int = CONVERSATION_STORE_SIZE):
+        self.slots = slots
+        self.free_slots = slots
+        self.timeout = timeout
+        self.session_rate = session_rate
+        self.session_burst = session_burst
+        self.max_sessions = max_sessions
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self._buckets = OrderedDict()  # session id -> TokenBucket
+        self._usage = OrderedDict()    # session id -> accumulated tokens and cost
+        self._queue = []               # heap of (priority, -budget left, sequence, session id, future)
+        self._sequence = itertools.count()
+        self._timer = None
+
+    def _bucket(self, session_id: str):
+        bucket = self._buckets.get(session_id)
+        if bucket is None:
+            bucket = self._buckets[session_id] = TokenBucket(self.session_rate, self.session_burst)
+        self._buckets.move_to_end(session_id)
+        while len(self._buckets) > self.max_sessions:
+            self._buckets.popitem(last=False)
+        return bucket
+
+    def waiting(self):
+        return sum(1 for entry in self._queue if not entry[-1].done())
+
+    def check(self, session_id: str):
+        """Raise Throttled when the session is over budget for longer than the queue timeout"""
+        wait = self._bucket(session_id).wait_time(time.monotonic())
+        if wait > self.timeout:
+            raise Throttled("session over its token budget", wait)
+
+    async def admit(self, session_id: str, priority: int = FOLLOW_UP):
+        """Wait for a generation slot, raising Throttled when the session is over budget for
+        longer than the queue timeout, or no slot was free in time. Pair with `release`."""
+        start = time.monotonic()
+        self.check(session_id)
+        bucket = self._bucket(session_id)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, -bucket.level, next(self._sequence), session_id, future))
+        self._dispatch()
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except (TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was granted just as the wait ended
+                self.release()
+            if isinstance(e, TimeoutError):
+                raise Throttled("no generation slot free")
+            raise
+        finally:
+            ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start, priority=PRIORITY_NAMES.get(priority, str(priority)))
+
+    def release(self):
+        self.free_slots += 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hand free slots to the waiters first in line whose buckets have budget"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        global_wait = self.global_bucket.wait_time(now)
+        skipped, session_wait = [], None
+        while self.free_slots > 0 and self._queue and global_wait == 0:
+            entry = heapq.heappop(self._queue)
+            future = entry[-1]
+            if future.done():
+                continue  # gave up waiting
+            wait = self._bucket(entry[3]).wait_time(now)
+            if wait > 0:
+                skipped.append(entry)
+                session_wait = wait if session_wait is None else min(session_wait, wait)
+                continue
+            self.free_slots -= 1
+            future.set_result(None)
+            global_wait = self.global_bucket.wait_time(now)
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+        retry_in = global_wait or session_wait
+        if retry_in and self.free_slots > 0 and self.waiting():
+            # Look again when a bucket has refilled
+            self._timer = asyncio.get_running_loop().call_later(retry_in, self._dispatch)
+
+    def charge(self, tokens: dict, model: str = None, session_id: str = None):
+        """Charge the tokens of an LLM call to the buckets and the session's cost
+        (the current generation's session unless given)"""
+        session_id = session_id or current_session.get()
+        model = model or MODEL_NAME
+        used = tokens.get("prompt", 0) + tokens.get("completion", 0)
+        cost = token_cost(model, tokens)
+        now = time.monotonic()
+        self.global_bucket.charge(used, now)
+        if cost:
+            LLM_COST.inc(cost, model=model)
+        if session_id is None:
+            return
+        self._bucket(session_id).charge(used, now)
+        usage = self._usage.get(session_id)
+        if usage is None:
+            usage = self._usage[session_id] = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+        self._usage.move_to_end(session_id)
+        while len(self._usage) > self.max_sessions:
+            self._usage.popitem(last=False)
+        usage["calls"] += 1
+        usage["prompt_tokens"] += tokens.get("prompt", 0)
+        usage["completion_tokens"] += tokens.get("completion", 0)
+        usage["cost"] += cost
+
+    def usage(self, session_id: str):
+        """Tokens and cost (USD) accumulated by a session's LLM calls, and its budget left"""
+        usage = dict(self._usage.get(session_id) or {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0})
+        bucket = self._buckets.get(session_id)
+        if bucket is not None and bucket.rate > 0:
+            bucket.wait_time(time.monotonic())
+            usage["tokens_available"] = max(0, int(bucket.level))
+        return usage
+
+
+admission_scheduler = AdmissionScheduler()
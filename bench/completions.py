@@ -0,0 +1,126 @@
+"""Recorded completions replayed by bench.fake_openrouter.
+
+Each scenario maps to the completion returned for a generation request. Fix requests
+(the error-fixing prompt) get the scenario's `fix`. "broken" is repaired by the static
+rules unless STATIC_FIXES_ENABLED=false; "runtime_error" fails only when it runs, so it
+always exercises _retry_with_error_feedback end to end.
+"""
+import json
+
+GOOD = '''Div(cls="max-w-4xl mx-auto p-6")(
+    Div(cls="text-center mb-8")(
+        UkIcon("sun", 48, 48, cls="text-yellow-500 mb-4"),
+        H1("Photosynthesis", cls="text-4xl font-bold text-green-700 mb-2"),
+        P("How plants convert sunlight into energy", cls="text-xl text-gray-600")
+    ),
+    Accordion(
+        AccordionItem(
+            Div(UkIcon("lightbulb", 20, 20), "What is Photosynthesis?", cls="flex items-center gap-3"),
+            Div(cls="p-4 bg-green-50 rounded-lg")(
+                P("The process by which plants use sunlight, water, and carbon dioxide to create glucose and oxygen."),
+                Div(cls="mt-4 p-3 bg-white rounded border-l-4 border-green-500")(
+                    Strong("Formula: "), CodeSpan("6CO2 + 6H2O + light energy -> C6H12O6 + 6O2")
+                )
+            )
+        ),
+        AccordionItem(
+            Div(UkIcon("settings", 20, 20), "The Process", cls="flex items-center gap-3"),
+            Steps(
+                LiStep("Light Absorption", cls=StepT.success, data_content="1"),
+                LiStep("Water Splitting", cls=StepT.info, data_content="2"),
+                LiStep("CO2 Fixation", cls=StepT.warning, data_content="3"),
+                LiStep("Glucose Production", cls=StepT.primary, data_content="4"),
+                cls=StepsT.vertical
+            )
+        ),
+        AccordionItem(
+            Div(UkIcon("activity", 20, 20), "Importance", cls="flex items-center gap-3"),
+            Grid(
+                Card(H4("Global Impact"), P("Produces 70% of Earth's oxygen"), cls="bg-blue-50 p-4"),
+                Card(H4("Plant Growth"), P("Creates energy for all plant functions"), cls="bg-green-50 p-4"),
+                Card(H4("Energy Storage"), P("Forms the base of food chains"), cls="bg-yellow-50 p-4"),
+                cols=3
+            )
+        )
+    )
+)'''
+
+# Badge does not exist: validator.py rewrites it to a Span, without the rule executing this
+# raises a NameError and triggers a fix request
+BROKEN = '''Div(cls="max-w-2xl mx-auto p-6")(
+    Card(cls="p-6")(
+        Div(cls="flex items-center justify-between mb-4")(
+            H2("Release notes", cls="text-2xl font-bold"),
+            Badge("New", cls="badge-primary")
+        ),
+        Ul(Li("Faster charts"), Li("Dark mode"), Li("Offline support"), cls="list-disc ml-6")
+    )
+)'''
+
+BROKEN_FIXED = '''Div(cls="max-w-2xl mx-auto p-6")(
+    Card(cls="p-6")(
+        Div(cls="flex items-center justify-between mb-4")(
+            H2("Release notes", cls="text-2xl font-bold"),
+            Span("New", cls="px-2 py-1 text-xs rounded bg-primary text-white")
+        ),
+        Ul(Li("Faster charts"), Li("Dark mode"), Li("Offline support"), cls="list-disc ml-6")
+    )
+)'''
+
+# A wrong keyword to a helper defined in the answer: nothing to rewrite statically, the call
+# raises a TypeError when it executes and triggers a fix request
+RUNTIME_ERROR = '''def stat(label, value):
+    return Card(P(label, cls="text-sm text-gray-500"), H3(value, cls="text-2xl font-bold"), cls="p-4")
+
+Div(cls="max-w-4xl mx-auto p-6")(
+    H2("Weekly usage", cls="text-2xl font-bold mb-6"),
+    Grid(
+        stat("Active users", "1,204"),
+        stat("Sessions", "5,310"),
+        stat("Avg. duration", "6m 12s", unit="per session"),
+        cols=3
+    )
+)'''
+
+RUNTIME_ERROR_FIXED = '''def stat(label, value):
+    return Card(P(label, cls="text-sm text-gray-500"), H3(value, cls="text-2xl font-bold"), cls="p-4")
+
+Div(cls="max-w-4xl mx-auto p-6")(
+    H2("Weekly usage", cls="text-2xl font-bold mb-6"),
+    Grid(
+        stat("Active users", "1,204"),
+        stat("Sessions", "5,310"),
+        stat("Avg. duration", "6m 12s per session"),
+        cols=3
+    )
+)'''
+
+def huge_chart(points: int = 800, series: int = 4):
+    """An ApexChart with `series` x `points` data points, like a "show me a year of minute data" answer"""
+    opts = {
+        "chart": {"type": "line", "height": 400, "animations": {"enabled": False}},
+        "series": [{"name": f"Sensor {s + 1}", "data": [round(50 + 30 * ((i * (s + 3)) % 97) / 97, 2) for i in range(points)]}
+                   for s in range(series)],
+        "xaxis": {"categories": [f"t{i}" for i in range(points)]},
+        "stroke": {"curve": "smooth", "width": 1},
+        "title": {"text": "Sensor readings"},
+    }
+    return f'''Div(cls="max-w-6xl mx-auto p-6")(
+    H2("Sensor readings", cls="text-2xl font-bold mb-6"),
+    ApexChart(opts={opts!r})
+)'''
+
+def scenarios(chart_points: int = 800):
+    """Scenario name -> {"content": generation completion, "fix": completion for fix requests}"""
+    return {
+        "good": {"content": GOOD, "fix": GOOD},
+        "broken": {"content": BROKEN, "fix": BROKEN_FIXED},
+        "runtime_error": {"content": RUNTIME_ERROR, "fix": RUNTIME_ERROR_FIXED},
+        "huge_chart": {"content": huge_chart(chart_points), "fix": huge_chart(chart_points)},
+    }
+
+def load_recorded(path: str):
+    """Scenarios from a JSON file of {name: {"content": ..., "fix": ...}}, e.g. captured from real runs"""
+    with open(path, encoding='utf-8') as f:
+        recorded = json.load(f)
+    return {name: {"content": entry["content"], "fix": entry.get("fix", entry["content"])} for name, entry in recorded.items()}
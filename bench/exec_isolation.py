@@ -0,0 +1,70 @@
+"""Check that executing generated components does not leak into the components module.
+
+Runs many executions that each define their own functions and variables, then checks that
+the components module globals are unchanged and that RSS stays flat after warm-up.
+Exits non-zero on failure. Run from the repository root:
+
+    python -m bench.exec_isolation [--runs 10000] [--max-growth-mb 16]
+"""
+import os
+import sys
+import argparse
+import components
+from components import parse_and_execute_component
+
+def rss_mb():
+    """Current resident set size in MB (Linux), falling back to the peak RSS"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def component_source(i: int):
+    # Each run defines new names and shadows a built-in component
+    return f'''rows_{i} = [{i}, {i + 1}, {i + 2}]
+def Card(*content, **kwargs):
+    return Div(*content, cls="card-{i}")
+def make_{i}():
+    return Card(*[P(str(x)) for x in rows_{i}])
+make_{i}()'''
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10_000)
+    parser.add_argument('--warmup', type=int, default=1_000)
+    parser.add_argument('--max-growth-mb', type=float, default=16.0)
+    args = parser.parse_args()
+
+    # Silence the per-execution log line
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        globals_before = len(vars(components))
+        card_before = components.Card
+        for i in range(args.warmup):
+            parse_and_execute_component(component_source(i))
+        rss_start = rss_mb()
+        for i in range(args.warmup, args.warmup + args.runs):
+            parse_and_execute_component(component_source(i))
+        rss_end = rss_mb()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    growth = rss_end - rss_start
+    globals_after = len(vars(components))
+    print(f"runs: {args.runs}  rss: {rss_start:.1f} -> {rss_end:.1f} MB ({growth:+.1f} MB)")
+    print(f"components globals: {globals_before} -> {globals_after}")
+
+    failures = []
+    if globals_after != globals_before or components.Card is not card_before:
+        failures.append("generated code modified the components module globals")
+    if growth > args.max_growth_mb:
+        failures.append(f"RSS grew by {growth:.1f} MB (limit {args.max_growth_mb} MB)")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Local OpenAI-compatible stand-in for OpenRouter that replays recorded completions.
+
+Generation requests get a completion drawn from the scenario mix; fix requests get the
+fixed version of the code they quote. Latency is a time to first token plus a token
+rate, and `stream=true` requests are answered with SSE chunks like the real API.
+Run from the repository root:
+
+    python -m bench.fake_openrouter [--port 8001] [--ttft 0.3] [--tokens-per-second 150]
+                                    [--mix good=70,broken=10,runtime_error=10,huge_chart=10] [--recorded file.json]
+
+and point the app at it with OPENROUTER_BASE_URL=http://127.0.0.1:8001/v1.
+"""
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from bench.completions import scenarios, load_recorded
+
+# First line of the error-fixing system prompt (prompts._build_fix_prompt)
+FIX_PROMPT_PREFIX = "You are an expert FastHTML/MonsterUI developer. Fix"
+CHARS_PER_TOKEN = 4
+
+def parse_mix(mix: str):
+    """"good=70,broken=20" -> {"good": 70.0, "broken": 20.0}"""
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+class FakeProvider:
+    """Chooses completions and paces them like a model generating at `tokens_per_second`"""
+
+    def __init__(self, completions: dict, mix: dict, ttft: float, tokens_per_second: float,
+                 chunk_tokens: int = 8, jitter: float = 0.0, seed: int = 0):
+        unknown = set(mix) - set(completions)
+        if unknown:
+            raise ValueError(f"Unknown scenario(s) in mix: {', '.join(sorted(unknown))}")
+        self.completions = completions
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.chunk_tokens = chunk_tokens
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.served = {}  # scenario -> count
+
+    def pick(self, messages: list):
+        """(scenario name, completion) for a chat request"""
+        if messages and messages[0]["content"].startswith(FIX_PROMPT_PREFIX):
+            request = messages[-1]["content"]
+            for name, entry in self.completions.items():
+                if entry["content"] in request:
+                    return f"{name}:fix", entry["fix"]
+            return "unknown:fix", self.completions[self.names[0]]["fix"]
+        name = self.random.choices(self.names, self.weights)[0]
+        return name, self.completions[name]["content"]
+
+    def delay(self, seconds: float):
+        if self.jitter:
+            seconds *= 1 + self.random.uniform(-self.jitter, self.jitter)
+        return max(0.0, seconds)
+
+    def usage(self, messages: list, content: str):
+        prompt = sum(len(m.get("content") or "") for m in messages) // CHARS_PER_TOKEN
+        completion = max(1, len(content) // CHARS_PER_TOKEN)
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+def build_app(provider: FakeProvider):
+    async def chat_completions(request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        name, content = provider.pick(messages)
+        provider.served[name] = provider.served.get(name, 0) + 1
+        usage = provider.usage(messages, content)
+        model = body.get("model", "fake")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(provider.delay(provider.ttft + usage["completion_tokens"] / provider.tokens_per_second))
+            return JSONResponse({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        def chunk(delta, finish_reason=None, **extra):
+            choices = [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                       "model": model, "choices": choices, **extra}
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events():
+            await asyncio.sleep(provider.delay(provider.ttft))
+            yield chunk({"role": "assistant", "content": ""})
+            step = provider.chunk_tokens * CHARS_PER_TOKEN
+            for start in range(0, len(content), step):
+                yield chunk({"content": content[start:start + step]})
+                await asyncio.sleep(provider.delay(provider.chunk_tokens / provider.tokens_per_second))
+            yield chunk({}, finish_reason="stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield chunk(None, usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def stats(request):
+        return JSONResponse(provider.served)
+
+    return Starlette(routes=[
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/stats", stats),
+    ])
+
+def add_provider_arguments(parser):
+    parser.add_argument('--ttft', type=float, default=0.3, help='seconds before the first token')
+    parser.add_argument('--tokens-per-second', type=float, default=150)
+    parser.add_argument('--chunk-tokens', type=int, default=8, help='tokens per streamed chunk')
+    parser.add_argument('--jitter', type=float, default=0.2, help='relative +/- variation of every delay')
+    parser.add_argument('--mix', default='good=70,broken=10,runtime_error=10,huge_chart=10', help='scenario weights')
+    parser.add_argument('--chart-points', type=int, default=800, help='data points per series of huge_chart')
+    parser.add_argument('--recorded', help='JSON file of recorded completions to use instead of the built-in ones')
+    parser.add_argument('--seed', type=int, default=0)
+
+def provider_from_args(args):
+    completions = load_recorded(args.recorded) if args.recorded else scenarios(args.chart_points)
+    return FakeProvider(completions, parse_mix(args.mix), args.ttft, args.tokens_per_second,
+                        args.chunk_tokens, args.jitter, args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    add_provider_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(build_app(provider_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+"""Load driver for the send route, against a local fake OpenRouter by default.
+
+Starts bench.fake_openrouter and the app (uvicorn main:app) as subprocesses, sends chat
+messages from `--concurrency` simulated users and follows the SSE stream when streaming
+is enabled. It reports requests/s, latency percentiles, retries per request and the RSS
+of the app (including sandbox workers) over time. The --max-p95, --min-rps and
+--max-rss-growth-mb options make it exit non-zero on a regression. Run from the
+repository root:
+
+    python -m bench.load [--concurrency 20] [--requests 200] [--mix good=70,broken=10,runtime_error=10,huge_chart=10]
+                         [--ttft 0.3] [--tokens-per-second 150] [--json results.json]
+
+App settings are read from the environment as usual (e.g. STREAMING_ENABLED=false,
+SANDBOX_WORKERS=4). Use --url to drive an app that is already running instead.
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import subprocess
+import httpx
+from bench.fake_openrouter import add_provider_arguments
+
+STREAM_URL_RE = re.compile(r'sse-connect="([^"]+)"')
+FIXED_RE = re.compile(r'Fixed after (\d+) attempt')
+FAILED_RE = re.compile(r'Failed after (\d+) attempts')
+PROMPTS = ["Explain photosynthesis", "Show this week's release notes", "Chart the sensor readings",
+           "Compare Python vs JavaScript", "Show sales data chart"]
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def process_tree_rss_mb(pid: int):
+    """RSS of a process and all its descendants in MB (Linux), None if unavailable"""
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/statm') as f:
+                total += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+            for tid in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{tid}/children') as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            if current == pid:
+                return None
+    return total / 1024 ** 2
+
+def percentile(values: list[float], pct: float):
+    """Nearest-rank percentile"""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))]
+
+def classify(html: str):
+    """(outcome, retries) of a chat response"""
+    if m := FIXED_RE.search(html):
+        return "success", int(m.group(1))
+    if m := FAILED_RE.search(html):
+        return "failed", int(m.group(1)) - 1
+    if "handling a lot of requests" in html:
+        return "busy", 0
+    if "Sorry, I encountered an error" in html or "Retry failed" in html or "has expired" in html:
+        return "error", 0
+    return "success", 0
+
+async def wait_until_up(url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url, timeout=1)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:g}s")
+
+async def chat_request(client: httpx.AsyncClient, base_url: str, session_id: str, msg: str):
+    """Send one message and follow its stream; returns a result dict"""
+    start = time.perf_counter()
+    first_event = None
+    try:
+        response = await client.post(f"{base_url}/send", data={"msg": msg, "session_id": session_id})
+        response.raise_for_status()
+        html = response.text
+        stream = STREAM_URL_RE.search(html)
+        if stream:
+            # The last message event before "done" holds the final result
+            data, html = [], ""
+            async with client.stream("GET", base_url + stream.group(1)) as sse:
+                async for line in sse.aiter_lines():
+                    if line.startswith("event: done"):
+                        break
+                    if line.startswith("data:"):
+                        if first_event is None:
+                            first_event = time.perf_counter() - start
+                        data.append(line[5:])
+                    elif not line and data:
+                        html, data = "\n".join(data), []
+        outcome, retries = classify(html)
+    except httpx.HTTPError as e:
+        outcome, retries = "http_error", 0
+        print(f"HTTP error: {e!r}", file=sys.stderr)
+    return {"latency": time.perf_counter() - start, "first_event": first_event,
+            "outcome": outcome, "retries": retries}
+
+async def run_load(base_url: str, concurrency: int, total: int, repeat: bool, app_pid: int, sample_interval: float):
+    results, samples = [], []
+    issued = 0
+    started = time.perf_counter()
+
+    async def user(client):
+        nonlocal issued
+        session_id = uuid.uuid4().hex
+        while issued < total:
+            i = issued
+            issued += 1
+            prompt = PROMPTS[i % len(PROMPTS)]
+            # Unique messages defeat the response cache unless --repeat is given
+            msg = prompt if repeat else f"{prompt} (request {i})"
+            results.append(await chat_request(client, base_url, session_id, msg))
+
+    async def sampler():
+        while True:
+            if app_pid:
+                samples.append((time.perf_counter() - started, process_tree_rss_mb(app_pid), len(results)))
+            await asyncio.sleep(sample_interval)
+
+    limits = httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2)
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(300, connect=10)) as client:
+        sampling = asyncio.create_task(sampler())
+        await asyncio.gather(*(user(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        sampling.cancel()
+    if app_pid:
+        samples.append((elapsed, process_tree_rss_mb(app_pid), len(results)))
+    return results, samples, elapsed
+
+def summarize(results: list[dict], samples: list, elapsed: float):
+    latencies = [r["latency"] for r in results]
+    first_events = [r["first_event"] for r in results if r["first_event"] is not None]
+    outcomes, retry_counts = {}, {}
+    for r in results:
+        outcomes[r["outcome"]] = outcomes.get(r["outcome"], 0) + 1
+        retry_counts[r["retries"]] = retry_counts.get(r["retries"], 0) + 1
+    rss = [s[1] for s in samples if s[1] is not None]
+    return {
+        "requests": len(results),
+        "seconds": elapsed,
+        "requests_per_second": len(results) / elapsed if elapsed else 0.0,
+        "latency": {f"p{p}": percentile(latencies, p) for p in (50, 95, 99)} | {"max": max(latencies, default=float('nan'))},
+        "first_event": {f"p{p}": percentile(first_events, p) for p in (50, 95)} if first_events else None,
+        "outcomes": outcomes,
+        "retries_per_request": sum(r["retries"] for r in results) / len(results) if results else 0.0,
+        "retries": dict(sorted(retry_counts.items())),
+        "rss_mb": {"start": rss[0], "peak": max(rss), "end": rss[-1]} if rss else None,
+        "rss_timeline": [{"t": round(t, 2), "rss_mb": m, "completed": n} for t, m, n in samples],
+    }
+
+def report(summary: dict):
+    latency = summary["latency"]
+    print(f"\nrequests: {summary['requests']} in {summary['seconds']:.1f}s  ->  {summary['requests_per_second']:.2f} req/s")
+    print(f"latency:  p50 {latency['p50']:.3f}s  p95 {latency['p95']:.3f}s  p99 {latency['p99']:.3f}s  max {latency['max']:.3f}s")
+    if summary["first_event"]:
+        print(f"first streamed event: p50 {summary['first_event']['p50']:.3f}s  p95 {summary['first_event']['p95']:.3f}s")
+    print(f"outcomes: {summary['outcomes']}")
+    print(f"retries per request: {summary['retries_per_request']:.2f}  distribution {summary['retries']}")
+    if summary["rss_mb"]:
+        rss = summary["rss_mb"]
+        print(f"rss (app + workers): start {rss['start']:.1f} MB  peak {rss['peak']:.1f} MB  end {rss['end']:.1f} MB")
+        print(f"{'t (s)':>8} {'rss MB':>8} {'done':>6}")
+        timeline = summary["rss_timeline"]
+        step = max(1, len(timeline) // 20)
+        for sample in timeline[::step] + ([timeline[-1]] if (len(timeline) - 1) % step else []):
+            print(f"{sample['t']:>8.1f} {sample['rss_mb'] or 0:>8.1f} {sample['completed']:>6}")
+
+def gate(summary: dict, args):
+    failures = []
+    if args.max_p95 is not None and summary["latency"]["p95"] > args.max_p95:
+        failures.append(f"p95 latency {summary['latency']['p95']:.3f}s > {args.max_p95}s")
+    if args.min_rps is not None and summary["requests_per_second"] < args.min_rps:
+        failures.append(f"{summary['requests_per_second']:.2f} req/s < {args.min_rps} req/s")
+    if args.max_rss_growth_mb is not None and summary["rss_mb"]:
+        growth = summary["rss_mb"]["end"] - summary["rss_mb"]["start"]
+        if growth > args.max_rss_growth_mb:
+            failures.append(f"RSS grew by {growth:.1f} MB > {args.max_rss_growth_mb} MB")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return not failures
+
+def provider_argv(args):
+    """Command line options forwarded to bench.fake_openrouter"""
+    argv = ['--ttft', str(args.ttft), '--tokens-per-second', str(args.tokens_per_second),
+            '--chunk-tokens', str(args.chunk_tokens), '--jitter', str(args.jitter), '--mix', args.mix,
+            '--chart-points', str(args.chart_points), '--seed', str(args.seed)]
+    if args.recorded:
+        argv += ['--recorded', args.recorded]
+    return argv
+
+async def main_async(args):
+    processes = []
+    app_pid = args.pid
+    base_url = args.url
+    try:
+        if not base_url:
+            provider_port, app_port = free_port(), free_port()
+            processes.append(subprocess.Popen(
+                [sys.executable, '-m', 'bench.fake_openrouter', '--port', str(provider_port), *provider_argv(args)]))
+            await wait_until_up(f"http://127.0.0.1:{provider_port}/stats", 30)
+
+            env = dict(os.environ, OPENROUTER_BASE_URL=f"http://127.0.0.1:{provider_port}/v1",
+                       OPENROUTER_API_KEY=os.environ.get("OPENROUTER_API_KEY") or "bench")
+            app = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1',
+                                    '--port', str(app_port), '--log-level', 'warning'],
+                                   env=env, stdout=None if args.verbose else subprocess.DEVNULL)
+            processes.append(app)
+            app_pid = app.pid
+            base_url = f"http://127.0.0.1:{app_port}"
+            await wait_until_up(base_url + "/", 120)
+
+        if args.warmup:
+            print(f"warming up with {args.warmup} request(s)...")
+            await run_load(base_url, min(args.warmup, args.concurrency), args.warmup, args.repeat, None, args.sample_interval)
+
+        print(f"sending {args.requests} requests from {args.concurrency} concurrent users to {base_url}...")
+        results, samples, elapsed = await run_load(base_url, args.concurrency, args.requests, args.repeat,
+                                                   app_pid, args.sample_interval)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    return summarize(results, samples, elapsed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--repeat', action='store_true', help='resend the same few messages (exercises the response cache)')
+    parser.add_argument('--url', help='drive an already running app instead of starting one')
+    parser.add_argument('--pid', type=int, help='app process to sample RSS from when using --url')
+    parser.add_argument('--sample-interval', type=float, default=1.0, help='seconds between RSS samples')
+    parser.add_argument('--json', help='write the summary to this file')
+    parser.add_argument('--max-p95', type=float, help='fail if p95 latency exceeds this many seconds')
+    parser.add_argument('--min-rps', type=float, help='fail below this many requests/s')
+    parser.add_argument('--max-rss-growth-mb', type=float, help='fail if RSS grows more than this during the run')
+    parser.add_argument('--verbose', action='store_true', help="show the app's log output")
+    add_provider_arguments(parser)
+    args = parser.parse_args()
+
+    summary = asyncio.run(main_async(args))
+    report(summary)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    sys.exit(0 if gate(summary, args) else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Micro-benchmark for components.auto_repair_syntax on large generated components.
+
+Run from the repository root:
+
+    python -m bench.repair_syntax [--sizes 50 100 200] [--repeat 20]
+"""
+import ast
+import time
+import argparse
+from components import auto_repair_syntax
+
+def make_component(target_kb: int, truncate: bool = False):
+    """Dashboard-like component source of roughly `target_kb` KB.
+
+    Titles and text contain brackets inside string literals, which a naive bracket counter
+    "repairs" into broken code.
+    """
+    cards = []
+    i = 0
+    while sum(len(c) for c in cards) < target_kb * 1024:
+        data = ', '.join(str((i * 37 + j * 11) % 500) for j in range(60))
+        categories = ', '.join(f'"W{j} (est.)"' for j in range(60))
+        cards.append(f'''    Card(cls="p-4 shadow-lg rounded-xl bg-gradient-to-br from-blue-50 to-indigo-100")(
+        Div(cls="flex items-center gap-3 mb-4")(
+            UkIcon("bar-chart-2", 24, 24, cls="text-indigo-600"),
+            H3("Region {i} revenue (Q{i % 4 + 1}) :)", cls="text-lg font-semibold")
+        ),
+        P("Forecast [beta] {{updated hourly}} - values in $1,000s", cls="text-sm text-gray-500"),
+        ApexChart(opts={{
+            "chart": {{"type": "area", "height": 240}},
+            "series": [{{"name": "Revenue (k)", "data": [{data}]}}],
+            "xaxis": {{"categories": [{categories}]}},
+            "title": {{"text": "Trend ) for region {i}"}}
+        }})
+    )''')
+        i += 1
+    source = 'Div(cls="max-w-6xl mx-auto p-6")(\n    Grid(\n' + ',\n'.join(cards) + ',\n        cols=3\n    )\n)'
+    if truncate:
+        # Simulate output cut off mid-stream: drop the closing brackets
+        source = source.rstrip(')\n ')
+    return source
+
+# Valid code with `<...>` spans outside string literals that must not be taken for HTML tags
+COMPARISONS = [
+    'P(a<b and c>d)',
+    'Div(x<y, y>z)',
+    'Div(*[P(i) for i in range(10) if 2<i and i>1])',
+    'Badge("low" if value<limit and limit>0 else "high")',
+]
+
+def check_comparisons():
+    """(source, repaired) for each comparison snippet the repair changes, [] when all come through unchanged"""
+    return [(source, auto_repair_syntax(source)) for source in COMPARISONS if auto_repair_syntax(source) != source]
+
+def bench(source: str, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        repaired = auto_repair_syntax(source)
+        best = min(best, time.perf_counter() - start)
+    try:
+        ast.parse(repaired)
+        parses = True
+    except SyntaxError:
+        parses = False
+    return best, parses
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 100, 200], help='component sizes in KB')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'variant':>10} {'best ms':>9} {'MB/s':>8} {'parses':>7}")
+    for size in args.sizes:
+        for truncate in (False, True):
+            source = make_component(size, truncate=truncate)
+            best, parses = bench(source, args.repeat)
+            mb_per_s = len(source) / best / 1e6
+            variant = 'truncated' if truncate else 'valid'
+            print(f"{len(source) // 1024:>6}KB {variant:>10} {best * 1000:>9.2f} {mb_per_s:>8.1f} {str(parses):>7}")
+
+    changed = check_comparisons()
+    print(f"\ncomparisons unchanged: {len(COMPARISONS) - len(changed)}/{len(COMPARISONS)}")
+    for source, repaired in changed:
+        print(f"  {source!r} -> {repaired!r}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import os
+import time
+import sqlite3
+import hashlib
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from config import RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_DB
+
+def normalize_message(message: str):
+    """Case and whitespace insensitive form of a chat message"""
+    return ' '.join(message.lower().split())
+
+class ResponseCache:
+    """LRU + TTL cache of generated component code, with an optional SQLite tier that survives restarts.
+
+    Only code that executed successfully should be stored, so a hit can be rendered without
+    calling the LLM. Memory is used on the event loop; the database is read in a thread and
+    written by a single writer thread, so storing never waits for it.
+    """
+
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL, db_path: str = RESPONSE_CACHE_DB):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (stored at, code)
+        self.db_path = db_path
+        self._lock = threading.Lock()  # the in-memory entries, never held while the database is used
+        self._db = None
+        if db_path:
+            self._connect()
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, code TEXT NOT NULL, stored_at REAL NOT NULL)")
+            self._db.commit()
+            # SQLite connections must not cross a fork, forked server workers open their own
+            os.register_at_fork(after_in_child=self._connect)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def _connect(self):
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-cache")
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+
+    def _read(self, key: str):
+        with self._db_lock:
+            return self._db.execute("SELECT code, stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+
+    def _write(self, sql: str, params: tuple):
+        with self._db_lock:
+            self._db.execute(sql, params)
+            self._db.commit()
+
+    def key(self, history: list[str], prompt_version: str):
+        """Cache key for the (already trimmed) conversation history and prompt version.
+
+        The model is deliberately not part of the key: the router picks it per request (hedged,
+        fallback or fast-model calls), so it is not known before the lookup, and any model's code
+        that executed answers the conversation. Changing models does not invalidate entries,
+        they age out with the TTL.
+        """
+        digest = hashlib.sha256(prompt_version.encode('utf-8'))
+        for message in history:
+            digest.update(b"\0" + normalize_message(message).encode('utf-8'))
+        return digest.hexdigest()
+
+    async def get(self, key: str):
+        """Cached code for `key`, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+
+        if self._db is not None:
+            row = await asyncio.to_thread(self._read, key)
+            if row and now - row[1] <= self.ttl:
+                with self._lock:
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                return row[0]
+            if row:
+                self._writer.submit(self._write, "DELETE FROM responses WHERE key = ?", (key,))
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, code: str):
+        """Store code that executed successfully"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, code, now)
+            self.stores += 1
+        if self._db is not None:
+            self._writer.submit(self._write, "INSERT OR REPLACE INTO responses (key, code, stored_at) VALUES (?, ?, ?)",
+                                (key, code, now))
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self._db is not None:
+            self._writer.submit(self._write, "DELETE FROM responses WHERE key = ?", (key,))
+
+    def _remember(self, key: str, code: str, stored_at: float):
+        self._entries[key] = (stored_at, code)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "size": len(self._entries),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache()
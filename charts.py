@@ -0,0 +1,130 @@
+"""Chart options served separately from the components they belong to.
+
+ApexChart inlines its options, series included, in the component HTML, so a data-heavy
+answer is transferred and every chart initialized at once, even those never scrolled
+to. Options above LAZY_CHART_MIN_BYTES are moved into a content-addressed store and the
+chart is replaced by a placeholder that fetches them when it comes into view. The URL
+changes with the content, so the browser may cache a chart forever.
+"""
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from config import LAZY_CHARTS_ENABLED, LAZY_CHART_MIN_BYTES, CHART_CACHE_BYTES, CHART_CACHE_TTL, CHART_CACHE_DB
+
+# ApexChart renders Div(Uk_chart(Script(options, type='application/json')))
+_CHART_RE = re.compile(r"<uk-chart>\s*<script type=['\"]application/json['\"]>(.*?)</script>\s*</uk-chart>", re.S)
+CHART_URL = "/charts/{key}"
+# Height of a placeholder, so only charts near the viewport are loaded
+PLACEHOLDER_HEIGHT = 350
+
+class ChartStore:
+    """Chart options by the hash of their JSON: the most recent in memory (up to `max_bytes`),
+    all of them in SQLite when a database path is given, so every server worker can serve them.
+    `put` runs on the event loop, so its database writes go to a single writer thread."""
+
+    def __init__(self, max_bytes: int = CHART_CACHE_BYTES, ttl: float = CHART_CACHE_TTL, db_path: str = CHART_CACHE_DB):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries = OrderedDict()  # key -> options JSON
+        self._size = 0
+        self._lock = threading.Lock()  # the in-memory entries, never held while the database is used
+        self._db = None
+        self._stores_since_prune = 0
+        if db_path:
+            self._connect()
+            self._db.execute("CREATE TABLE IF NOT EXISTS charts (key TEXT PRIMARY KEY, opts TEXT NOT NULL, stored_at REAL NOT NULL)")
+            self._db.commit()
+            # SQLite connections must not cross a fork, forked server workers open their own
+            os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self):
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chart-store")
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+
+    def _write(self, key: str, opts: str, stored_at: float, prune: bool):
+        with self._db_lock:
+            self._db.execute("INSERT OR REPLACE INTO charts (key, opts, stored_at) VALUES (?, ?, ?)", (key, opts, stored_at))
+            if prune:
+                self._db.execute("DELETE FROM charts WHERE stored_at < ?", (stored_at - self.ttl,))
+            self._db.commit()
+
+    @staticmethod
+    def key(opts: str):
+        return hashlib.sha256(opts.encode('utf-8')).hexdigest()[:32]
+
+    def put(self, opts: str):
+        """Store chart options, returning their key"""
+        key = self.key(opts)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return key
+            self._remember(key, opts)
+            self._stores_since_prune += 1
+            prune = self._stores_since_prune >= 1000
+            if prune:
+                self._stores_since_prune = 0
+        if self._db is not None:
+            self._writer.submit(self._write, key, opts, time.time(), prune)
+        return key
+
+    def get(self, key: str):
+        """Options JSON stored under `key`, or None"""
+        with self._lock:
+            opts = self._entries.get(key)
+            if opts is not None:
+                self._entries.move_to_end(key)
+                return opts
+        if self._db is None:
+            return None
+        # Called from the chart route, which runs in the threadpool
+        with self._db_lock:
+            row = self._db.execute("SELECT opts FROM charts WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with self._lock:
+            self._remember(key, row[0])
+        return row[0]
+
+    def _remember(self, key: str, opts: str):
+        self._entries[key] = opts
+        self._size += len(opts)
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+
+chart_store = ChartStore()
+
+def chart_html(opts: str):
+    """The chart element for stored options, as ApexChart renders it"""
+    return f"<uk-chart><script type='application/json'>{opts}</script></uk-chart>"
+
+def _placeholder(key: str):
+    # #chatlist scrolls on its own, where htmx's revealed does not fire; intersect does
+    return (f'<div hx-get="{CHART_URL.format(key=key)}" hx-trigger="intersect once" hx-swap="outerHTML" '
+            f'class="genui-chart-placeholder" style="min-height: {PLACEHOLDER_HEIGHT}px"></div>')
+
+def defer_charts(html: str, min_bytes: int = LAZY_CHART_MIN_BYTES, store: ChartStore = chart_store):
+    """`html` with the options of charts over `min_bytes` moved to `store`, and (html, bytes moved)"""
+    if not LAZY_CHARTS_ENABLED or '<uk-chart>' not in html:
+        return html, 0
+    moved = 0
+
+    def replace(match):
+        nonlocal moved
+        opts = match.group(1)
+        if len(opts) < min_bytes:
+            return match.group(0)
+        moved += len(opts)
+        return _placeholder(store.put(opts))
+
+    return _CHART_RE.sub(replace, html), moved
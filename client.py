@@ -1,19 +1,46 @@
-from openai import OpenAI
-from config import OPENROUTER_API_KEY, OPENROUTER_BASE_URL, MODEL_NAME
-
-def create_openai_client():
-    """Create OpenAI client configured for OpenRouter"""
-    return OpenAI(
-        base_url=OPENROUTER_BASE_URL,
-        api_key=OPENROUTER_API_KEY,
+import httpx
+from openai import AsyncOpenAI
+from config import (OPENROUTER_API_KEY, OPENROUTER_BASE_URL, MODEL_NAME,
+                    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY,
+                    HTTP_CONNECT_TIMEOUT, HTTP_REQUEST_TIMEOUT)
+
+# Process-wide client, created lazily and reused so connections to OpenRouter stay warm
+_async_client = None
+
+def _http_limits():
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
     )
 
-def get_completion(client: OpenAI, messages: list, tools=None):
-    """Get completion from OpenRouter using OpenAI client"""
+def _http_timeout():
+    return httpx.Timeout(HTTP_REQUEST_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+
+def create_async_openai_client():
+    """Return the shared AsyncOpenAI client configured for OpenRouter"""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(
+            base_url=OPENROUTER_BASE_URL,
+            api_key=OPENROUTER_API_KEY,
+            timeout=_http_timeout(),
+            http_client=httpx.AsyncClient(limits=_http_limits(), timeout=_http_timeout()),
+        )
+    return _async_client
+
+async def close_clients():
+    """Close the shared client and its connection pool (call on shutdown)"""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+def _completion_kwargs(messages: list, tools=None, model: str = None, temperature: float = 0.7):
     kwargs = {
-        "model": MODEL_NAME,
+        "model": model or MODEL_NAME,
         "messages": messages,
-        "temperature": 0.7,
+        "temperature": temperature,
         "extra_body": {
             "provider": {
                 "sort": "throughput"
@@ -24,16 +51,54 @@ def get_completion(client: OpenAI, messages: list, tools=None):
     if tools:
         # Convert tools to OpenAI format if needed
         kwargs["tools"] = tools
+    return kwargs
 
-    response = client.chat.completions.create(**kwargs)
-    
-    # Return both content and usage information
-    usage = response.usage
+def _usage_tokens(usage):
     return {
-        "content": response.choices[0].message.content,
-        "tokens": {
-            "prompt": usage.prompt_tokens if usage else 0,
-            "completion": usage.completion_tokens if usage else 0,
-            "total": usage.total_tokens if usage else 0
-        }
-    }
\ No newline at end of file
+        "prompt": usage.prompt_tokens if usage else 0,
+        "completion": usage.completion_tokens if usage else 0,
+        "total": usage.total_tokens if usage else 0
+    }
+
+def _completion_result(response):
+    # Return both content and usage information
+    message = response.choices[0].message
+    result = {
+        "content": message.content,
+        "tokens": _usage_tokens(response.usage)
+    }
+    if message.tool_calls:
+        # Tools are used for structured output, only the first call counts
+        result["arguments"] = message.tool_calls[0].function.arguments
+    return result
+
+async def get_completion_async(client: AsyncOpenAI, messages: list, tools=None, model: str = None, temperature: float = 0.7):
+    """Get completion from OpenRouter using the AsyncOpenAI client"""
+    response = await client.chat.completions.create(**_completion_kwargs(messages, tools, model, temperature))
+    return _completion_result(response)
+
+async def get_completion_stream(client: AsyncOpenAI, messages: list, tools=None, model: str = None):
+    """Stream a completion from OpenRouter, yielding {"content": delta} chunks ({"arguments": delta} for the
+    first tool call's arguments) and finally {"tokens": usage}"""
+    stream = await client.chat.completions.create(
+        **_completion_kwargs(messages, tools, model),
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    usage = None
+    try:
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                yield {"content": delta.content}
+            for call in delta.tool_calls or ():
+                if call.index == 0 and call.function and call.function.arguments:
+                    yield {"arguments": call.function.arguments}
+    finally:
+        # Release the connection right away when the consumer stops early (e.g. a cancelled hedge)
+        await stream.close()
+    yield {"tokens": _usage_tokens(usage)}
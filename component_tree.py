@@ -0,0 +1,207 @@
+"""JSON component trees: the tool schema the model fills in, and a renderer that turns a
+tree into FastHTML components without executing any generated code.
+
+A node is text, or {"type": "Card", "props": {"cls": "p-4"}, "children": [...]}, which
+renders as Card(*children, cls="p-4"). Props may reference MonsterUI enums by name
+("ButtonT.primary"), and a prop that is itself a node (e.g. a Card header) is rendered.
+"""
+import re
+import enum
+import json
+import time
+import difflib
+import inspect
+import functools
+from fasthtml.common import Div
+from components import BASE_NAMESPACE, component_registry, closable_prefix, to_html
+from validator import BADGE_NAMES, NAME_ALIASES
+
+TREE_TOOL_NAME = "render_component"
+# Modules whose functions build components; the HTML tags are functools.partial objects
+COMPONENT_MODULES = ('monsterui.franken', 'monsterui.daisy')
+EXTRA_COMPONENTS = {'A', 'Style'}
+# Tags that belong to the page rather than to a component
+PAGE_TAGS = {'Html', 'Head', 'Title', 'Meta', 'Link', 'Base', 'Body'}
+MAX_TREE_DEPTH = 64
+
+_ENUM_REF_RE = re.compile(r'^([A-Z]\w*)\.(\w+)$')
+_PROP_ALIASES = {'class': 'cls', 'className': 'cls'}
+
+class ComponentTreeError(ValueError):
+    """A component tree that is not valid JSON, or has nodes that cannot be rendered"""
+
+    def __init__(self, issues: list[str]):
+        super().__init__("; ".join(issues))
+        self.issues = issues
+
+def _is_component(name: str, value):
+    if not name[:1].isupper() or name in PAGE_TAGS:
+        return False
+    if isinstance(value, functools.partial) or name in EXTRA_COMPONENTS:
+        return True
+    return inspect.isfunction(value) and value.__module__ in COMPONENT_MODULES
+
+def _node_schema(components: list[str]):
+    return {
+        "anyOf": [
+            {"type": "string"},
+            {"type": "number"},
+            {
+                "type": "object",
+                "properties": {
+                    "type": {"type": "string", "enum": components},
+                    "props": {"type": "object", "description": "Keyword arguments, e.g. {\"cls\": \"p-4\", \"opts\": {...}}"},
+                    "children": {"type": "array", "items": {"$ref": "#/$defs/node"},
+                                 "description": "Positional arguments: child nodes or text"},
+                },
+                "required": ["type"],
+            },
+        ]
+    }
+
+class TreeRenderer:
+    """Validates component trees against the registry and renders them"""
+
+    def __init__(self, namespace=BASE_NAMESPACE, registry=component_registry):
+        self.namespace = namespace
+        self.registry = registry
+        self.components = sorted(name for name in registry.signatures if _is_component(name, namespace[name]))
+        self._allowed = frozenset(self.components)
+        self.enums = {name: value for name, value in namespace.items()
+                      if isinstance(value, type) and issubclass(value, enum.Enum)}
+        self._tool = {
+            "type": "function",
+            "function": {
+                "name": TREE_TOOL_NAME,
+                "description": "Render the UI component for the user's request as a tree of FastHTML/MonsterUI components",
+                "parameters": {
+                    "type": "object",
+                    "properties": {"root": {"$ref": "#/$defs/node"}},
+                    "required": ["root"],
+                    "$defs": {"node": _node_schema(self.components)},
+                },
+            },
+        }
+
+    def tool(self):
+        """The tool definition sent with tree-mode completions (built once)"""
+        return self._tool
+
+    def _value(self, value, path: str, issues: list, depth: int):
+        """A prop value: enum references resolved, nodes rendered, anything else as is"""
+        if isinstance(value, str):
+            match = _ENUM_REF_RE.match(value)
+            if match and match.group(1) in self.enums:
+                return getattr(self.enums[match.group(1)], match.group(2), value)
+            return value
+        if isinstance(value, dict) and value.get("type") in self._allowed:
+            return self._render(value, path, issues, depth + 1)
+        if isinstance(value, list):
+            resolved = [self._value(v, f"{path}[{i}]", issues, depth) for i, v in enumerate(value)]
+            # A list of classes or nodes; FastHTML joins tuples of classes and flattens tuples of children
+            return tuple(resolved) if any(r is not v for r, v in zip(resolved, value)) else value
+        return value
+
+    def _render(self, node, path: str, issues: list, depth: int = 0):
+        if isinstance(node, str):
+            return node
+        if isinstance(node, (int, float)) and not isinstance(node, bool):
+            return node
+        if isinstance(node, list):
+            rendered = (self._render(child, f"{path}[{i}]", issues, depth + 1) for i, child in enumerate(node))
+            return tuple(child for child in rendered if child is not None)
+        if not isinstance(node, dict):
+            issues.append(f"{path}: expected a node or text, got {json.dumps(node)}")
+            return None
+        if depth > MAX_TREE_DEPTH:
+            issues.append(f"{path}: nested deeper than {MAX_TREE_DEPTH} levels")
+            return None
+
+        name = node.get("type")
+        props = node.get("props") or {}
+        children = node.get("children") or []
+        if not isinstance(props, dict) or not isinstance(children, list):
+            issues.append(f"{path}: props must be an object and children a list")
+            return None
+        props = {_PROP_ALIASES.get(key, key): value for key, value in props.items()}
+        if name in BADGE_NAMES:
+            # Same rewrite as validator.py does for generated code
+            name, props = 'Span', {**props, 'cls': ('badge', props['cls']) if 'cls' in props else 'badge'}
+        name = NAME_ALIASES.get(name, name)
+        path = f"{path}.{name}" if isinstance(name, str) else path
+        # Children and props are rendered first so every problem in the tree is reported at once
+        args = [self._render(child, f"{path}[{i}]", issues, depth + 1) for i, child in enumerate(children)]
+        kwargs = {key: self._value(value, f"{path}.{key}", issues, depth) for key, value in props.items()}
+        if name not in self._allowed:
+            if name in self.namespace:
+                issues.append(f"{path}: {name} cannot be used in a component tree")
+            else:
+                suggestion = difflib.get_close_matches(str(name), self.components, n=1)
+                hint = f" (did you mean {suggestion[0]}?)" if suggestion else ""
+                issues.append(f"{path}: unknown component {json.dumps(name)}{hint}")
+            return None
+        problem = self.registry.check_call(name, len(children), list(props))
+        if problem:
+            issues.append(f"{path}: {name}() {problem}")
+            return None
+        try:
+            return self.namespace[name](*[arg for arg in args if arg is not None], **kwargs)
+        except Exception as e:
+            issues.append(f"{path}: {name}() raised {type(e).__name__}: {e}")
+            return None
+
+    def render(self, tree, strict: bool = True):
+        """The component for a parsed tree. Strict rendering raises ComponentTreeError listing
+        every problem; otherwise nodes with problems are left out (for partial trees)."""
+        if isinstance(tree, dict) and "root" in tree:
+            tree = tree["root"]
+        issues = []
+        component = self._render(tree, "root", issues)
+        if issues and strict:
+            raise ComponentTreeError(issues)
+        if isinstance(component, tuple):
+            component = Div(*component)
+        return component
+
+
+tree_renderer = TreeRenderer()
+
+def _strip_fences(text: str):
+    text = text.strip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+        text = text.rsplit('```', 1)[0]
+    return text.strip()
+
+def tree_payload(content: str = None, arguments: str = None):
+    """The JSON tree text of a tree-mode answer: the tool call's arguments, JSON sent as
+    content instead, or a plain text reply wrapped in a paragraph"""
+    if arguments:
+        return arguments
+    text = _strip_fences(content or "")
+    if text.startswith(('{', '[')):
+        return text
+    return json.dumps({"root": {"type": "P", "children": [text]}})
+
+def render_tree_json(payload: str, spans: dict = None):
+    """HTML of a JSON component tree; `spans` (a dict) receives parse and render timings and the size"""
+    start = time.perf_counter()
+    try:
+        tree = json.loads(_strip_fences(payload))
+    except json.JSONDecodeError as e:
+        raise ComponentTreeError([f"invalid JSON: {e}"])
+    parsed = time.perf_counter()
+    html = to_html(tree_renderer.render(tree))
+    if spans is not None:
+        spans.update(parse=parsed - start, render=time.perf_counter() - parsed, html_bytes=len(html.encode('utf-8')))
+    return html
+
+def render_partial_tree(payload: str):
+    """Best-effort render of a tree that is still being generated, None if nothing renders yet"""
+    prefix = closable_prefix(payload)
+    if not prefix:
+        return None
+    try:
+        return tree_renderer.render(json.loads(prefix), strict=False)
+    except Exception:
+        return None
@@ -1,195 +1,422 @@
+import re
+import ast
+import time
+import hashlib
+import threading
+from types import MappingProxyType
+from collections import OrderedDict
 from fasthtml.common import *
 from monsterui.all import *
+from validator import ComponentRegistry, ComponentValidationError, fix_and_validate
+from config import COMPILED_CACHE_SIZE, HTML_MINIFY, STATIC_FIXES_ENABLED
+
+# String literals (terminated, or cut off at a newline / the end of the text) and comments
+_LITERAL_PATTERN = (
+    r"(?P<s3>'''[^'\\]*(?:(?:\\[\s\S]|'(?!''))[^'\\]*)*(?P<e3s>'''|\Z))"
+    r'|(?P<d3>"""[^"\\]*(?:(?:\\[\s\S]|"(?!""))[^"\\]*)*(?P<e3d>"""|\Z))'
+    r"|(?P<s1>'[^'\\\n]*(?:\\[\s\S][^'\\\n]*)*(?P<e1s>'|(?=\n)|\Z))"
+    r'|(?P<d1>"[^"\\\n]*(?:\\[\s\S][^"\\\n]*)*(?P<e1d>"|(?=\n)|\Z))'
+    r'|(?P<comment>#[^\n]*)'
+)
+# String kind -> (quote, group holding its closing quote)
+_QUOTES = {'s3': ("'''", 'e3s'), 'd3': ('"""', 'e3d'), 's1': ("'", 'e1s'), 'd1': ('"', 'e1d')}
+_CLOSERS = {'(': ')', '[': ']', '{': '}'}
+_OPENERS = {')': '(', ']': '[', '}': '{'}
+
+# Common typos in component names
+TYPO_FIXES = {
+    'UKIcon': 'UkIcon',
+    'ukIcon': 'UkIcon',
+    'Ukicon': 'UkIcon',
+    'daisyUI': 'DaisyUI',
+    'DaisyUi': 'DaisyUI',
+}
+
+# Everything auto_repair_syntax acts on. Literals are matched first so nothing inside them is
+# touched; the lookahead lets the regex engine skip uninteresting characters quickly.
+_REPAIR_PATTERN = (
+    _LITERAL_PATTERN +
+    r'|(?P<open>[(\[{])|(?P<close>[)\]}])'
+    r'|(?P<tag></?[A-Za-z][^<>]*>)'
+    r'|(?P<comma>,(?=\S))'
+)
+_REPAIR_RE = re.compile(r'''(?=['"#()\[\]{}<,])(?:''' + _REPAIR_PATTERN + ')')
+# Slower variant that also fixes typos, only used when one of them occurs in the code
+_REPAIR_TYPO_RE = re.compile(_REPAIR_PATTERN + r'|(?P<typo>\b(?:' + '|'.join(TYPO_FIXES) + r')\b)')
+
+def _is_comparison(tag):
+    """Whether `<...>` text is really a chained comparison between operands (`a<b and c>d`)"""
+    try:
+        ast.parse(f"_{tag}_", mode='eval')
+    except SyntaxError:
+        return False
+    return True
 
 def auto_repair_syntax(code_text):
-    """Attempt to automatically repair common syntax errors in LLM-generated code."""
-
-    # Remove any stray HTML or XML-like content that sometimes appears
-    import re
-    code_text = re.sub(r'<[^>]+>', '', code_text)
-
-    # Fix unmatched parentheses - count and balance them
-    open_parens = code_text.count('(')
-    close_parens = code_text.count(')')
-
-    if open_parens > close_parens:
-        # Add missing closing parentheses
-        missing_close = open_parens - close_parens
-        code_text += ')' * missing_close
-    elif close_parens > open_parens:
-        # Remove extra closing parentheses from the end
-        extra_close = close_parens - open_parens
-        # Remove from the end first
-        while extra_close > 0 and code_text.endswith(')'):
-            code_text = code_text[:-1]
-            extra_close -= 1
-
-    # Fix unmatched square brackets
-    open_brackets = code_text.count('[')
-    close_brackets = code_text.count(']')
-
-    if open_brackets > close_brackets:
-        missing_close = open_brackets - close_brackets
-        code_text += ']' * missing_close
-    elif close_brackets > open_brackets:
-        extra_close = close_brackets - open_brackets
-        while extra_close > 0 and code_text.endswith(']'):
-            code_text = code_text[:-1]
-            extra_close -= 1
-
-    # Fix unmatched curly braces
-    open_braces = code_text.count('{')
-    close_braces = code_text.count('}')
-
-    if open_braces > close_braces:
-        missing_close = open_braces - close_braces
-        code_text += '}' * missing_close
-    elif close_braces > open_braces:
-        extra_close = close_braces - open_braces
-        while extra_close > 0 and code_text.endswith('}'):
-            code_text = code_text[:-1]
-            extra_close -= 1
-
-    # Fix missing spaces after commas in common patterns
-    code_text = re.sub(r',([^\s])', r', \1', code_text)
-
-    # Fix common typos in component names
-    typo_fixes = {
-        'UKIcon': 'UkIcon',
-        'ukIcon': 'UkIcon',
-        'Ukicon': 'UkIcon',
-        'daisyUI': 'DaisyUI',
-        'DaisyUi': 'DaisyUI',
-    }
-
-    for typo, fix in typo_fixes.items():
-        code_text = code_text.replace(typo, fix)
-
-    return code_text.strip()
-
-def parse_and_execute_component(code_text):
-    """Parse and execute the generated component code, trusting LLM output."""
+    """Attempt to automatically repair common syntax errors in LLM-generated code.
+
+    Works in a single pass and leaves string literals and comments alone. Brackets are tracked
+    on a stack, so missing ones are closed in nesting order and stray closers are dropped.
+    """
+    stack = []
+    parts = []
+    pos = 0
+    comment_end = -1
+    pattern = _REPAIR_TYPO_RE if any(typo in code_text for typo in TYPO_FIXES) else _REPAIR_RE
+    for m in pattern.finditer(code_text):
+        kind = m.lastgroup
+        if kind == 'open':
+            stack.append(m.group())
+            continue
+        if kind == 'close':
+            opener = _OPENERS[m.group()]
+            if stack and stack[-1] == opener:
+                stack.pop()
+                continue
+            if opener in stack:
+                # Close the brackets opened inside the one this closes first
+                missing = []
+                while stack[-1] != opener:
+                    missing.append(_CLOSERS[stack.pop()])
+                stack.pop()
+                replacement = ''.join(missing) + m.group()
+            else:
+                # Nothing to close, drop it
+                replacement = ''
+        elif kind == 'comment':
+            comment_end = m.end()
+            continue
+        elif kind in _QUOTES:
+            quote, end_group = _QUOTES[kind]
+            if m.end() < len(code_text) or m.group(end_group):
+                continue
+            # String cut off at the end of the output
+            replacement = m.group() + quote
+        elif kind == 'tag':
+            if _is_comparison(m.group()):
+                # Python comparisons (and tags indistinguishable from them, like <b>) are left alone
+                continue
+            # Remove any stray HTML or XML-like content that sometimes appears
+            replacement = ''
+        elif kind == 'comma':
+            # Fix missing spaces after commas
+            replacement = ', '
+        else:
+            replacement = TYPO_FIXES[m.group()]
+        parts.append(code_text[pos:m.start()])
+        parts.append(replacement)
+        pos = m.end()
+    parts.append(code_text[pos:])
+
+    if stack:
+        # Add missing closing brackets, on a new line if the code ends in a comment
+        if comment_end >= len(code_text.rstrip()):
+            parts.append('\n')
+        parts.append(''.join(_CLOSERS[bracket] for bracket in reversed(stack)))
+
+    return ''.join(parts).strip()
+
+def clean_component_code(code_text):
+    """Strip markdown fences and common LLM wrappers, then auto-repair the source"""
+    # Ensure code_text is a string
+    if not isinstance(code_text, str):
+        code_text = str(code_text)
+
+    # Clean up the code text
+    code_text = code_text.strip()
+
+    # Remove markdown code blocks if present
+    if code_text.startswith('```'):
+        lines = code_text.split('\n')
+        # Remove first and last lines (markdown markers)
+        if len(lines) > 2:
+            code_text = '\n'.join(lines[1:-1])
+        # Handle single-line code blocks
+        elif len(lines) == 2:
+            code_text = lines[1]
+        else:
+            code_text = code_text.replace('```', '')
+
+    # Remove any leading/trailing whitespace
+    code_text = code_text.strip()
+
+    # Handle common LLM patterns - function definition with separate return
+    lines = code_text.split('\n')
+    if len(lines) > 1 and lines[-1].strip().startswith('return ') and lines[-1].strip().endswith('()'):
+        # Extract function name from return statement
+        return_line = lines[-1].strip()
+        func_name = return_line.replace('return ', '').replace('()', '')
+        # Remove the return line and add function call inside the function or after
+        code_text = '\n'.join(lines[:-1])
+        # Add the function call as a separate statement
+        code_text += f'\n\nresult = {func_name}()'
+
+    # Auto-repair common syntax issues
+    return auto_repair_syntax(code_text)
+
+# Name the final expression of a multi-statement component is bound to
+_RESULT_NAME = '__component__'
+
+class CompiledComponent:
+    """Generated component source compiled to a single code object.
+
+    `mode` is 'eval' for a plain expression, 'expr' when the module ends in an expression
+    (bound to `__component__`), and 'scan' when the result has to be looked up in the
+    namespace after executing the module.
+    """
+
+    def __init__(self, code, mode, compile_time, repair_time=0.0, fixes=()):
+        self.code = code
+        self.mode = mode
+        self.compile_time = compile_time  # cleaning and repair included
+        self.repair_time = repair_time
+        self.fixes = fixes  # rules of validator.fix_and_validate applied to the code
+
+def compile_component(code_text):
+    """Clean, repair, parse and compile generated code (uncached)"""
+    start = time.perf_counter()
+    code_text = clean_component_code(code_text)
+    repair_time = time.perf_counter() - start
+
+    # Basic syntax validation
     try:
-        # Ensure code_text is a string
+        tree = ast.parse(code_text)
+    except SyntaxError as syntax_error:
+        print(f"Syntax error in generated code: {syntax_error}")
+        raise syntax_error
+
+    fixes = []
+    if STATIC_FIXES_ENABLED:
+        # Known mistakes are fixed here; anything else is reported before running the code
+        fixes, issues = fix_and_validate(tree, component_registry)
+        if fixes:
+            print(f"🩹 Fixed generated code locally: {', '.join(fixes)}")
+        if issues:
+            raise ComponentValidationError(issues)
+
+    statements = tree.body
+    if len(statements) == 1 and isinstance(statements[0], ast.Expr):
+        # A simple expression - evaluate it directly
+        code, mode = compile(ast.Expression(statements[0].value), '<component>', 'eval'), 'eval'
+    elif statements and isinstance(statements[-1], ast.Expr):
+        # Setup statements followed by the component expression: bind it to a known name
+        last = statements[-1]
+        statements[-1] = ast.copy_location(
+            ast.Assign(targets=[ast.Name(_RESULT_NAME, ast.Store())], value=last.value), last)
+        ast.fix_missing_locations(tree)
+        code, mode = compile(tree, '<component>', 'exec'), 'expr'
+    else:
+        code, mode = compile(tree, '<component>', 'exec'), 'scan'
+    return CompiledComponent(code, mode, time.perf_counter() - start, repair_time, fixes)
+
+class CompiledCodeCache:
+    """Bounded LRU of compiled components keyed by a hash of the raw generated source"""
+
+    def __init__(self, max_size=COMPILED_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compile(self, code_text, spans=None):
+        """Compiled component for `code_text`; `spans` (a dict) receives the cache result and stage timings,
+        or on a hit the compile time it saved"""
         if not isinstance(code_text, str):
             code_text = str(code_text)
+        key = hashlib.sha1(code_text.encode('utf-8')).hexdigest()
+        with self._lock:
+            compiled = self._entries.get(key)
+            if compiled is not None:
+                self._entries.move_to_end(key)
+                if spans is not None:
+                    spans.update(compile_cached=True, compile_saved=compiled.compile_time)
+                return compiled
+
+        compiled = compile_component(code_text)
+        if spans is not None:
+            spans.update(compile_cached=False, repair=compiled.repair_time,
+                         compile=compiled.compile_time - compiled.repair_time, fixes=list(compiled.fixes))
+        with self._lock:
+            self._entries[key] = compiled
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return compiled
+
+compiled_code_cache = CompiledCodeCache()
+
+_MISSING = object()
+
+def _result_from_namespace(local_namespace):
+    """Pick the component out of the names bound by code that did not end in an expression"""
+    # Look for a return value in the local namespace
+    # Check for functions that might have been defined
+    functions = {k: v for k, v in local_namespace.items() if callable(v)}
+    non_functions = {k: v for k, v in local_namespace.items() if not callable(v)}
+
+    if 'result' in local_namespace:
+        # Look for explicit result variable
+        result = local_namespace['result']
+    elif non_functions:
+        # If there are non-function variables, use the last one
+        result = list(non_functions.values())[-1]
+    elif len(local_namespace) == 1:
+        # If there's exactly one item, it's likely the result
+        result = list(local_namespace.values())[0]
+    else:
+        # Look for FastHTML components (objects with __ft__ attribute)
+        component_vars = [v for v in local_namespace.values() if hasattr(v, '__ft__') or hasattr(v, 'render')]
+        if component_vars:
+            result = component_vars[0]
+        else:
+            result = None
 
-        # Clean up the code text
-        code_text = code_text.strip()
-
-        # Remove markdown code blocks if present
-        if code_text.startswith('```'):
-            lines = code_text.split('\n')
-            # Remove first and last lines (markdown markers)
-            if len(lines) > 2:
-                code_text = '\n'.join(lines[1:-1])
-            # Handle single-line code blocks
-            elif len(lines) == 2:
-                code_text = lines[1]
-            else:
-                code_text = code_text.replace('```', '')
-
-        # Remove any leading/trailing whitespace
-        code_text = code_text.strip()
-
-        # Handle common LLM patterns - function definition with separate return
-        lines = code_text.split('\n')
-        if len(lines) > 1 and lines[-1].strip().startswith('return ') and lines[-1].strip().endswith('()'):
-            # Extract function name from return statement
-            return_line = lines[-1].strip()
-            func_name = return_line.replace('return ', '').replace('()', '')
-            # Remove the return line and add function call inside the function or after
-            code_text = '\n'.join(lines[:-1])
-            # Add the function call as a separate statement
-            code_text += f'\n\nresult = {func_name}()'
-
-        # Auto-repair common syntax issues
-        code_text = auto_repair_syntax(code_text)
-
-        # Basic syntax validation
-        import ast
-        try:
-            ast.parse(code_text)
-        except SyntaxError as syntax_error:
-            print(f"Syntax error in generated code: {syntax_error}")
-            raise syntax_error
+    if result is None:
+        return Div(
+            P("Code executed successfully but no component was returned", cls=TextPresets.muted_sm),
+            P(f"Found {len(functions)} functions and {len(non_functions)} other variables in namespace", cls="text-xs text-gray-500"),
+            cls="alert alert-info p-4 rounded-lg bg-info/10 border border-info/20"
+        )
+    return result
+
+def _build_base_namespace():
+    """Namespace with the FastHTML/MonsterUI exports generated code may use"""
+    namespace = {}
+    exec("from fasthtml.common import *\nfrom monsterui.all import *", namespace)
+    return namespace
+
+# Built once; generated code never sees this module's own helpers (e.g. the app Footer)
+_base_namespace = _build_base_namespace()
+BASE_NAMESPACE = MappingProxyType(_base_namespace)
+# Signatures of the exports, introspected once, for checking generated calls
+component_registry = ComponentRegistry(_base_namespace)
+
+def execution_namespace():
+    """Fresh per-execution namespace, a shallow copy of the base that is discarded afterwards"""
+    return _base_namespace.copy()
+
+def _run_compiled(compiled):
+    # Definitions made by the generated code live only in this namespace
+    namespace = execution_namespace()
+
+    if compiled.mode == 'eval':
+        return eval(compiled.code, namespace)
+
+    if compiled.mode == 'expr':
+        # Execute function definitions and other statements, then take the final expression
+        exec(compiled.code, namespace)
+        return namespace[_RESULT_NAME]
+
+    # Fallback: run the statements in the same namespace, so functions they define can call each
+    # other, and look for the component among the names they bound
+    exec(compiled.code, namespace)
+    defined = {name: value for name, value in namespace.items()
+               if name != '__builtins__' and _base_namespace.get(name, _MISSING) is not value}
+    return _result_from_namespace(defined)
+
+def parse_and_execute_component(code_text, spans=None):
+    """Parse and execute the generated component code, trusting LLM output.
+
+    When `spans` (a dict) is given it receives the repair, compile and exec timings.
+    """
+    try:
+        # Identical source (cache hits, replays, repeated fixes) skips cleaning, parsing and compiling
+        compiled = compiled_code_cache.get_or_compile(code_text, spans)
 
         print(f"Executing code")
 
-        # Determine if this is a simple expression or complex statement
+        start = time.perf_counter()
         try:
-            # Try to compile as an expression first
-            compile(code_text, '<string>', 'eval')
-            # If successful, it's a simple expression - use eval
-            result = eval(code_text, globals())
-            return result
-        except SyntaxError:
-            # If it fails, it's a complex statement - use exec
-            pass
-
-        # Try to parse and handle the final expression separately
-        import ast
-
-        try:
-            parsed = ast.parse(code_text)
-            statements = parsed.body
-
-            if statements and isinstance(statements[-1], ast.Expr):
-                # Last statement is an expression - this is likely our component
-                # Execute all but the last statement, then eval the last one
-                if len(statements) > 1:
-                    # Execute function definitions and other statements
-                    setup_code = ast.unparse(ast.Module(body=statements[:-1], type_ignores=[]))
-                    exec(setup_code, globals())
-
-                # Evaluate the final expression
-                final_expr = ast.unparse(statements[-1].value)
-                result = eval(final_expr, globals())
-                return result
-        except Exception as ast_error:
-            print(f"AST parsing failed: {ast_error}, falling back to standard exec")
-
-        # Fallback: Create a local namespace for execution
-        local_namespace = {}
-
-        # Execute the code directly with full access to imports
-        exec(code_text, globals(), local_namespace)
-
-        # Look for a return value in the local namespace
-        # Check for functions that might have been defined
-        functions = {k: v for k, v in local_namespace.items() if callable(v)}
-        non_functions = {k: v for k, v in local_namespace.items() if not callable(v)}
-
-        if 'result' in local_namespace:
-            # Look for explicit result variable
-            result = local_namespace['result']
-        elif non_functions:
-            # If there are non-function variables, use the last one
-            result = list(non_functions.values())[-1]
-        elif len(local_namespace) == 1:
-            # If there's exactly one item, it's likely the result
-            result = list(local_namespace.values())[0]
-        else:
-            # Look for FastHTML components (objects with __ft__ attribute)
-            component_vars = [v for v in local_namespace.values() if hasattr(v, '__ft__') or hasattr(v, 'render')]
-            if component_vars:
-                result = component_vars[0]
-            else:
-                result = None
-
-        if result is None:
-            return Div(
-                P("Code executed successfully but no component was returned", cls=TextPresets.muted_sm),
-                P(f"Found {len(functions)} functions and {len(non_functions)} other variables in namespace", cls="text-xs text-gray-500"),
-                cls="alert alert-info p-4 rounded-lg bg-info/10 border border-info/20"
-            )
-
-        return result
+            return _run_compiled(compiled)
+        finally:
+            if spans is not None:
+                spans["exec"] = time.perf_counter() - start
 
     except Exception as e:
         print(f"Error executing code: {e}")
         raise e
 
+def to_html(component):
+    """Render a component to HTML, without indentation unless HTML_MINIFY is off"""
+    return to_xml(component, indent=not HTML_MINIFY)
+
+def execute_to_html(code_text, spans=None):
+    """Execute generated code and render the component to HTML once; `spans` also gets render time and size"""
+    component = parse_and_execute_component(code_text, spans)
+    start = time.perf_counter()
+    html = to_html(component)
+    if spans is not None:
+        spans.update(render=time.perf_counter() - start, html_bytes=len(html.encode('utf-8')))
+    return html
+
+
+_PREFIX_RE = re.compile(r'''(?=['"#()\[\]{},])(?:''' + _LITERAL_PATTERN + r'|(?P<cut>[()\[\]{},]))')
+
+def closable_prefix(code_text):
+    """Longest prefix of partially generated code that can be closed into a complete expression.
+
+    Cuts after the last comma or closing bracket outside string literals and appends the
+    brackets still open at that point. Returns None while no such prefix exists yet.
+    """
+    text = code_text.lstrip()
+    if text.startswith('```'):
+        newline = text.find('\n')
+        if newline == -1:
+            return None
+        text = text[newline + 1:]
+    fence = text.find('```')
+    if fence != -1:
+        text = text[:fence]
+
+    stack = []
+    cut, cut_closers = -1, ''
+    for m in _PREFIX_RE.finditer(text):
+        kind = m.lastgroup
+        if kind == 'comment':
+            continue
+        if kind in _QUOTES:
+            if not m.group(_QUOTES[kind][1]):
+                # Stop at a string that is still being generated
+                break
+            continue
+        ch = m.group()
+        if ch in _CLOSERS:
+            stack.append(_CLOSERS[ch])
+        elif ch == ',':
+            if stack:
+                cut, cut_closers = m.start(), ''.join(reversed(stack))
+        elif stack and stack[-1] == ch:
+            stack.pop()
+            cut, cut_closers = m.end(), ''.join(reversed(stack))
+        else:
+            # Mismatched bracket, nothing after it can be closed
+            break
+
+    if cut == -1:
+        return None
+    return text[:cut].rstrip().rstrip(',') + cut_closers
+
+def render_partial_component(code_text):
+    """Best-effort evaluation of a partially generated component, None if nothing renders yet.
+
+    Statements before the component expression (data, helper functions) are executed first,
+    so the prefix renders once the final expression has started.
+    """
+    prefix = closable_prefix(code_text)
+    if not prefix:
+        return None
+    try:
+        tree = ast.parse(prefix, '<stream>', 'exec')
+        if not tree.body or not isinstance(tree.body[-1], ast.Expr):
+            return None
+        if STATIC_FIXES_ENABLED:
+            fix_and_validate(tree, component_registry, validate=False)
+        namespace = execution_namespace()
+        *setup, last = tree.body
+        if setup:
+            exec(compile(ast.Module(setup, type_ignores=[]), '<stream>', 'exec'), namespace)
+        return eval(compile(ast.Expression(last.value), '<stream>', 'eval'), namespace)
+    except Exception:
+        return None
+
 
 # Loading message component (shows while generating)
 def LoadingMessage():
@@ -209,28 +436,62 @@ def ChatMessage(msg, user, **kwargs):
     chat_class = "chat-end" if user else 'chat-start'
     return Div(cls=f"chat {chat_class}", **kwargs)(
                Div('user' if user else 'assistant', cls="chat-header"),
-               Div(msg, cls=f"chat-bubble {bubble_class}"),
-               Hidden(msg, name="messages")
+               Div(msg, cls=f"chat-bubble {bubble_class}")
            )
 
 # Component message (renders generated UI components)
-def ComponentMessage(component, context_msg="Generated interactive component", generation_info=None, **kwargs):
+def ComponentMessage(component, generation_info=None, component_id=None, **kwargs):
+    # The id lets later edits of the component swap in just what changed
     content = [
-        Div(component, cls="bg-base-100 rounded-lg border p-4 interactive-component")
+        Div(component, cls="bg-base-100 rounded-lg border p-4 interactive-component", id=component_id)
     ]
 
     # Add generation information if provided
     if generation_info:
-        info_display = Div(cls="mt-2 text-xs text-gray-500 flex gap-4")(
+        info = [
             Span(f"Generated in {generation_info['total_time']:.2f}s"),
             Span(f"{generation_info['tokens']} tokens")
-        )
-        content.append(info_display)
+        ]
+        if generation_info.get('cached'):
+            info.append(Span("⚡ cached"))
+        content.append(Div(cls="mt-2 text-xs text-gray-500 flex gap-4")(*info))
 
     return Div(cls="chat chat-start", **kwargs)(
         Div('assistant', cls="chat-header"),
-        Div(cls="chat-bubble chat-bubble-secondary p-1")(*content),
-        Hidden(context_msg, name="messages")
+        Div(cls="chat-bubble chat-bubble-secondary p-1")(*content)
+    )
+
+def ComponentUpdate(component, component_id):
+    """Out-of-band swap replacing the content of an earlier component message"""
+    return Div(component, id=component_id, hx_swap_oob="innerHTML")
+
+def CollapsedComponent(session_id, component_id):
+    """Out-of-band swap replacing an earlier component by a placeholder, which loads the
+    component again when it scrolls into view"""
+    return Div(id=component_id, hx_swap_oob="innerHTML")(
+        Div(cls="h-32 flex items-center justify-center text-sm text-gray-400",
+            hx_get=f"/components/{session_id}/{component_id}", hx_trigger="intersect once",
+            hx_target=f"#{component_id}", hx_swap="innerHTML")("Loading earlier component...")
+    )
+
+# Placeholder that connects to the SSE stream of a generation; every event
+# replaces its content, starting with the loading message
+def StreamingMessage(stream_url):
+    return Div(hx_ext="sse", sse_connect=stream_url, sse_swap="message", sse_close="done")(
+        LoadingMessage()
+    )
+
+# Partially generated component, shown while tokens are still arriving
+def PartialComponentMessage(component):
+    return Div(cls="chat chat-start")(
+        Div('assistant', cls="chat-header"),
+        Div(cls="chat-bubble chat-bubble-secondary p-1")(
+            Div(component, cls="bg-base-100 rounded-lg border p-4"),
+            Div(cls="mt-2 flex items-center gap-2 text-xs text-gray-500")(
+                Loading((LoadingT.dots, LoadingT.xs)),
+                Span("Still generating...")
+            )
+        )
     )
 
 # The input field for the user message. Also used to clear the
@@ -243,6 +504,12 @@ def ChatInput():
                 hx_swap_oob='true',
                 autocomplete="off")
 
+# The conversation id posted with every message. The page renders it empty so
+# the shell is the same for everyone (and can be revalidated by ETag); the first
+# response fills it in via an OOB swap
+def SessionField(session_id: str = ""):
+    return Hidden(session_id, name="session_id", id="session-id", hx_swap_oob='true')
+
 # Footer component
 def Footer():
     return Div(cls="footer footer-center p-4 bg-base-200 text-base-content border-t")(
@@ -5,7 +5,168 @@ load_dotenv()
 
 # OpenRouter configuration
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
-MODEL_NAME = "qwen/qwen3-235b-a22b-2507"
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+MODEL_NAME = os.getenv("MODEL_NAME", "qwen/qwen3-235b-a22b-2507")
 #MODEL_NAME = "google/gemini-2.5-flash-lite"
-#MODEL_NAME = "openai/gpt-4.1"
\ No newline at end of file
+#MODEL_NAME = "openai/gpt-4.1"
+
+# Model routing. Generations go to MODEL_NAME; when it has not answered (first
+# token when streaming) within the p95 of its recent latency, clamped to
+# HEDGE_MIN_DELAY..HEDGE_MAX_DELAY seconds (HEDGE_DEFAULT_DELAY until
+# ROUTER_MIN_SAMPLES calls were seen), a duplicate request goes to the fastest
+# of FALLBACK_MODELS and the first answer wins. Models failing more than
+# ROUTER_MAX_FAILURE_RATE of their calls in the last ROUTER_WINDOW_SECONDS are
+# skipped. With FAST_MODEL set, short first messages that ask for nothing
+# elaborate (up to SIMPLE_REQUEST_MAX_CHARS characters) go to that model.
+FALLBACK_MODELS = [m.strip() for m in os.getenv("FALLBACK_MODELS", "google/gemini-2.5-flash-lite").split(",") if m.strip()]
+FAST_MODEL = os.getenv("FAST_MODEL", "")
+SIMPLE_REQUEST_MAX_CHARS = int(os.getenv("SIMPLE_REQUEST_MAX_CHARS", "120"))
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "4"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.5"))
+HEDGE_MAX_DELAY = float(os.getenv("HEDGE_MAX_DELAY", "20"))
+ROUTER_WINDOW_SECONDS = float(os.getenv("ROUTER_WINDOW_SECONDS", "300"))
+ROUTER_MAX_SAMPLES = int(os.getenv("ROUTER_MAX_SAMPLES", "200"))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "10"))
+ROUTER_MAX_FAILURE_RATE = float(os.getenv("ROUTER_MAX_FAILURE_RATE", "0.5"))
+
+# Prompt context files are re-checked for changes at most this often (seconds)
+PROMPT_RELOAD_CHECK_SECONDS = float(os.getenv("PROMPT_RELOAD_CHECK_SECONDS", "2"))
+# HTTP connection pool shared by all OpenRouter requests
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_REQUEST_TIMEOUT = float(os.getenv("HTTP_REQUEST_TIMEOUT", "120"))
+
+# Generations allowed in flight per process, and how long a request may wait
+# for a free slot (seconds) before it gets a "busy" reply
+MAX_CONCURRENT_GENERATIONS = int(os.getenv("MAX_CONCURRENT_GENERATIONS", "200"))
+GENERATION_QUEUE_TIMEOUT = float(os.getenv("GENERATION_QUEUE_TIMEOUT", "2"))
+
+# Token buckets charged with the tokens LLM calls actually use: one per session
+# and one per process (a rate of 0 disables a bucket). A session whose budget
+# does not refill within GENERATION_QUEUE_TIMEOUT is asked to slow down. Waiting
+# requests go first messages first, then follow-ups, then resent messages.
+# TOKEN_PRICES ("model=prompt/completion,..." in USD per million tokens, "*" for
+# any other model) is used to account what each session costs.
+SESSION_TOKENS_PER_MINUTE = int(os.getenv("SESSION_TOKENS_PER_MINUTE", "30000"))
+SESSION_TOKEN_BURST = int(os.getenv("SESSION_TOKEN_BURST", "60000"))
+GLOBAL_TOKENS_PER_MINUTE = int(os.getenv("GLOBAL_TOKENS_PER_MINUTE", "0"))
+GLOBAL_TOKEN_BURST = int(os.getenv("GLOBAL_TOKEN_BURST", "500000"))
+TOKEN_PRICES = {model.strip(): tuple(float(p) for p in price.split("/"))
+                for model, _, price in (entry.partition("=") for entry in os.getenv("TOKEN_PRICES", "").split(",") if entry.strip())}
+
+# Stream tokens to the browser over SSE and render the component progressively
+STREAMING_ENABLED = os.getenv("STREAMING_ENABLED", "true").lower() in ("1", "true", "yes")
+# Minimum time between two progressive renders (seconds)
+STREAM_RENDER_INTERVAL = float(os.getenv("STREAM_RENDER_INTERVAL", "0.3"))
+
+# What the model generates: "code" (FastHTML/MonsterUI Python, executed in the
+# sandbox) or "tree" (a JSON component tree returned through a tool call and
+# rendered natively, without executing generated code)
+OUTPUT_MODE = os.getenv("OUTPUT_MODE", "code").lower()
+
+# Cache of successfully executed component code, keyed on the normalized
+# conversation and prompt version (not the model, whichever answered). Set
+# RESPONSE_CACHE_DB to a file path to keep entries across restarts.
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB", "")
+
+# Compiled generated-component code objects kept in memory
+COMPILED_CACHE_SIZE = int(os.getenv("COMPILED_CACHE_SIZE", "256"))
+
+# Chart options over LAZY_CHART_MIN_BYTES are taken out of the component HTML and
+# loaded from /charts/<hash> when the chart scrolls into view. The most recent
+# CHART_CACHE_BYTES of them stay in memory; set CHART_CACHE_DB to a file path to
+# keep them (for CHART_CACHE_TTL seconds) in SQLite, where every worker finds them.
+LAZY_CHARTS_ENABLED = os.getenv("LAZY_CHARTS_ENABLED", "true").lower() in ("1", "true", "yes")
+LAZY_CHART_MIN_BYTES = int(os.getenv("LAZY_CHART_MIN_BYTES", "2048"))
+CHART_CACHE_BYTES = int(os.getenv("CHART_CACHE_BYTES", str(64 * 1024 * 1024)))
+CHART_CACHE_TTL = float(os.getenv("CHART_CACHE_TTL", "86400"))
+CHART_CACHE_DB = os.getenv("CHART_CACHE_DB", "")
+
+# Known mistakes in generated code (Badge, ApexChart without opts, repeated keywords)
+# are rewritten before it runs, and calls are checked against the real signatures, so
+# only what no rule fixes goes back to the LLM.
+STATIC_FIXES_ENABLED = os.getenv("STATIC_FIXES_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Generated components run in a pool of worker processes with a wall-clock
+# timeout (seconds) and an address-space limit (MB). Workers are replaced after
+# SANDBOX_MAX_TASKS components, or as soon as they time out or crash.
+SANDBOX_ENABLED = os.getenv("SANDBOX_ENABLED", "true").lower() in ("1", "true", "yes")
+SANDBOX_WORKERS = int(os.getenv("SANDBOX_WORKERS", str(os.cpu_count() or 2)))
+SANDBOX_TIMEOUT = float(os.getenv("SANDBOX_TIMEOUT", "5"))
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "1024"))
+SANDBOX_MAX_TASKS = int(os.getenv("SANDBOX_MAX_TASKS", "500"))
+
+# Number of fix requests fired concurrently when generated code fails; the
+# first candidate that renders wins. Candidates cycle through the models and
+# temperatures below (1 restores one-at-a-time retries). One round of
+# candidates is all a failure gets, unless FIX_ROUNDS allows more (each extra
+# round is another serial round trip to the LLM).
+SPECULATIVE_FIXES = int(os.getenv("SPECULATIVE_FIXES", "3"))
+FIX_ROUNDS = max(1, int(os.getenv("FIX_ROUNDS", "1")))
+FIX_MODELS = [m.strip() for m in os.getenv("FIX_MODELS", "").split(",") if m.strip()] or [MODEL_NAME]
+FIX_TEMPERATURES = [float(t) for t in os.getenv("FIX_TEMPERATURES", "0.2,0.7,1.0").split(",")]
+
+# Chat history lives on the server, keyed on the session id posted by the form.
+# The most recently active sessions stay in memory; set CONVERSATION_DB to a file
+# path to keep every conversation in SQLite. The history sent to the model is
+# trimmed to HISTORY_TOKEN_BUDGET (estimated at CHARS_PER_TOKEN characters per token).
+# CONVERSATION_DB_SHARED makes every access read the database, for several
+# processes (server.py workers) sharing it.
+CONVERSATION_STORE_SIZE = int(os.getenv("CONVERSATION_STORE_SIZE", "1000"))
+CONVERSATION_MAX_MESSAGES = int(os.getenv("CONVERSATION_MAX_MESSAGES", "200"))
+CONVERSATION_DB = os.getenv("CONVERSATION_DB", "")
+CONVERSATION_DB_SHARED = os.getenv("CONVERSATION_DB_SHARED", "false").lower() in ("1", "true", "yes")
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "4000"))
+CHARS_PER_TOKEN = int(os.getenv("CHARS_PER_TOKEN", "4"))
+
+# Only the last CHAT_ACTIVE_COMPONENTS components of a chat stay live in the page
+# (0 keeps all of them). Older ones are collapsed into placeholders that bring
+# back a snapshot of the component when scrolled to. The most recent
+# COMPONENT_SNAPSHOT_BYTES of snapshots are kept in memory, all of them in
+# CONVERSATION_DB when it is set.
+CHAT_ACTIVE_COMPONENTS = int(os.getenv("CHAT_ACTIVE_COMPONENTS", "6"))
+COMPONENT_SNAPSHOT_BYTES = int(os.getenv("COMPONENT_SNAPSHOT_BYTES", str(256 * 1024 * 1024)))
+
+# Follow-ups to a component ask the model for SEARCH/REPLACE edits of its source
+# instead of a new component, and only the elements that changed are swapped into
+# the page (the whole component when more than EDIT_MAX_SWAPS did).
+EDITS_ENABLED = os.getenv("EDITS_ENABLED", "true").lower() in ("1", "true", "yes")
+EDIT_MAX_SWAPS = int(os.getenv("EDIT_MAX_SWAPS", "8"))
+
+# Reference files indexed at startup; only the sections most relevant to the
+# request (up to RETRIEVAL_TOP_K, within RETRIEVAL_TOKEN_BUDGET tokens) go into
+# the prompt. Set RETRIEVAL_ENABLED=false to inline the whole components reference.
+RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "true").lower() in ("1", "true", "yes")
+RETRIEVAL_FILES = [f.strip() for f in os.getenv("RETRIEVAL_FILES", "llms-ctx-components.txt,llms-ctx-monster-ui.txt,llms-ctx-fast-html.txt").split(",") if f.strip()]
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "1500"))
+RETRIEVAL_CHUNK_CHARS = int(os.getenv("RETRIEVAL_CHUNK_CHARS", "1600"))
+
+# HTML responses and streamed components are rendered without indentation, and
+# responses are compressed with the best encoding the client accepts: zstd and
+# br when the optional zstandard (or Python 3.14+) and brotli packages are
+# installed, gzip otherwise. Bodies under COMPRESSION_MIN_BYTES are sent as is.
+HTML_MINIFY = os.getenv("HTML_MINIFY", "true").lower() in ("1", "true", "yes")
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "512"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "3"))
+
+# Production server (server.py): WEB_WORKERS processes forked from one parent
+# that has already imported the app. A worker is recycled after serving
+# WORKER_MAX_REQUESTS requests plus a random share of WORKER_MAX_REQUESTS_JITTER
+# (0 disables recycling) and gets WORKER_GRACEFUL_TIMEOUT seconds to finish
+# open requests when it stops.
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "5001"))
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", str(os.cpu_count() or 2)))
+WORKER_MAX_REQUESTS = int(os.getenv("WORKER_MAX_REQUESTS", "10000"))
+WORKER_MAX_REQUESTS_JITTER = int(os.getenv("WORKER_MAX_REQUESTS_JITTER", "1000"))
+WORKER_GRACEFUL_TIMEOUT = float(os.getenv("WORKER_GRACEFUL_TIMEOUT", "30"))
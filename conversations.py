@@ -0,0 +1,248 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from config import (CONVERSATION_STORE_SIZE, CONVERSATION_MAX_MESSAGES, CONVERSATION_DB, CONVERSATION_DB_SHARED,
+                    HISTORY_TOKEN_BUDGET, CHARS_PER_TOKEN, COMPONENT_SNAPSHOT_BYTES)
+
+def estimate_tokens(text: str):
+    """Rough token count, good enough for budgeting the history"""
+    return len(text) // CHARS_PER_TOKEN + 4  # per-message overhead of the chat format
+
+def trim_to_budget(history: list[dict], budget: int = HISTORY_TOKEN_BUDGET):
+    """Newest messages of `history` that fit in `budget` tokens; the last message is always kept"""
+    kept, used = [], 0
+    for message in reversed(history):
+        used += estimate_tokens(message["content"])
+        if kept and used > budget:
+            break
+        kept.append(message)
+    kept.reverse()
+    return kept
+
+class ConversationStore:
+    """Server-side chat history keyed on a session id.
+
+    Keeps the most recently used sessions in memory (bounded LRU) and, when a database
+    path is given, every message in SQLite so sessions survive eviction and restarts.
+    A `shared` database may be written by other processes, so it is read on every access.
+
+    Each rendered component is kept too, by the id of its element in the page: its source
+    to edit the last one, and its HTML to show a collapsed one again. The most recent
+    snapshots (up to `snapshot_bytes`) stay in memory.
+
+    The methods are coroutines: memory is used on the event loop, the database in a thread,
+    so a busy or locked database holds up one request rather than the whole process.
+    """
+
+    def __init__(self, max_sessions: int = CONVERSATION_STORE_SIZE, max_messages: int = CONVERSATION_MAX_MESSAGES,
+                 db_path: str = CONVERSATION_DB, shared: bool = CONVERSATION_DB_SHARED,
+                 snapshot_bytes: int = COMPONENT_SNAPSHOT_BYTES):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.db_path = db_path
+        self.shared = shared and bool(db_path)
+        self._sessions = OrderedDict()  # session id -> [{"role": ..., "content": ...}]
+        self.snapshot_bytes = snapshot_bytes
+        self._components = OrderedDict()  # session id -> [component id, ...], oldest first
+        self._snapshots = OrderedDict()   # (session id, component id) -> {"id": ..., "source": ..., "html": ...}
+        self._snapshot_size = 0
+        self._restored = {}  # session id -> ids of components restored since the last turn
+        self._lock = threading.Lock()     # the in-memory structures, never held while the database is used
+        self._db_lock = threading.Lock()  # the connection, only taken in threads
+        self._db = None
+        if db_path:
+            self._connect()
+            self._db.execute("CREATE TABLE IF NOT EXISTS messages (session_id TEXT NOT NULL, role TEXT NOT NULL, "
+                             "content TEXT NOT NULL, created_at REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS session_components (session_id TEXT NOT NULL, component_id TEXT NOT NULL, "
+                             "source TEXT NOT NULL, html TEXT NOT NULL, restored INTEGER NOT NULL, updated_at REAL NOT NULL, "
+                             "PRIMARY KEY (session_id, component_id))")
+            self._db.commit()
+            # SQLite connections must not cross a fork, forked server workers open their own
+            os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self):
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+
+    def _run(self, sql: str, params: tuple = (), fetch: bool = False):
+        """Execute a statement (in a thread): its rows when `fetch`, otherwise committed"""
+        with self._db_lock:
+            cursor = self._db.execute(sql, params)
+            if fetch:
+                return cursor.fetchall()
+            self._db.commit()
+
+    async def _query(self, sql: str, params: tuple = ()):
+        return await asyncio.to_thread(self._run, sql, params, True)
+
+    async def _execute(self, sql: str, params: tuple = ()):
+        await asyncio.to_thread(self._run, sql, params)
+
+    def _cache_session(self, session_id: str, messages: list):
+        """Keep a session's messages in memory (lock held)"""
+        self._sessions[session_id] = messages
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    async def _messages(self, session_id: str):
+        """Messages of a session, from memory or the database"""
+        with self._lock:
+            messages = self._sessions.get(session_id)
+            if messages is not None and not self.shared:
+                self._sessions.move_to_end(session_id)
+                return messages
+        messages = []
+        if self._db is not None:
+            rows = await self._query("SELECT role, content FROM messages WHERE session_id = ? ORDER BY rowid DESC LIMIT ?",
+                                     (session_id, self.max_messages))
+            messages = [{"role": role, "content": content} for role, content in reversed(rows)]
+        with self._lock:
+            self._cache_session(session_id, messages)
+        return messages
+
+    async def append(self, session_id: str, role: str, content: str):
+        with self._lock:
+            messages = self._sessions.get(session_id)
+            if messages is None and self._db is None:
+                messages = []
+                self._cache_session(session_id, messages)
+            # A session that is not in memory is read from the database when it is next used
+            if messages is not None:
+                messages.append({"role": role, "content": content})
+                del messages[:-self.max_messages]
+        if self._db is not None:
+            await self._execute("INSERT INTO messages (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                                (session_id, role, content, time.time()))
+
+    async def history(self, session_id: str, budget: int = HISTORY_TOKEN_BUDGET):
+        """The conversation trimmed to the newest messages that fit in `budget` tokens"""
+        messages = await self._messages(session_id)
+        with self._lock:
+            messages = list(messages)
+        return trim_to_budget(messages, budget)
+
+    async def _component_ids(self, session_id: str):
+        """Ids of a session's components, oldest first"""
+        with self._lock:
+            ids = self._components.get(session_id)
+            if ids is not None and not self.shared:
+                self._components.move_to_end(session_id)
+                return ids
+        ids = []
+        if self._db is not None:
+            rows = await self._query("SELECT component_id FROM session_components WHERE session_id = ? ORDER BY rowid",
+                                     (session_id,))
+            ids = [row[0] for row in rows]
+        with self._lock:
+            self._cache_component_ids(session_id, ids)
+        return ids
+
+    def _cache_component_ids(self, session_id: str, ids: list):
+        """(lock held)"""
+        self._components[session_id] = ids
+        self._components.move_to_end(session_id)
+        while len(self._components) > self.max_sessions:
+            self._components.popitem(last=False)
+
+    def _remember_snapshot(self, key: tuple, snapshot: dict):
+        """(lock held)"""
+        previous = self._snapshots.pop(key, None)
+        if previous is not None:
+            self._snapshot_size -= len(previous["source"]) + len(previous["html"])
+        self._snapshots[key] = snapshot
+        self._snapshot_size += len(snapshot["source"]) + len(snapshot["html"])
+        while self._snapshot_size > self.snapshot_bytes and len(self._snapshots) > 1:
+            _, evicted = self._snapshots.popitem(last=False)
+            self._snapshot_size -= len(evicted["source"]) + len(evicted["html"])
+
+    async def _snapshot(self, session_id: str, component_id: str):
+        """{"id", "source", "html"} of a component, from memory or the database"""
+        key = (session_id, component_id)
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None and not self.shared:
+                self._snapshots.move_to_end(key)
+                return snapshot
+        if self._db is None:
+            return snapshot
+        rows = await self._query("SELECT source, html FROM session_components WHERE session_id = ? AND component_id = ?", key)
+        if not rows:
+            return None
+        snapshot = {"id": component_id, "source": rows[0][0], "html": rows[0][1]}
+        with self._lock:
+            self._remember_snapshot(key, snapshot)
+        return snapshot
+
+    async def set_component(self, session_id: str, component_id: str, source: str, html: str):
+        """Record a component of a session (its id in the page, source and HTML), or the new version of one"""
+        with self._lock:
+            ids = self._components.get(session_id)
+            if ids is None and self._db is None:
+                ids = []
+                self._cache_component_ids(session_id, ids)
+            if ids is not None and component_id not in ids:
+                ids.append(component_id)
+            self._remember_snapshot((session_id, component_id), {"id": component_id, "source": source, "html": html})
+        if self._db is not None:
+            await self._execute("INSERT INTO session_components (session_id, component_id, source, html, restored, updated_at) "
+                                "VALUES (?, ?, ?, ?, 0, ?) ON CONFLICT (session_id, component_id) "
+                                "DO UPDATE SET source = excluded.source, html = excluded.html, updated_at = excluded.updated_at",
+                                (session_id, component_id, source, html, time.time()))
+
+    async def last_component(self, session_id: str):
+        """The session's last component as {"id", "source", "html"}, None if it has none"""
+        ids = await self._component_ids(session_id)
+        return await self._snapshot(session_id, ids[-1]) if ids else None
+
+    async def component_ids(self, session_id: str):
+        """Ids of the session's components, oldest first"""
+        ids = await self._component_ids(session_id)
+        with self._lock:
+            return list(ids)
+
+    async def restore_component(self, session_id: str, component_id: str):
+        """HTML of a component to show again, None if it is no longer kept.
+        It counts as restored until the next `take_restored`."""
+        snapshot = await self._snapshot(session_id, component_id)
+        if snapshot is None:
+            return None
+        if self.shared:
+            await self._execute("UPDATE session_components SET restored = 1 WHERE session_id = ? AND component_id = ?",
+                                (session_id, component_id))
+        else:
+            with self._lock:
+                self._restored.setdefault(session_id, set()).add(component_id)
+        return snapshot["html"]
+
+    async def take_restored(self, session_id: str):
+        """Ids of the session's components restored since the last call"""
+        if not self.shared:
+            with self._lock:
+                return self._restored.pop(session_id, set())
+        rows = await self._query("SELECT component_id FROM session_components WHERE session_id = ? AND restored = 1",
+                                 (session_id,))
+        if rows:
+            await self._execute("UPDATE session_components SET restored = 0 WHERE session_id = ? AND restored = 1", (session_id,))
+        return {row[0] for row in rows}
+
+    async def clear(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._restored.pop(session_id, None)
+            for component_id in self._components.pop(session_id, None) or []:
+                snapshot = self._snapshots.pop((session_id, component_id), None)
+                if snapshot is not None:
+                    self._snapshot_size -= len(snapshot["source"]) + len(snapshot["html"])
+        if self._db is not None:
+            await self._execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            await self._execute("DELETE FROM session_components WHERE session_id = ?", (session_id,))
+
+
+conversation_store = ConversationStore()
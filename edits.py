@@ -0,0 +1,133 @@
+"""Incremental edits of the last component in a conversation.
+
+The model answers a follow-up with SEARCH/REPLACE blocks against the previous source
+instead of regenerating it. The patched component is rendered as usual, and only the
+elements that changed are sent to the browser as htmx out-of-band swaps, addressed by
+their position under the component's stable id.
+"""
+import re
+from html.parser import HTMLParser
+
+_PATCH_RE = re.compile(r'^<{5,9} ?SEARCH[^\n]*\n(.*?)\n?^={5,9}[^\n]*\n(.*?)\n?^>{5,9} ?REPLACE[^\n]*$', re.S | re.M)
+# HTML elements without an end tag
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+# Elements that cannot be swapped on their own; a change replaces their parent
+_PARENT_SWAPPED = {'script', 'style'}
+
+class PatchError(ValueError):
+    """A SEARCH block that does not occur in the source"""
+
+def parse_patch(text: str):
+    """(search, replace) pairs of the SEARCH/REPLACE blocks in `text`, [] if it has none"""
+    return [(search, replace) for search, replace in _PATCH_RE.findall(text or "") if search.strip()]
+
+def _loose_pattern(search: str):
+    """Regex matching `search` with any amount of whitespace where it has some"""
+    return re.compile(r'\s+'.join(re.escape(part) for part in search.split()))
+
+def apply_patch(source: str, blocks: list[tuple[str, str]]):
+    """`source` with each block's first SEARCH occurrence replaced, raising PatchError when one is missing"""
+    for search, replace in blocks:
+        if search in source:
+            source = source.replace(search, replace, 1)
+            continue
+        # Models often get indentation or line breaks slightly wrong
+        match = _loose_pattern(search).search(source)
+        if match is None:
+            raise PatchError(f"SEARCH block not found in the component:\n{search}")
+        source = source[:match.start()] + replace + source[match.end():]
+    return source
+
+class _Element:
+    __slots__ = ('tag', 'start', 'content_start', 'content_end', 'end', 'children')
+
+    def __init__(self, tag: str, start: int, content_start: int):
+        self.tag = tag
+        self.start = start
+        self.content_start = content_start
+        self.content_end = self.end = content_start
+        self.children = []
+
+class _TreeParser(HTMLParser):
+    """Element tree of an HTML fragment, as offsets into the text"""
+
+    def __init__(self, html: str):
+        super().__init__(convert_charrefs=False)
+        self.html = html
+        self._line_starts = [0] + [m.end() for m in re.finditer('\n', html)]
+        self.root = _Element('', 0, 0)
+        self._stack = [self.root]
+        self.feed(html)
+        self.close()
+        for element in reversed(self._stack[1:]):
+            element.content_end = element.end = len(html)
+        self.root.content_end = self.root.end = len(html)
+
+    def _offset(self):
+        line, column = self.getpos()
+        return self._line_starts[line - 1] + column
+
+    def handle_starttag(self, tag, attrs):
+        start = self._offset()
+        element = _Element(tag, start, start + len(self.get_starttag_text()))
+        self._stack[-1].children.append(element)
+        if tag not in VOID_TAGS:
+            self._stack.append(element)
+
+    def handle_startendtag(self, tag, attrs):
+        start = self._offset()
+        self._stack[-1].children.append(_Element(tag, start, start + len(self.get_starttag_text())))
+
+    def handle_endtag(self, tag):
+        if not any(element.tag == tag for element in self._stack[1:]):
+            return
+        start = self._offset()
+        end = self.html.find('>', start) + 1
+        while self._stack[-1].tag != tag:
+            element = self._stack.pop()
+            element.content_end = element.end = start
+        element = self._stack.pop()
+        element.content_end, element.end = start, end
+
+def _gaps(element: _Element, html: str):
+    """The start tag and the text around the children: everything that is not a child element"""
+    edges = [element.content_start, *(o for child in element.children for o in (child.start, child.end)), element.content_end]
+    return [html[element.start:element.content_start]] + [html[edges[i]:edges[i + 1]] for i in range(0, len(edges), 2)]
+
+def _diff(old: _Element, new: _Element, old_html: str, new_html: str):
+    """Outermost changed elements of `new` as (element, path of child indices), None if `new` must be replaced whole"""
+    if old_html[old.start:old.end] == new_html[new.start:new.end]:
+        return []
+    # Custom elements (uk-chart, uk-icon) render their own content, so they are only replaced as a whole
+    if (old.tag != new.tag or '-' in new.tag or len(old.children) != len(new.children)
+            or _gaps(old, old_html) != _gaps(new, new_html)):
+        return None
+    changes = []
+    for index, (old_child, new_child) in enumerate(zip(old.children, new.children)):
+        child_changes = _diff(old_child, new_child, old_html, new_html)
+        if child_changes is None:
+            if new_child.tag in _PARENT_SWAPPED:
+                return None
+            changes.append((new_child, (index,)))
+        else:
+            changes.extend((element, (index, *path)) for element, path in child_changes)
+    return changes
+
+def html_swaps(old_html: str, new_html: str, container_id: str, limit: int = 8):
+    """Out-of-band swaps turning the rendered `old_html` inside #container_id into `new_html`.
+
+    Each changed element replaces the element at the same position (an nth-child path
+    from the container). None when elements were added or removed at the top level, or
+    more than `limit` elements changed, in which case the whole component should be swapped.
+    """
+    old_root, new_root = _TreeParser(old_html).root, _TreeParser(new_html).root
+    changes = _diff(old_root, new_root, old_html, new_html)
+    if changes is None or len(changes) > limit:
+        return None
+    swaps = []
+    for element, path in changes:
+        selector = f"#{container_id} " + " ".join(f"> :nth-child({index + 1})" for index in path)
+        tag_end = element.start + 1 + len(element.tag)
+        swaps.append(f'{new_html[element.start:tag_end]} hx-swap-oob="outerHTML:{selector}"'
+                     f'{new_html[tag_end:element.end]}')
+    return swaps
@@ -1,336 +1,598 @@
-import os
+import math
+import time
+import uuid
+import asyncio
 import datetime
-from client import create_openai_client, get_completion
-from components import ChatMessage, ComponentMessage, ChatInput, parse_and_execute_component
-
-def load_context(path: str):
-    """Load the LLM context from llms-ctx.txt"""
-    context_path = os.path.join(os.path.dirname(__file__), path)
+from fasthtml.common import sse_message, Div, P, NotStr
+from client import create_async_openai_client, get_completion_async
+from router import model_router
+from components import (ChatMessage, ComponentMessage, ComponentUpdate, CollapsedComponent, ChatInput, StreamingMessage, PartialComponentMessage,
+                        execute_to_html, render_partial_component, to_html)
+from component_tree import tree_renderer, tree_payload, render_tree_json, render_partial_tree
+from prompts import prompt_registry
+from charts import defer_charts
+from edits import PatchError, parse_patch, apply_patch, html_swaps
+from cache import response_cache, normalize_message
+from admission import admission_scheduler, current_session, Throttled, FIRST_MESSAGE, FOLLOW_UP, RETRY
+from conversations import conversation_store
+from singleflight import SingleFlight
+from sandbox import sandbox_pool
+from metrics import (REQUESTS, REQUEST_SECONDS, STAGE_SECONDS, RETRIES, FIX_CANDIDATES, CACHE_LOOKUPS, EDITS,
+                     LAZY_CHART_BYTES, observe_completion, observe_execution)
+from config import (STREAM_RENDER_INTERVAL,
+                    SANDBOX_ENABLED, SPECULATIVE_FIXES, FIX_ROUNDS, FIX_MODELS, FIX_TEMPERATURES, OUTPUT_MODE,
+                    EDITS_ENABLED, EDIT_MAX_SWAPS, CHAT_ACTIVE_COMPONENTS)
+
+# Identical concurrent generations (same conversation, prompt version and model) share one LLM call
+generation_flights = SingleFlight()
+
+# What the model sees of its own turn when a component was rendered
+COMPONENT_SUMMARY = "Generated interactive component"
+# The assistant's turn when no component came of a message, so the next message does not follow it directly
+ERROR_SUMMARY = "Could not generate a component for this message"
+
+# The model answers with a JSON component tree through a tool call instead of code
+TREE_MODE = OUTPUT_MODE == "tree"
+
+def _priority(history: list[dict], msg: str):
+    """Scheduling priority of a message, from the conversation before it"""
+    earlier = [m["content"] for m in history if m["role"] == "user"]
+    if not earlier:
+        return FIRST_MESSAGE
+    # The same message again, after an error or a busy reply
+    return RETRY if normalize_message(earlier[-1]) == normalize_message(msg) else FOLLOW_UP
+
+def _check_budget(session_id: str):
+    """The result to show instead when the session is over its token budget, else None"""
     try:
-        with open(context_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
-        return "FastHTML context file not found. Using basic FastHTML knowledge."
-
-def handle_chat_send(msg: str, messages: list[str] = None):
-    """Handle the form submission for chat messages with conversation context"""
-    if not messages:
-        messages = []
-    messages.append(msg.rstrip())
-
-    # Load context from file
-    components_context = load_context("llms-ctx-components.txt")
-
-    system_prompt = f"""You are an expert visual UI designer that transforms complex information into beautifully digestible FastHTML/MonsterUI components.
-
-This UI component should directly address or visualize the user's request (e.g., if they ask for "weather", create a weather card UI).
-The generated UI should be visually appealing, creative where it makes sense for visualizations, modern, and functional, and add animations where it makes sense, i.e. for a weather app you may animate rainfall.
-For any UI you generate that might need an API key, i.e. weather, just simulate the effect, we do not need these to be wired up.
-If generating UI is not appropriate for the user's query, or if you are unable to fulfill the UI request, you may respond with a polite text message explaining why.
-
-# COMPONENT REFERENCE:
-{components_context}
-
-🎯 MISSION: Transform the user's request into a visually rich, interactive component that makes complex concepts easy to understand and engage with.
-
-📋 DESIGN PRINCIPLES:
-• Visual Hierarchy: Use clear headings, spacing, and typography to guide the eye
-• Information Architecture: Break complex data into scannable chunks using cards, grids, and sections
-• Progressive Disclosure: Use accordions, tabs, and collapsible sections for deep content
-• Visual Cues: Employ icons, colors, badges, and visual indicators to communicate meaning instantly
-• Cognitive Load Reduction: Present information in bite-sized, organized pieces
-• Interactive Elements: Make content explorable with hover states, expandable sections, and clear navigation
-• Use MonsterUI components for the best user experience
-• Use TailwindCSS for styling
-
-🎨 COMPONENT SELECTION GUIDE:
-
-For EXPLANATIONS/CONCEPTS → Use Accordion with expandable sections, each with icons and clear headings
-For PROCESSES/TUTORIALS → Use Steps with visual progression indicators and detailed descriptions
-For COMPARISONS → Use side-by-side cards or tables with clear visual differentiators
-For DATA/STATISTICS → Use ApexChart(opts={...}) with proper options object, Progress components for percentages
-For TIMELINES/HISTORY → Use Steps (vertical) or timeline cards with dates prominently displayed
-For FORMS/INPUT → Use well-structured forms with clear labels and validation hints
-For LISTS/CATALOGS → Use Grid with cards containing images, titles, and key info
-For COMPLEX INFO → Use tabbed interfaces or accordion patterns
-
-🚀 TECHNICAL REQUIREMENTS:
-1. Output ONLY a single FastHTML/MonsterUI component expression
-2. NO imports, app setup, routes, or serve() calls
-3. Use rich styling with DaisyUI and TailwindCSS classes (cards, shadows, gradients, spacing)
-4. Include visual elements: UkIcon, DiceBearAvatar, PicSumImg where appropriate
-5. Make it responsive with proper Grid columns and spacing
-6. Use semantic colors and typography for better readability
-
-⚠️ CRITICAL COMPONENT USAGE - AVOID THESE ERRORS:
-
-❌ WRONG: ApexChart() - Missing required 'opts' parameter
-✅ CORRECT: ApexChart(opts={{"chart": {{"type": "bar"}}, "series": [{{"name": "Data", "data": [10, 20, 30]}}]}})
-
-❌ WRONG: Badge("text") - Badge doesn't exist in FastHTML/MonsterUI
-✅ CORRECT: Use Alert, Span with classes, or UkIcon for badges/indicators
-
-❌ WRONG: Card(H3("Title"), P("Content")) - Wrong Card syntax
-✅ CORRECT: Card(cls="p-4")(H3("Title"), P("Content"))
-
-
-COMPONENT SYNTAX RULES:
-• ApexChart: ALWAYS include opts parameter with chart config
-• Cards: Use Card(cls="...")(content) format
-• Badges/Labels: Use Alert, Span + classes, or colored Div
-• Charts: Only ApexChart exists, requires opts={{"chart": {{...}}, "series": [...]}}
-• Icons: UkIcon("icon-name", width, height) format
-• Progress: Progress(value=X, max=100) format
-• No Badge component exists - use alternatives
-
-🌟 ELEVATED EXAMPLES:
-
-User: "Explain photosynthesis"
-Output:
-Div(cls="max-w-4xl mx-auto p-6")(
-    Div(cls="text-center mb-8")(
-        UkIcon("sun", 48, 48, cls="text-yellow-500 mb-4"),
-        H1("Photosynthesis", cls="text-4xl font-bold text-green-700 mb-2"),
-        P("How plants convert sunlight into energy", cls="text-xl text-gray-600")
-    ),
-    Accordion(
-        AccordionItem(
-            Div(UkIcon("lightbulb", 20, 20), "What is Photosynthesis?", cls="flex items-center gap-3"),
-            Div(cls="p-4 bg-green-50 rounded-lg")(
-                P("The process by which plants use sunlight, water, and carbon dioxide to create glucose and oxygen."),
-                Div(cls="mt-4 p-3 bg-white rounded border-l-4 border-green-500")(
-                    Strong("Formula: "), CodeSpan("6CO₂ + 6H₂O + light energy → C₆H₁₂O₆ + 6O₂")
-                )
-            )
-        ),
-        AccordionItem(
-            Div(UkIcon("settings", 20, 20), "The Process", cls="flex items-center gap-3"),
-            Steps(
-                LiStep("Light Absorption", cls=StepT.success, data_content="1"),
-                LiStep("Water Splitting", cls=StepT.info, data_content="2"),
-                LiStep("CO₂ Fixation", cls=StepT.warning, data_content="3"),
-                LiStep("Glucose Production", cls=StepT.primary, data_content="4"),
-                cls=StepsT.vertical
-            )
-        ),
-        AccordionItem(
-            Div(UkIcon("activity", 20, 20), "Importance", cls="flex items-center gap-3"),
-            Grid(
-                Card(H4("🌍 Global Impact"), P("Produces 70% of Earth's oxygen"), cls="bg-blue-50 p-4"),
-                Card(H4("🍃 Plant Growth"), P("Creates energy for all plant functions"), cls="bg-green-50 p-4"),
-                Card(H4("🔋 Energy Storage"), P("Forms the base of food chains"), cls="bg-yellow-50 p-4"),
-                cols=3
-            )
-        )
-    )
-)
-
-User: "Compare Python vs JavaScript"
-Output:
-Div(cls="max-w-6xl mx-auto p-6")(
-    H1("Python vs JavaScript", cls="text-3xl font-bold text-center mb-8"),
-    Grid(
-        Card(cls="bg-blue-50 border-2 border-blue-200 p-6")(
-            Div(cls="flex items-center gap-3 mb-4")(
-                UkIcon("code", 32, 32, cls="text-blue-600"),
-                H2("Python", cls="text-2xl font-bold text-blue-800")
-            ),
-            Div(cls="space-y-4")(
-                Div(cls="flex items-center gap-2 text-green-600")(
-                    UkIcon("check", 16, 16), Strong("Easy to learn")
-                ),
-                Div(cls="flex items-center gap-2 text-green-600")(
-                    UkIcon("check", 16, 16), Strong("Great for data science")
-                )
-            ),
-            Alert("Best for: AI, Data Science, Backend", cls=AlertT.info)
-        ),
-        Card(cls="bg-yellow-50 border-2 border-yellow-200 p-6")(
-            Div(cls="flex items-center gap-3 mb-4")(
-                UkIcon("globe", 32, 32, cls="text-yellow-600"),
-                H2("JavaScript", cls="text-2xl font-bold text-yellow-800")
-            ),
-            Div(cls="space-y-4")(
-                Div(cls="flex items-center gap-2 text-green-600")(
-                    UkIcon("check", 16, 16), Strong("Runs everywhere")
-                ),
-                Div(cls="flex items-center gap-2 text-green-600")(
-                    UkIcon("check", 16, 16), Strong("Interactive UIs")
-                )
-            ),
-            Alert("Best for: Web Development, Mobile Apps", cls=AlertT.warning)
-        ),
-        cols=2
-    )
-)
-
-User: "Show sales data chart"
-Output:
-Div(cls="max-w-4xl mx-auto p-6")(
-    H2("Sales Performance", cls="text-2xl font-bold mb-6"),
-    ApexChart(opts={{
-        "chart": {{"type": "line", "height": 350}},
-        "series": [{{"name": "Sales", "data": [30, 40, 35, 50, 49, 60, 70, 91, 125]}}],
-        "xaxis": {{"categories": ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep"]}},
-        "stroke": {{"curve": "smooth"}},
-        "title": {{"text": "Monthly Sales Trends"}}
-    }})
-)
-
-DO NOT create endpoints, routes, or serve() calls. ONLY return the FastHTML/MonsterUI component code.
-Now create a visually stunning, information-rich component for the user's request."""
-
-
+        admission_scheduler.check(session_id)
+    except Throttled as throttled:
+        print(f"⏳ Not admitted ({throttled.reason}), {admission_scheduler.waiting()} waiting")
+        return _refused_result(throttled)
+    # LLM calls of a generation this request starts charge this session's budget
+    current_session.set(session_id)
+    return None
+
+async def _admitted(session_id: str, priority: int, generate):
+    """Result of `generate()` once the scheduler admits it, or the result to show instead when turned away.
+
+    Runs inside the generation's flight, so only the request that started it takes a slot;
+    requests sharing it just wait for the result.
+    """
     try:
-        import time
-
-
-        client = create_openai_client()
-
-        # Build conversation context for API
-        messages_for_api = [{"role": "system", "content": system_prompt}]
-
-        # Add conversation history (alternating user/assistant) - keep only last 10 messages
-        recent_messages = messages[-10:] if len(messages) > 10 else messages
-        for i, message in enumerate(recent_messages):
-            role = "user" if i % 2 == 0 else "assistant"
-            messages_for_api.append({"role": role, "content": message})
-
-        import time
-        start_time = time.time()
-        response_data = get_completion(client, messages_for_api)
-        result = _try_execute_with_retry(msg, response_data["content"], messages, max_retries=3)
-        total_time = time.time() - start_time
-
+        await admission_scheduler.admit(session_id, priority)
+    except Throttled as throttled:
+        print(f"⏳ Not admitted ({throttled.reason}), {admission_scheduler.waiting()} waiting")
+        return _refused_result(throttled)
+    try:
+        return await generate()
+    finally:
+        admission_scheduler.release()
+
+class GenerationResult:
+    """Outcome of one chat message, turned into chat messages once at the end.
+
+    `component` is the rendered component, or None when `error` should be shown instead;
+    `failed_code` is added to the error when every fix attempt failed. `component_id` is
+    the id of the component in the page; an edit of an earlier component keeps its id
+    and has the out-of-band `swaps` that update it in place.
+    """
+
+    def __init__(self, component=None, code=None, retries=0, error=None, failed_code=None, cached=False):
+        self.component = component
+        self.code = code
+        self.retries = retries
+        self.error = error
+        self.failed_code = failed_code
+        self.cached = cached
+        self.component_id = f"component-{uuid.uuid4().hex[:12]}"
+        self.swaps = None
+        self.total_time = None
+        self.tokens = 0
+
+    def assistant_messages(self):
+        """The assistant's chat messages for this result"""
+        if self.component is None:
+            messages = [ChatMessage(self.error, False)]
+            if self.failed_code is not None:
+                messages.append(ChatMessage("Raw code:", False))
+                messages.append(ChatMessage(f"```\n{self.failed_code}\n```", False))
+            return tuple(messages)
 
-        generation_info = {
-            "total_time": total_time,
-            "tokens": response_data["tokens"]["completion"]
-        }
+        messages = []
+        # Add retry indicator if this was a retry
+        if self.retries > 0:
+            messages.append(ChatMessage(f"✅ Fixed after {self.retries} attempt(s)", False))
+        if self.swaps is not None:
+            info = f" in {self.total_time:.2f}s ({self.tokens} tokens)" if self.total_time is not None else ""
+            messages.append(ChatMessage(f"✏️ Updated the component above{info}", False))
+            return (*messages, *self.swaps)
+        generation_info = None
+        if self.total_time is not None:
+            generation_info = {"total_time": self.total_time, "tokens": self.tokens, "cached": self.cached}
+        messages.append(ComponentMessage(self.component, generation_info=generation_info, component_id=self.component_id))
+        return tuple(messages)
+
+def _chat_response(msg: str, result: GenerationResult, collapsed: tuple = ()):
+    """The user message, the result, components to collapse and an input reset, as returned by a non-streamed send"""
+    return (ChatMessage(msg, True), *result.assistant_messages(), *collapsed, ChatInput())
+
+def _refused_result(throttled: Throttled):
+    if throttled.retry_after is not None:
+        REQUESTS.inc(outcome="throttled")
+        return GenerationResult(error=f"⏳ You're sending requests faster than I can answer them. "
+                                      f"Please try again in {math.ceil(throttled.retry_after)}s.")
+    REQUESTS.inc(outcome="busy")
+    return GenerationResult(error="⏳ I'm handling a lot of requests right now. Please try again in a moment.")
+
+def _record_completion(kind: str, seconds: float, tokens: dict, model: str = None, ttft: float = None):
+    """Metrics of an LLM call, and its tokens charged to the session's budget and cost"""
+    observe_completion(kind, seconds, tokens, model=model, ttft=ttft)
+    admission_scheduler.charge(tokens, model)
+
+def _defer_charts(html: str):
+    """Rendered component HTML with its large charts loaded when scrolled to"""
+    html, moved = defer_charts(html)
+    if moved:
+        LAZY_CHART_BYTES.inc(moved)
+    return NotStr(html)
+
+async def _execute_component(code_text: str):
+    """Run generated code and return the rendered component, in the sandbox pool when enabled"""
+    spans = {}
+    start = time.perf_counter()
+    try:
+        if SANDBOX_ENABLED:
+            return _defer_charts(await sandbox_pool.render(code_text, spans))
+        # Generated code is CPU bound, keep it off the event loop
+        return _defer_charts(await asyncio.to_thread(execute_to_html, code_text, spans))
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage="execute")
+        observe_execution(spans)
+
+async def _render_tree(payload: str):
+    """Render a JSON component tree; no generated code runs, so it needs no sandbox"""
+    spans = {}
+    start = time.perf_counter()
+    try:
+        return _defer_charts(await asyncio.to_thread(render_tree_json, payload, spans))
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage="execute")
+        observe_execution(spans)
+
+async def _render_answer(text: str):
+    """Render generated code, or a component tree in tree mode"""
+    return await (_render_tree(text) if TREE_MODE else _execute_component(text))
+
+def _tools():
+    return [tree_renderer.tool()] if TREE_MODE else None
+
+async def _start_turn(msg: str, session_id: str):
+    """Record the user message and return the history sent to the model, trimmed to the token budget"""
+    await conversation_store.append(session_id, "user", msg.rstrip())
+    return await conversation_store.history(session_id)
+
+async def _edit_target(session_id: str, history: list[dict]):
+    """The component the new message may edit: the session's last one, if it was the model's last turn"""
+    if not EDITS_ENABLED or len(history) < 2 or history[-2] != {"role": "assistant", "content": COMPONENT_SUMMARY}:
+        return None
+    return await conversation_store.last_component(session_id)
+
+def _build_api_messages(history: list[dict], edit: dict = None):
+    """System prompt and the reference sections relevant to the last user messages, followed by the history,
+    in which the model sees the source of the component it may `edit`"""
+    start = time.perf_counter()
+    # Precompiled prompt, only rebuilt when a context file changes
+    query = "\n".join([m["content"] for m in history if m["role"] == "user"][-2:])
+    if edit is not None:
+        history = prompt_registry.edit_history(history, edit["source"])
+    messages_for_api = [*prompt_registry.system_messages(query, "tree" if TREE_MODE else "system"), *history]
+    STAGE_SECONDS.observe(time.perf_counter() - start, stage="prompt_build")
+    return messages_for_api
+
+def _cache_key(history: list[dict], edit: dict = None):
+    prompt_registry.refresh()
+    # Trees and code are not interchangeable, keep their entries apart
+    version = f"{prompt_registry.version}:tree" if TREE_MODE else prompt_registry.version
+    lines = [f"{m['role']}: {m['content']}" for m in history]
+    if edit is not None:
+        # An edit depends on the component it is applied to
+        lines.append(f"edit: {edit['source']}")
+    return response_cache.key(lines, version)
+
+def _flight_key(cache_key: str, edit: dict = None):
+    """Edits are only shared by requests for the same component, the swaps target its id"""
+    return f"{cache_key}:{edit['id']}" if edit is not None else cache_key
+
+async def _cached_result(cache_key: str):
+    """Render a cached component, None on a miss or if the cached code no longer executes"""
+    code = await response_cache.get(cache_key)
+    CACHE_LOOKUPS.inc(cache="response", result="miss" if code is None else "hit")
+    if code is None:
+        return None
+
+    start_time = time.time()
+    try:
+        component = await _render_answer(code)
+    except Exception as e:
+        print(f"Cached component failed to execute, regenerating: {e}")
+        response_cache.invalidate(cache_key)
+        return None
+
+    print(f"⚡ Response cache hit ({response_cache.stats()['hit_rate']:.0%} hit rate)")
+    REQUESTS.inc(outcome="cached")
+    result = GenerationResult(component, code, cached=True)
+    result.total_time = time.time() - start_time
+    return result
 
-        return _add_timing_to_result(result, generation_info)
+async def handle_chat_send(msg: str, session_id: str):
+    """Handle the form submission, answering with a busy message when the scheduler turns it away"""
+    priority = _priority(await conversation_store.history(session_id), msg)
+    refused = _check_budget(session_id)
+    if refused is not None:
+        return _chat_response(msg, refused)
+    return _chat_response(msg, *await _generate(msg, session_id, priority))
+
+async def _generate(msg: str, session_id: str, priority: int):
+    """Generate a component for the chat message with conversation context, returning the result
+    and the swaps collapsing components that are no longer active"""
+    request_start = time.perf_counter()
+    history = None
+    try:
+        history = await _start_turn(msg, session_id)
+        edit = await _edit_target(session_id, history)
+        cache_key = _cache_key(history, edit)
+        result = await _cached_result(cache_key)
+        if result is None:
+            result, shared = await generation_flights.do(
+                _flight_key(cache_key, edit),
+                lambda publish: _admitted(session_id, priority, lambda: _run_generation(msg, history, cache_key, edit)))
+            if shared:
+                REQUESTS.inc(outcome="coalesced")
+        return result, await _finish_turn(session_id, result)
 
     except Exception as e:
         print(f"Error: {e}")
-        return (ChatMessage(msg, True),
-                ChatMessage(f"Sorry, I encountered an error: {str(e)}", False),
-                ChatInput())
-
-def _add_timing_to_result(result, generation_info):
-    """Add generation information to the component result"""
-    if isinstance(result, tuple) and len(result) >= 2:
-        # Find the ComponentMessage in the result tuple and update it
-        result_list = list(result)
-        for i, item in enumerate(result_list):
-            # Look for ComponentMessage by checking its structure
-            if (hasattr(item, 'children') and len(item.children) >= 3 and
-                hasattr(item.children[1], 'children') and
-                any('interactive-component' in str(child) for child in item.children[1].children if hasattr(child, 'attrs'))):
-
-                # Extract the original component from the ComponentMessage
-                component = item.children[1].children[0].children[0]
-
-                # Create new ComponentMessage with generation info
-                from components import ComponentMessage
-                result_list[i] = ComponentMessage(
-                    component,
-                    generation_info=generation_info,
-                    context_msg="Generated interactive component"
-                )
-                break
-        return tuple(result_list)
+        REQUESTS.inc(outcome="error")
+        if history is not None:
+            await conversation_store.append(session_id, "assistant", ERROR_SUMMARY)
+        return GenerationResult(error=f"Sorry, I encountered an error: {str(e)}"), ()
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - request_start, mode="sync")
+
+async def _run_generation(msg: str, history: list[dict], cache_key: str, edit: dict = None):
+    """LLM call, execution and fixes for a conversation, shared by identical concurrent requests"""
+    client = create_async_openai_client()
+    messages_for_api = _build_api_messages(history, edit)
+
+    start_time = time.time()
+    response_data = await model_router.complete(client, messages_for_api, msg, first_turn=len(history) == 1, tools=_tools())
+    _record_completion("generate", time.time() - start_time, response_data["tokens"], model=response_data["model"])
+    result = await _answer_result(client, msg, messages_for_api, response_data["content"], response_data.get("arguments"),
+                                  cache_key, edit)
+    if result is None:
+        # The edit does not apply to the component, generate it anew
+        return await _run_generation(msg, history, cache_key)
+    result.total_time = time.time() - start_time
+    result.tokens = response_data["tokens"]["completion"]
+    return result
 
+async def start_streaming_chat(msg: str, session_id: str):
+    """Record the user message and return it plus a placeholder connected to the session's stream,
+    or the busy message without recording anything when the session is over its budget.
+
+    The stream answers whatever the conversation ends with, so it can be served by any worker
+    process sharing the conversation store.
+    """
+    refused = _check_budget(session_id)
+    if refused is not None:
+        return _chat_response(msg, refused)
+    await _start_turn(msg, session_id)
+    return (ChatMessage(msg, True), StreamingMessage(f"/stream/{session_id}"), ChatInput())
+
+def _render_partial_in_process(code_text: str):
+    component = render_partial_tree(code_text) if TREE_MODE else render_partial_component(code_text)
+    return None if component is None else to_html(component)
+
+async def _render_partial(code_text: str):
+    """HTML of the partially generated component message, None if nothing renders yet"""
+    try:
+        if SANDBOX_ENABLED and not TREE_MODE:
+            html = await sandbox_pool.render_partial(code_text)
+        else:
+            html = await asyncio.to_thread(_render_partial_in_process, code_text)
+    except Exception:
+        return None
+    return None if html is None else to_html(PartialComponentMessage(NotStr(html)))
+
+def _sse(component, event: str = "message"):
+    """SSE event with the (minified) HTML of `component`"""
+    return sse_message(NotStr(to_html(component)), event)
+
+async def _run_streamed_generation(msg: str, history: list[dict], cache_key: str, publish, edit: dict = None):
+    """Streamed LLM call, passing progressive renders to `publish`, then execution and fixes"""
+    client = create_async_openai_client()
+    messages_for_api = _build_api_messages(history, edit)
+
+    start_time = time.time()
+    # Text content, and the tool call arguments a tree comes in
+    chunks, arguments, tokens, ttft, model = [], [], {"completion": 0}, None, None
+    last_render, last_html, render = 0.0, None, None
+
+    async def render_partial(code_text: str):
+        nonlocal last_html
+        html = await _render_partial(code_text)
+        if html and html != last_html:
+            last_html = html
+            publish(html)
+
+    try:
+        async for chunk in model_router.stream(client, messages_for_api, msg, first_turn=len(history) == 1, tools=_tools()):
+            if "tokens" in chunk:
+                tokens, model = chunk["tokens"], chunk["model"]
+                continue
+            if ttft is None:
+                ttft = time.time() - start_time
+            if "arguments" in chunk:
+                arguments.append(chunk["arguments"])
+            else:
+                chunks.append(chunk["content"])
+
+            # Re-render the closable prefix at most every STREAM_RENDER_INTERVAL seconds, in the background
+            # so the stream keeps being read, and skip the tick while the previous render is still running
+            now = time.monotonic()
+            if now - last_render < STREAM_RENDER_INTERVAL or (render is not None and not render.done()):
+                continue
+            last_render = now
+            if edit is not None and not arguments and ''.join(chunks).lstrip().startswith('<<<'):
+                # Edits are not rendered until the whole patch is in
+                continue
+            render = asyncio.ensure_future(render_partial(''.join(arguments or chunks)))
+    finally:
+        # The final render supersedes a partial one still running
+        if render is not None:
+            render.cancel()
+
+    _record_completion("generate", time.time() - start_time, tokens, model=model, ttft=ttft)
+
+    result = await _answer_result(client, msg, messages_for_api, ''.join(chunks), ''.join(arguments), cache_key, edit)
+    if result is None:
+        # The edit does not apply to the component, generate it anew
+        return await _run_streamed_generation(msg, history, cache_key, publish)
+    result.total_time = time.time() - start_time
+    result.tokens = tokens["completion"]
     return result
 
-def _try_execute_with_retry(original_msg: str, generated_code: str, messages: list[str], max_retries: int = 3, retry_count: int = 0):
-    """Try to execute code with retry mechanism for fixing errors"""
+async def stream_chat_events(session_id: str):
+    """SSE events answering the session's last message: progressive renders, then the final result and a close event"""
+    history = await conversation_store.history(session_id)
+    if not history or history[-1]["role"] != "user":
+        yield _sse(ChatMessage("There is no message waiting for an answer, please send it again.", False))
+        yield _sse(Div(), event="done")
+        return
+
+    msg = history[-1]["content"]
+    refused = _check_budget(session_id)
+    if refused is not None:
+        await conversation_store.append(session_id, "assistant", ERROR_SUMMARY)
+        yield _sse(refused.assistant_messages())
+        yield _sse(Div(), event="done")
+        return
+
+    request_start = time.perf_counter()
+    flight = None
+    try:
+        edit = await _edit_target(session_id, history)
+        cache_key = _cache_key(history, edit)
+        result = await _cached_result(cache_key)
+        if result is None:
+            # Partial renders of the (possibly shared) generation arrive through the queue
+            partials = asyncio.Queue()
+            flight = asyncio.ensure_future(generation_flights.do(
+                _flight_key(cache_key, edit),
+                lambda publish: _admitted(session_id, _priority(history[:-1], msg),
+                                          lambda: _run_streamed_generation(msg, history, cache_key, publish, edit)),
+                partials.put_nowait))
+            while not flight.done():
+                next_partial = asyncio.ensure_future(partials.get())
+                await asyncio.wait([flight, next_partial], return_when=asyncio.FIRST_COMPLETED)
+                if next_partial.done():
+                    yield sse_message(NotStr(next_partial.result()))
+                else:
+                    next_partial.cancel()
+            result, shared = flight.result()
+            if shared:
+                REQUESTS.inc(outcome="coalesced")
+        collapsed = await _finish_turn(session_id, result)
+        # The user message and input reset were already sent with the POST response
+        yield _sse((*result.assistant_messages(), *collapsed))
 
+    except Exception as e:
+        print(f"Error: {e}")
+        REQUESTS.inc(outcome="error")
+        await conversation_store.append(session_id, "assistant", ERROR_SUMMARY)
+        yield _sse(ChatMessage(f"Sorry, I encountered an error: {str(e)}", False))
+    finally:
+        # A closed connection stops waiting; the generation goes on while other requests share it
+        if flight is not None and not flight.done():
+            flight.cancel()
+        REQUEST_SECONDS.observe(time.perf_counter() - request_start, mode="stream")
+    yield _sse(Div(), event="done")
+
+async def _finish_turn(session_id: str, result: GenerationResult):
+    """Record the assistant's turn of a rendered component in the conversation, and the component for later
+    edits, returning the swaps that collapse the components it pushed out of the active window"""
+    if result.component is None:
+        await conversation_store.append(session_id, "assistant", ERROR_SUMMARY)
+        return ()
+    await conversation_store.append(session_id, "assistant", COMPONENT_SUMMARY)
+    await conversation_store.set_component(session_id, result.component_id, result.code, str(result.component))
+    # An edit updates a component in place, the window is unchanged
+    return await _collapsed_components(session_id) if result.swaps is None else ()
+
+async def _collapsed_components(session_id: str):
+    """Placeholders for the component that just left the last CHAT_ACTIVE_COMPONENTS, and for older
+    ones that were scrolled back to (and so restored) since the last turn"""
+    if CHAT_ACTIVE_COMPONENTS <= 0:
+        return ()
+    inactive = (await conversation_store.component_ids(session_id))[:-CHAT_ACTIVE_COMPONENTS]
+    collapse = await conversation_store.take_restored(session_id)
+    if inactive:
+        collapse.add(inactive[-1])
+    return tuple(CollapsedComponent(session_id, component_id) for component_id in inactive if component_id in collapse)
+
+async def restore_component(session_id: str, component_id: str):
+    """HTML of a collapsed component scrolled back into view; it stays active until the next turn"""
+    html = await conversation_store.restore_component(session_id, component_id)
+    if html is None:
+        return to_html(P("This component is no longer available.", cls="text-sm text-gray-400"))
+    return html
+
+async def _answer_result(client, msg: str, messages_for_api: list, content: str, arguments: str, cache_key: str, edit: dict = None):
+    """Render the model's answer: an edit of the last component, or a new component tree or code.
+    None when the answer is an edit that does not apply."""
+    if edit is not None:
+        blocks = [] if arguments else parse_patch(content)
+        if blocks:
+            return await _apply_edit(client, msg, messages_for_api, edit, blocks, cache_key)
+        EDITS.inc(outcome="regenerated")
+    answer = tree_payload(content, arguments) if TREE_MODE else content
+    return await _try_execute_with_retry(msg, answer, max_retries=FIX_ROUNDS, cache_key=cache_key,
+                                         messages_for_api=messages_for_api)
+
+async def _apply_edit(client, msg: str, messages_for_api: list, edit: dict, blocks: list, cache_key: str):
+    """Patch the source of the last component and render it, with swaps for just the elements that changed"""
     try:
-        component = parse_and_execute_component(generated_code)
-        success_result = [ChatMessage(original_msg, True)]
+        source = apply_patch(edit["source"], blocks)
+    except PatchError as e:
+        print(f"⚠️ Edit does not apply, regenerating the component: {e}")
+        EDITS.inc(outcome="unmatched")
+        return None
+
+    print(f"✏️ Applying {len(blocks)} edit(s) to {edit['id']}")
+    result = await _try_execute_with_retry(msg, source, max_retries=FIX_ROUNDS, cache_key=cache_key,
+                                           messages_for_api=messages_for_api)
+    if result.component is not None:
+        start = time.perf_counter()
+        swaps = await asyncio.to_thread(html_swaps, edit["html"], str(result.component), edit["id"], EDIT_MAX_SWAPS)
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage="diff")
+        EDITS.inc(outcome="replaced" if swaps is None else "swapped")
+        result.component_id = edit["id"]
+        result.swaps = [ComponentUpdate(result.component, edit["id"])] if swaps is None else [NotStr(swap) for swap in swaps]
+    return result
 
-        # Add retry indicator if this was a retry
-        if retry_count > 0:
-            success_result.append(ChatMessage(f"✅ Fixed after {retry_count} attempt(s)", False))
+def _success_result(generated_code: str, component, retry_count: int, cache_key: str = None):
+    """Result for code that executed, caching the code"""
+    if cache_key:
+        response_cache.set(cache_key, generated_code)
+    REQUESTS.inc(outcome="success")
+    RETRIES.observe(retry_count)
+    return GenerationResult(component, generated_code, retries=retry_count)
 
-        success_result.append(ComponentMessage(component))
-        success_result.append(ChatInput())
-        return tuple(success_result)
+async def _try_execute_with_retry(original_msg: str, generated_code: str, max_retries: int = FIX_ROUNDS, retry_count: int = 0,
+                                  cache_key: str = None, messages_for_api: list = None):
+    """Try to execute code (or render a tree in tree mode), with up to `max_retries` rounds of fix candidates
+    when it fails, caching code that executes. A tree is fixed in the conversation `messages_for_api`."""
 
+    try:
+        component = await _render_answer(generated_code)
     except Exception as code_error:
         print(f"Error executing generated code (attempt {retry_count + 1}): {code_error}")
-
-        # If we've reached max retries, return the error
-        if retry_count >= max_retries:
-            result = [ChatMessage(original_msg, True)]
-            result.append(ChatMessage(f"❌ Failed after {max_retries + 1} attempts. Final error: {str(code_error)}", False))
-            result.append(ChatMessage("Raw code:", False))
-            result.append(ChatMessage(f"```\n{generated_code}\n```", False))
-            result.append(ChatInput())
-            return tuple(result)
-
-        # Try to get the LLM to fix the error
-        return _retry_with_error_feedback(original_msg, generated_code, str(code_error), messages, retry_count)
-
-def _retry_with_error_feedback(original_msg: str, failed_code: str, error_message: str, messages: list[str], retry_count: int):
-    """Ask LLM to fix the error and retry"""
-
-    # Load context
-    components_context = load_context("llms-ctx-components.txt")
-
-    # Create error-fixing prompt
-    fix_prompt = f"""You are an expert FastHTML/MonsterUI developer. Fix the error in the generated code.
-
-# COMPONENT REFERENCE:
-{components_context}
-
-ORIGINAL REQUEST: {original_msg}
-
-GENERATED CODE THAT FAILED:
-```
-{failed_code}
-```
-
-ERROR MESSAGE: {error_message}
-
-Please fix the error and return ONLY the corrected FastHTML/MonsterUI component code. Common fixes:
-
-CRITICAL FIXES:
-- ApexChart MUST have opts parameter: ApexChart(opts={{"chart": {{"type": "bar"}}, "series": [...]}})
-- Badge component does NOT exist - use Alert, Span with classes, or colored Div instead
-- Card syntax: Card(cls="...")(content) not Card(content, cls="...")
-- Button cls error: Never pass cls as both positional and keyword - use Button("Text", cls=ButtonT.primary)
-- Duplicate cls error: Never pass cls parameter twice - merge into single cls="class1 class2"
-- Assignment in expression: Don't use = in expressions - use separate variables or data attributes
-- Footer cls error: Footer() doesn't accept cls parameter - use standard HTML Footer(*content)
-- Progress needs value/max: Progress(value=75, max=100)
-- UkIcon needs width/height: UkIcon("name", 16, 16)
-
-SYNTAX FIXES:
-- Check parentheses, brackets, and quotes are properly matched
-- Ensure proper component parameters and structure
-- Use correct DaisyUI/TailwindCSS class names
-
-Return ONLY the fixed component code:"""
-
+        return await _handle_failed_code(original_msg, generated_code, code_error, max_retries, retry_count, cache_key,
+                                         messages_for_api)
+
+    return _success_result(generated_code, component, retry_count, cache_key)
+
+async def _handle_failed_code(original_msg: str, generated_code: str, code_error: Exception, max_retries: int, retry_count: int,
+                              cache_key: str = None, messages_for_api: list = None):
+    """Give up after `max_retries` rounds of fix candidates, otherwise ask the LLM to fix the error"""
+    # If we've reached max retries, return the error
+    if retry_count >= max_retries:
+        REQUESTS.inc(outcome="failed")
+        RETRIES.observe(retry_count)
+        return GenerationResult(code=generated_code, retries=retry_count, failed_code=generated_code,
+                                error=f"❌ Failed after {retry_count + 1} attempts. Final error: {str(code_error)}")
+
+    # Try to get the LLM to fix the error
+    return await _retry_with_error_feedback(original_msg, generated_code, str(code_error), retry_count, cache_key, max_retries,
+                                            messages_for_api)
+
+class _FailedCandidate(Exception):
+    """A fix candidate whose code did not execute"""
+    def __init__(self, code: str, error: Exception):
+        super().__init__(str(error))
+        self.code = code
+        self.error = error
+
+def _fix_variants():
+    """(model, temperature) for each speculative fix request"""
+    count = max(1, SPECULATIVE_FIXES)
+    return [(FIX_MODELS[i % len(FIX_MODELS)], FIX_TEMPERATURES[i % len(FIX_TEMPERATURES)]) for i in range(count)]
+
+async def _fix_candidate(client, messages_for_api: list, model: str, temperature: float):
+    """Request one fix and execute it, returning (code, component) or raising _FailedCandidate"""
+    start = time.perf_counter()
+    response_data = await get_completion_async(client, messages_for_api, model=model, temperature=temperature, tools=_tools())
+    _record_completion("fix", time.perf_counter() - start, response_data["tokens"], model=model)
+    response = (tree_payload(response_data["content"], response_data.get("arguments")) if TREE_MODE
+                else response_data["content"])
+    print(f"🔧 Fix attempt response ({model}, t={temperature}): {response}")
     try:
-        client = create_openai_client()
-        messages_for_api = [
-            {"role": "system", "content": fix_prompt}
-        ]
+        return response, await _render_answer(response)
+    except Exception as code_error:
+        raise _FailedCandidate(response, code_error)
 
-        print(f"🔄 Retry attempt {retry_count + 1}: Asking LLM to fix error...")
-        response_data = get_completion(client, messages_for_api)
-        response = response_data["content"]
-        print(f"🔧 Fix attempt response: {response}")
+async def _retry_with_error_feedback(original_msg: str, failed_code: str, error_message: str, retry_count: int, cache_key: str = None,
+                                     max_retries: int = FIX_ROUNDS, generation_messages: list = None):
+    """Ask the LLM to fix the error, racing SPECULATIVE_FIXES candidates and keeping the first that renders"""
 
-        # Try executing the fixed code
-        return _try_execute_with_retry(original_msg, response, messages, max_retries=3, retry_count=retry_count + 1)
+    try:
+        client = create_async_openai_client()
+        start = time.perf_counter()
+        if TREE_MODE:
+            # The tree is fixed in the conversation that produced it, with every problem found in it
+            messages_for_api = prompt_registry.tree_fix_messages(generation_messages, failed_code, error_message)
+        else:
+            # Cached static prefix followed by the details of this failure
+            messages_for_api = prompt_registry.fix_messages(original_msg, failed_code, error_message)
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage="prompt_build")
+
+        variants = _fix_variants()
+        print(f"🔄 Retry attempt {retry_count + 1}: Asking LLM for {len(variants)} fix candidate(s)...")
+        tasks = [asyncio.create_task(_fix_candidate(client, messages_for_api, model, temperature))
+                 for model, temperature in variants]
+        failed, request_error = [], None
+        try:
+            for next_candidate in asyncio.as_completed(tasks):
+                try:
+                    code, component = await next_candidate
+                except _FailedCandidate as candidate:
+                    print(f"Error executing fix candidate (attempt {retry_count + 2}): {candidate.error}")
+                    FIX_CANDIDATES.inc(outcome="failed")
+                    failed.append(candidate)
+                    continue
+                except Exception as e:
+                    FIX_CANDIDATES.inc(outcome="error")
+                    request_error = e
+                    continue
+                FIX_CANDIDATES.inc(outcome="success")
+                return _success_result(code, component, retry_count + 1, cache_key)
+        finally:
+            # The first candidate that renders wins, cancel the rest
+            for task in tasks:
+                if not task.done():
+                    FIX_CANDIDATES.inc(outcome="cancelled")
+                    task.cancel()
+
+        if not failed:
+            raise request_error
+        # No candidate rendered: that was the last round unless FIX_ROUNDS allows another,
+        # which continues from the first candidate that came back
+        return await _handle_failed_code(original_msg, failed[0].code, failed[0].error, max_retries, retry_count + 1, cache_key,
+                                         generation_messages)
 
     except Exception as e:
         print(f"Error in retry mechanism: {e}")
+        REQUESTS.inc(outcome="error")
         # Fall back to original error display
-        result = [ChatMessage(original_msg, True)]
-        result.append(ChatMessage(f"❌ Retry failed: {str(e)}", False))
-        result.append(ChatInput())
-        return tuple(result)
\ No newline at end of file
+        return GenerationResult(retries=retry_count, error=f"❌ Retry failed: {str(e)}")
@@ -1,14 +1,35 @@
+import uuid
 from fasthtml.common import *
 from monsterui.all import *
 
-from components import LoadingMessage, ChatInput, Footer
-from handlers import handle_chat_send
+from starlette.middleware import Middleware
+from components import LoadingMessage, ChatInput, SessionField, Footer, to_html
+from handlers import handle_chat_send, start_streaming_chat, stream_chat_events, restore_component
+from admission import admission_scheduler
+from config import STREAMING_ENABLED, SANDBOX_ENABLED, COMPRESSION_ENABLED
+from client import close_clients
+from sandbox import sandbox_pool
+from prompts import prompt_registry
+from charts import chart_store, chart_html
+from metrics import metrics_registry
+from middleware import CompressionMiddleware
+
+# Load the context files and compile the prompts once at startup
+prompt_registry.preload()
 
 # Enable ApexCharts support
 hdrs = Theme.blue.headers(apex_charts=True)
+if STREAMING_ENABLED:
+    # htmx SSE extension for progressive rendering
+    hdrs = (*hdrs, Script(src="https://cdn.jsdelivr.net/npm/htmx-ext-sse@2.2.2/sse.js"))
+
+# Compress responses and give the page an ETag
+middleware = [Middleware(CompressionMiddleware)] if COMPRESSION_ENABLED else []
 
 # Create your app with the theme
-app, rt = fast_app(hdrs=hdrs)
+# Pre-warm the sandbox workers that execute generated components
+on_startup = [sandbox_pool.start] if SANDBOX_ENABLED else []
+app, rt = fast_app(hdrs=hdrs, middleware=middleware, on_startup=on_startup, on_shutdown=[close_clients, sandbox_pool.close])
 
 
 # The main screen
@@ -24,7 +45,9 @@ def index():
                 ),
 
                 # Chat interface
+                # The conversation is kept server-side, the form only posts its session id
                 Form(hx_post=send, hx_target="#chatlist", hx_swap="beforeend", hx_indicator="#loading")(
+                    SessionField(),
                     Div(cls="bg-white rounded-lg shadow-lg border")(
                         Div(id="chatlist", cls="chat-box h-[60vh] overflow-y-auto p-4"),
 
@@ -58,7 +81,47 @@ def index():
 
 # Handle the form submission
 @app.post
-def send(msg: str, messages: list[str] = None):
-    return handle_chat_send(msg, messages)
+async def send(msg: str, session_id: str = None):
+    # A post without a session id starts a new conversation, its id goes back to the form
+    new_session = not session_id
+    session_id = session_id or uuid.uuid4().hex
+    if STREAMING_ENABLED:
+        response = await start_streaming_chat(msg, session_id)
+    else:
+        response = await handle_chat_send(msg, session_id)
+    if new_session:
+        response = (*response, SessionField(session_id))
+    # Rendered here because FastHTML's own rendering of route responses is always indented
+    return NotStr(to_html(response))
+
+# Prometheus scrape endpoint with the per-stage latency histograms and counters
+@app.get("/metrics")
+def metrics():
+    return Response(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Options of a chart taken out of a component, requested when the chart scrolls into view.
+# The key is the hash of the content, so the browser never needs to ask again.
+@app.get("/charts/{key}")
+def chart(key: str):
+    opts = chart_store.get(key)
+    if opts is None:
+        return Response("Chart data expired", status_code=404, media_type="text/plain")
+    return Response(chart_html(opts), media_type="text/html; charset=utf-8",
+                    headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+# Tokens and cost of a session's LLM calls (in this process), and the budget it has left
+@app.get("/usage/{session_id}")
+def usage(session_id: str):
+    return JSONResponse(admission_scheduler.usage(session_id))
+
+# A component collapsed out of the active part of the chat, scrolled back into view
+@app.get("/components/{session_id}/{component_id}")
+async def component(session_id: str, component_id: str):
+    return NotStr(await restore_component(session_id, component_id))
+
+# Stream the answer to the message recorded by `send`
+@app.get("/stream/{session_id}")
+async def stream(session_id: str):
+    return EventStream(stream_chat_events(session_id))
 
 serve(port=5001)
\ No newline at end of file
@@ -0,0 +1,178 @@
+import threading
+from config import MODEL_NAME
+
+# Latency buckets (seconds), from sub-millisecond exec to slow LLM calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(9))  # 1 KB .. 64 MB
+RETRY_BUCKETS = (0, 1, 2, 3, 5, 10)
+RATE_BUCKETS = (5, 10, 25, 50, 100, 200, 400, 800)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value):
+    return repr(float(value)) if value != float('inf') else "+Inf"
+
+class Counter:
+    """Monotonic counter with optional labels"""
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in sorted(values.items())]
+
+class Histogram:
+    """Cumulative histogram with fixed buckets and optional labels"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        lines = []
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {values[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(values[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {values[-1]}")
+        return lines
+
+class MetricsRegistry:
+    """The process' metrics, rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry()
+
+REQUESTS = metrics_registry.counter(
+    "genui_requests_total", "Chat messages answered, by outcome", ["outcome"])
+REQUEST_SECONDS = metrics_registry.histogram(
+    "genui_request_seconds", "Time from the start of a generation to its final result", ["mode"])
+STAGE_SECONDS = metrics_registry.histogram(
+    "genui_stage_seconds", "Time spent per pipeline stage (prompt_build, repair, compile, exec, parse, render, execute)", ["stage"])
+LLM_TTFT_SECONDS = metrics_registry.histogram(
+    "genui_llm_ttft_seconds", "LLM time to first token (streamed completions)", ["kind", "model"])
+LLM_SECONDS = metrics_registry.histogram(
+    "genui_llm_seconds", "LLM completion time", ["kind", "model"])
+LLM_TOKENS_PER_SECOND = metrics_registry.histogram(
+    "genui_llm_tokens_per_second", "Completion tokens per second of generation", ["kind", "model"], RATE_BUCKETS)
+LLM_TOKENS = metrics_registry.counter(
+    "genui_llm_tokens_total", "Tokens used", ["kind", "type"])
+RETRIES = metrics_registry.histogram(
+    "genui_retries", "Fix rounds needed per generated component", [], RETRY_BUCKETS)
+FIX_CANDIDATES = metrics_registry.counter(
+    "genui_fix_candidates_total", "Speculative fix candidates, by outcome", ["outcome"])
+STATIC_FIXES = metrics_registry.counter(
+    "genui_static_fixes_total", "Mistakes in generated code fixed locally, by rule", ["rule"])
+EDITS = metrics_registry.counter(
+    "genui_edits_total", "Follow-ups to a component, by outcome (swapped, replaced, unmatched, regenerated)", ["outcome"])
+LAZY_CHART_BYTES = metrics_registry.counter(
+    "genui_lazy_chart_bytes_total", "Chart options moved out of component HTML, to be loaded when scrolled to")
+ADMISSION_WAIT_SECONDS = metrics_registry.histogram(
+    "genui_admission_wait_seconds", "Time requests waited to be admitted, by priority", ["priority"])
+LLM_COST = metrics_registry.counter(
+    "genui_llm_cost_usd_total", "Cost of LLM calls at TOKEN_PRICES, by model", ["model"])
+HTML_BYTES = metrics_registry.histogram(
+    "genui_component_html_bytes", "Rendered size of generated components", [], SIZE_BUCKETS)
+CACHE_LOOKUPS = metrics_registry.counter(
+    "genui_cache_lookups_total", "Cache lookups, by cache and result", ["cache", "result"])
+COMPILE_SECONDS_SAVED = metrics_registry.counter(
+    "genui_compile_seconds_saved_total", "Repair and compile time skipped by compiled code cache hits")
+ROUTED_REQUESTS = metrics_registry.counter(
+    "genui_routed_requests_total", "Generations by chosen model and why (primary, simple, unhealthy)", ["model", "reason"])
+HEDGED_REQUESTS = metrics_registry.counter(
+    "genui_hedged_requests_total", "Generations that also went to a fallback model, by reason (slow, failed) and winner", ["reason", "winner"])
+TRANSFER_BYTES = metrics_registry.counter(
+    "genui_transfer_bytes_total", "Response body bytes of compressed responses, before (raw) and after (sent) compression", ["encoding", "body"])
+
+def observe_completion(kind: str, seconds: float, tokens: dict, model: str = None, ttft: float = None):
+    """Record an LLM call: latency, time to first token, token usage and generation speed"""
+    model = model or MODEL_NAME
+    LLM_SECONDS.observe(seconds, kind=kind, model=model)
+    if ttft is not None:
+        LLM_TTFT_SECONDS.observe(ttft, kind=kind, model=model)
+    LLM_TOKENS.inc(tokens.get("prompt", 0), kind=kind, type="prompt")
+    LLM_TOKENS.inc(tokens.get("completion", 0), kind=kind, type="completion")
+    # Streamed calls are rated on the time after the first token, excluding queueing and prompt processing
+    generating = seconds - (ttft or 0)
+    if tokens.get("completion") and generating > 0:
+        LLM_TOKENS_PER_SECOND.observe(tokens["completion"] / generating, kind=kind, model=model)
+
+def observe_execution(spans: dict):
+    """Record the stage timings reported by components.execute_to_html or component_tree.render_tree_json"""
+    for stage in ("repair", "compile", "exec", "parse", "render"):
+        if stage in spans:
+            STAGE_SECONDS.observe(spans[stage], stage=stage)
+    if "compile_cached" in spans:
+        CACHE_LOOKUPS.inc(cache="compiled", result="hit" if spans["compile_cached"] else "miss")
+    if "compile_saved" in spans:
+        # Measured where the lookup happened, a sandbox worker included, and sent back with the spans
+        COMPILE_SECONDS_SAVED.inc(spans["compile_saved"])
+    for rule in spans.get("fixes", ()):
+        STATIC_FIXES.inc(rule=rule)
+    if "html_bytes" in spans:
+        HTML_BYTES.observe(spans["html_bytes"])
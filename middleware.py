@@ -0,0 +1,241 @@
+import zlib
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from starlette.datastructures import Headers, MutableHeaders
+from metrics import TRANSFER_BYTES
+from config import COMPRESSION_MIN_BYTES, GZIP_LEVEL, BROTLI_QUALITY, ZSTD_LEVEL
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    from compression import zstd  # Python 3.14+
+    zstandard = None
+except ImportError:
+    zstd = None
+    try:
+        import zstandard
+    except ImportError:
+        zstandard = None
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+# Bodies above this are compressed in a thread instead of on the event loop
+THREAD_MIN_BYTES = 256 * 1024
+
+class _GzipEncoder:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool = False):
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self):
+        return self._compressor.flush()
+
+class _BrotliEncoder:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes, flush: bool = False):
+        out = self._compressor.process(data)
+        return out + self._compressor.flush() if flush else out
+
+    def finish(self):
+        return self._compressor.finish()
+
+class _ZstdEncoder:
+    def __init__(self):
+        if zstd is not None:
+            self._compressor = zstd.ZstdCompressor(ZSTD_LEVEL)
+        else:
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes, flush: bool = False):
+        if zstd is not None:
+            mode = zstd.ZstdCompressor.FLUSH_BLOCK if flush else zstd.ZstdCompressor.CONTINUE
+            return self._compressor.compress(data, mode)
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK) if flush else out
+
+    def finish(self):
+        return self._compressor.flush()
+
+# Supported content codings, most preferred first
+ENCODERS = {}
+if zstd is not None or zstandard is not None:
+    ENCODERS["zstd"] = _ZstdEncoder
+if brotli is not None:
+    ENCODERS["br"] = _BrotliEncoder
+ENCODERS["gzip"] = _GzipEncoder
+
+def negotiate(accept_encoding: str, available=ENCODERS):
+    """The content coding to use for an Accept-Encoding header, None for identity.
+
+    The highest q-value wins; ties go to the order of `available`.
+    """
+    accepted = {}
+    for part in accept_encoding.split(','):
+        coding, *params = part.split(';')
+        q = 1.0
+        for param in params:
+            name, _, value = param.strip().partition('=')
+            if name.lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding.strip():
+            accepted[coding.strip().lower()] = q
+    best, best_q = None, 0.0
+    for coding in available:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+def compress(body: bytes, encoding: str):
+    encoder = ENCODERS[encoding]()
+    return encoder.compress(body) + encoder.finish()
+
+def _etag_matches(if_none_match: str, etag: str):
+    if if_none_match.strip() == '*':
+        return True
+    # If-None-Match uses the weak comparison
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+class CompressionMiddleware:
+    """Compresses responses with the best encoding the client accepts.
+
+    Complete GET responses also get a strong ETag (per encoding) and are answered with
+    304 Not Modified when the client already has them. Streamed responses (SSE) are
+    compressed incrementally and flushed after every chunk so events are not held back.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES, cache_size: int = 64):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache_size = cache_size
+        self._compressed = OrderedDict()  # (body digest, encoding) -> compressed body of GET responses
+        self._lock = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        responder = _Responder(self, send, negotiate(headers.get("accept-encoding", "")),
+                               headers.get("if-none-match"), scope["method"] == "GET")
+        await self.app(scope, receive, responder)
+
+    async def compress(self, body: bytes, encoding: str, digest: str = None):
+        """Compressed body, reused for repeated GET responses with the same digest"""
+        if digest is not None:
+            with self._lock:
+                cached = self._compressed.get((digest, encoding))
+                if cached is not None:
+                    self._compressed.move_to_end((digest, encoding))
+                    return cached
+        if len(body) >= THREAD_MIN_BYTES:
+            compressed = await asyncio.to_thread(compress, body, encoding)
+        else:
+            compressed = compress(body, encoding)
+        if digest is not None:
+            with self._lock:
+                self._compressed[(digest, encoding)] = compressed
+                while len(self._compressed) > self.cache_size:
+                    self._compressed.popitem(last=False)
+        return compressed
+
+class _Responder:
+    """The `send` callable handed to the app for one request"""
+
+    def __init__(self, middleware: CompressionMiddleware, send, encoding: str, if_none_match: str, etag: bool):
+        self.middleware = middleware
+        self._send = send
+        self.encoding = encoding
+        self.if_none_match = if_none_match
+        self.etag = etag
+        self.start = None
+        self.mode = None  # None until the first body message, then "stream" or "passthrough"
+        self.encoder = None
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self._flush_start()
+            await self._send(message)
+            return
+
+        body, more_body = message.get("body", b""), message.get("more_body", False)
+        if self.mode == "passthrough":
+            await self._send(message)
+            return
+        if self.mode == "stream":
+            await self._send_chunk(body, more_body)
+            return
+
+        headers = MutableHeaders(raw=self.start["headers"])
+        compressible = (headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                        and "content-encoding" not in headers
+                        and "no-transform" not in headers.get("cache-control", ""))
+        if compressible:
+            headers.add_vary_header("Accept-Encoding")
+        if not more_body:
+            await self._send_complete(headers, body, compressible)
+        elif compressible and self.encoding:
+            self.mode = "stream"
+            self.encoder = ENCODERS[self.encoding]()
+            del headers["content-length"]
+            headers["content-encoding"] = self.encoding
+            await self._flush_start()
+            await self._send_chunk(body, more_body)
+        else:
+            self.mode = "passthrough"
+            await self._flush_start()
+            await self._send(message)
+
+    async def _flush_start(self):
+        if self.start is not None:
+            await self._send(self.start)
+            self.start = None
+
+    async def _send_chunk(self, body: bytes, more_body: bool):
+        data = self.encoder.compress(body, flush=more_body)
+        if not more_body:
+            data += self.encoder.finish()
+        TRANSFER_BYTES.inc(len(body), encoding=self.encoding, body="raw")
+        TRANSFER_BYTES.inc(len(data), encoding=self.encoding, body="sent")
+        await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    async def _send_complete(self, headers: MutableHeaders, body: bytes, compressible: bool):
+        encoding = self.encoding if compressible and len(body) >= self.middleware.minimum_size else None
+        digest = None
+        if self.etag and self.start["status"] == 200 and "etag" not in headers:
+            digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+            etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+            headers["etag"] = etag
+            if "cache-control" not in headers:
+                # Cached copies are revalidated on every use, which costs a 304 when nothing changed
+                headers["cache-control"] = "no-cache"
+            if self.if_none_match and _etag_matches(self.if_none_match, etag):
+                del headers["content-length"]
+                self.start["status"] = 304
+                await self._flush_start()
+                await self._send({"type": "http.response.body", "body": b""})
+                return
+
+        if encoding:
+            compressed = await self.middleware.compress(body, encoding, digest)
+            TRANSFER_BYTES.inc(len(body), encoding=encoding, body="raw")
+            TRANSFER_BYTES.inc(len(compressed), encoding=encoding, body="sent")
+            body = compressed
+            headers["content-encoding"] = encoding
+            headers["content-length"] = str(len(body))
+        await self._flush_start()
+        await self._send({"type": "http.response.body", "body": body})
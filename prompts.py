@@ -0,0 +1,428 @@
+import os
+import time
+import hashlib
+import threading
+from config import PROMPT_RELOAD_CHECK_SECONDS, RETRIEVAL_ENABLED, RETRIEVAL_FILES
+from retrieval import ContextIndex, chunk_reference, code_identifiers
+
+COMPONENTS_CONTEXT = "llms-ctx-components.txt"
+CONTEXT_NOT_FOUND = "FastHTML context file not found. Using basic FastHTML knowledge."
+
+# Sections of the components reference kept in every prompt when retrieval is enabled;
+# everything else is indexed and only the sections relevant to the request are sent
+PINNED_SECTIONS = ("Core FastHTML Components", "Critical Component Rules")
+RETRIEVAL_NOTE = "Further reference sections relevant to this request are provided in the next message."
+REFERENCE_TEMPLATE = "# RELEVANT REFERENCE SECTIONS:\n\n{sections}"
+
+def _build_system_prompt(components_context: str):
+    """Static system prompt for component generation"""
+    return f"""You are an expert visual UI designer that transforms complex information into beautifully digestible FastHTML/MonsterUI components.
+
+This UI component should directly address or visualize the user's request (e.g., if they ask for "weather", create a weather card UI).
+The generated UI should be visually appealing, creative where it makes sense for visualizations, modern, and functional, and add animations where it makes sense, i.e. for a weather app you may animate rainfall.
+For any UI you generate that might need an API key, i.e. weather, just simulate the effect, we do not need these to be wired up.
+If generating UI is not appropriate for the user's query, or if you are unable to fulfill the UI request, you may respond with a polite text message explaining why.
+
+# COMPONENT REFERENCE:
+{components_context}
+
+🎯 MISSION: Transform the user's request into a visually rich, interactive component that makes complex concepts easy to understand and engage with.
+
+📋 DESIGN PRINCIPLES:
+• Visual Hierarchy: Use clear headings, spacing, and typography to guide the eye
+• Information Architecture: Break complex data into scannable chunks using cards, grids, and sections
+• Progressive Disclosure: Use accordions, tabs, and collapsible sections for deep content
+• Visual Cues: Employ icons, colors, badges, and visual indicators to communicate meaning instantly
+• Cognitive Load Reduction: Present information in bite-sized, organized pieces
+• Interactive Elements: Make content explorable with hover states, expandable sections, and clear navigation
+• Use MonsterUI components for the best user experience
+• Use TailwindCSS for styling
+
+🎨 COMPONENT SELECTION GUIDE:
+
+For EXPLANATIONS/CONCEPTS → Use Accordion with expandable sections, each with icons and clear headings
+For PROCESSES/TUTORIALS → Use Steps with visual progression indicators and detailed descriptions
+For COMPARISONS → Use side-by-side cards or tables with clear visual differentiators
+For DATA/STATISTICS → Use ApexChart(opts={...}) with proper options object, Progress components for percentages
+For TIMELINES/HISTORY → Use Steps (vertical) or timeline cards with dates prominently displayed
+For FORMS/INPUT → Use well-structured forms with clear labels and validation hints
+For LISTS/CATALOGS → Use Grid with cards containing images, titles, and key info
+For COMPLEX INFO → Use tabbed interfaces or accordion patterns
+
+🚀 TECHNICAL REQUIREMENTS:
+1. Output ONLY a single FastHTML/MonsterUI component expression
+2. NO imports, app setup, routes, or serve() calls
+3. Use rich styling with DaisyUI and TailwindCSS classes (cards, shadows, gradients, spacing)
+4. Include visual elements: UkIcon, DiceBearAvatar, PicSumImg where appropriate
+5. Make it responsive with proper Grid columns and spacing
+6. Use semantic colors and typography for better readability
+
+⚠️ CRITICAL COMPONENT USAGE - AVOID THESE ERRORS:
+
+❌ WRONG: ApexChart() - Missing required 'opts' parameter
+✅ CORRECT: ApexChart(opts={{"chart": {{"type": "bar"}}, "series": [{{"name": "Data", "data": [10, 20, 30]}}]}})
+
+❌ WRONG: Badge("text") - Badge doesn't exist in FastHTML/MonsterUI
+✅ CORRECT: Use Alert, Span with classes, or UkIcon for badges/indicators
+
+❌ WRONG: Card(H3("Title"), P("Content")) - Wrong Card syntax
+✅ CORRECT: Card(cls="p-4")(H3("Title"), P("Content"))
+
+
+COMPONENT SYNTAX RULES:
+• ApexChart: ALWAYS include opts parameter with chart config
+• Cards: Use Card(cls="...")(content) format
+• Badges/Labels: Use Alert, Span + classes, or colored Div
+• Charts: Only ApexChart exists, requires opts={{"chart": {{...}}, "series": [...]}}
+• Icons: UkIcon("icon-name", width, height) format
+• Progress: Progress(value=X, max=100) format
+• No Badge component exists - use alternatives
+
+🌟 ELEVATED EXAMPLES:
+
+User: "Explain photosynthesis"
+Output:
+Div(cls="max-w-4xl mx-auto p-6")(
+    Div(cls="text-center mb-8")(
+        UkIcon("sun", 48, 48, cls="text-yellow-500 mb-4"),
+        H1("Photosynthesis", cls="text-4xl font-bold text-green-700 mb-2"),
+        P("How plants convert sunlight into energy", cls="text-xl text-gray-600")
+    ),
+    Accordion(
+        AccordionItem(
+            Div(UkIcon("lightbulb", 20, 20), "What is Photosynthesis?", cls="flex items-center gap-3"),
+            Div(cls="p-4 bg-green-50 rounded-lg")(
+                P("The process by which plants use sunlight, water, and carbon dioxide to create glucose and oxygen."),
+                Div(cls="mt-4 p-3 bg-white rounded border-l-4 border-green-500")(
+                    Strong("Formula: "), CodeSpan("6CO₂ + 6H₂O + light energy → C₆H₁₂O₆ + 6O₂")
+                )
+            )
+        ),
+        AccordionItem(
+            Div(UkIcon("settings", 20, 20), "The Process", cls="flex items-center gap-3"),
+            Steps(
+                LiStep("Light Absorption", cls=StepT.success, data_content="1"),
+                LiStep("Water Splitting", cls=StepT.info, data_content="2"),
+                LiStep("CO₂ Fixation", cls=StepT.warning, data_content="3"),
+                LiStep("Glucose Production", cls=StepT.primary, data_content="4"),
+                cls=StepsT.vertical
+            )
+        ),
+        AccordionItem(
+            Div(UkIcon("activity", 20, 20), "Importance", cls="flex items-center gap-3"),
+            Grid(
+                Card(H4("🌍 Global Impact"), P("Produces 70% of Earth's oxygen"), cls="bg-blue-50 p-4"),
+                Card(H4("🍃 Plant Growth"), P("Creates energy for all plant functions"), cls="bg-green-50 p-4"),
+                Card(H4("🔋 Energy Storage"), P("Forms the base of food chains"), cls="bg-yellow-50 p-4"),
+                cols=3
+            )
+        )
+    )
+)
+
+User: "Compare Python vs JavaScript"
+Output:
+Div(cls="max-w-6xl mx-auto p-6")(
+    H1("Python vs JavaScript", cls="text-3xl font-bold text-center mb-8"),
+    Grid(
+        Card(cls="bg-blue-50 border-2 border-blue-200 p-6")(
+            Div(cls="flex items-center gap-3 mb-4")(
+                UkIcon("code", 32, 32, cls="text-blue-600"),
+                H2("Python", cls="text-2xl font-bold text-blue-800")
+            ),
+            Div(cls="space-y-4")(
+                Div(cls="flex items-center gap-2 text-green-600")(
+                    UkIcon("check", 16, 16), Strong("Easy to learn")
+                ),
+                Div(cls="flex items-center gap-2 text-green-600")(
+                    UkIcon("check", 16, 16), Strong("Great for data science")
+                )
+            ),
+            Alert("Best for: AI, Data Science, Backend", cls=AlertT.info)
+        ),
+        Card(cls="bg-yellow-50 border-2 border-yellow-200 p-6")(
+            Div(cls="flex items-center gap-3 mb-4")(
+                UkIcon("globe", 32, 32, cls="text-yellow-600"),
+                H2("JavaScript", cls="text-2xl font-bold text-yellow-800")
+            ),
+            Div(cls="space-y-4")(
+                Div(cls="flex items-center gap-2 text-green-600")(
+                    UkIcon("check", 16, 16), Strong("Runs everywhere")
+                ),
+                Div(cls="flex items-center gap-2 text-green-600")(
+                    UkIcon("check", 16, 16), Strong("Interactive UIs")
+                )
+            ),
+            Alert("Best for: Web Development, Mobile Apps", cls=AlertT.warning)
+        ),
+        cols=2
+    )
+)
+
+User: "Show sales data chart"
+Output:
+Div(cls="max-w-4xl mx-auto p-6")(
+    H2("Sales Performance", cls="text-2xl font-bold mb-6"),
+    ApexChart(opts={{
+        "chart": {{"type": "line", "height": 350}},
+        "series": [{{"name": "Sales", "data": [30, 40, 35, 50, 49, 60, 70, 91, 125]}}],
+        "xaxis": {{"categories": ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep"]}},
+        "stroke": {{"curve": "smooth"}},
+        "title": {{"text": "Monthly Sales Trends"}}
+    }})
+)
+
+DO NOT create endpoints, routes, or serve() calls. ONLY return the FastHTML/MonsterUI component code.
+Now create a visually stunning, information-rich component for the user's request."""
+
+
+def _build_tree_prompt(components_context: str):
+    """Static system prompt for tree mode: the component comes back as JSON through the render_component tool"""
+    return f"""You are an expert visual UI designer that transforms complex information into beautifully digestible FastHTML/MonsterUI components.
+
+This UI component should directly address or visualize the user's request (e.g., if they ask for "weather", create a weather card UI).
+The generated UI should be visually appealing, modern and functional. For any UI that might need an API key, just simulate the effect.
+
+# COMPONENT REFERENCE:
+{components_context}
+
+📐 OUTPUT FORMAT:
+Call the render_component tool with the component as a JSON tree instead of writing code.
+A node is either text or {{"type": "<Component>", "props": {{...}}, "children": [...]}}, and
+Component(*children, **props) in the reference becomes {{"type": "Component", "props": props, "children": children}}.
+• children are the positional arguments: child nodes, text or numbers (UkIcon: ["sun", 24, 24])
+• props are the keyword arguments; enum values are written as strings ("cls": "ButtonT.primary")
+• a prop can be a node too ("header": {{"type": "H3", "children": ["Title"]}})
+• ApexChart takes its options in props.opts, there is no Badge (use Span with cls "badge badge-primary")
+
+Example for "Show sales data":
+{{"root": {{"type": "Div", "props": {{"cls": "max-w-4xl mx-auto p-6"}}, "children": [
+  {{"type": "H2", "props": {{"cls": "text-2xl font-bold mb-6"}}, "children": ["Sales Performance"]}},
+  {{"type": "Grid", "props": {{"cols": 2}}, "children": [
+    {{"type": "Card", "children": [{{"type": "UkIcon", "children": ["trending-up", 24, 24]}}, {{"type": "P", "children": ["Revenue up 12%"]}}]}},
+    {{"type": "Card", "children": [{{"type": "Alert", "props": {{"cls": "AlertT.info"}}, "children": ["Best month: September"]}}]}}
+  ]}},
+  {{"type": "ApexChart", "props": {{"opts": {{"chart": {{"type": "line", "height": 350}},
+    "series": [{{"name": "Sales", "data": [30, 40, 35, 50, 49, 60, 70, 91, 125]}}],
+    "xaxis": {{"categories": ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep"]}}}}}}}}
+]}}}}
+
+Use Accordion, Steps, Grid, Card, Table and ApexChart the way the reference shows, with rich
+DaisyUI/TailwindCSS classes. If UI is not appropriate for the request, reply with plain text instead."""
+
+
+def _build_fix_prompt(components_context: str):
+    """Static prefix of the error-fixing prompt; the request specific part goes in a separate message"""
+    return f"""You are an expert FastHTML/MonsterUI developer. Fix the error in the generated code.
+
+# COMPONENT REFERENCE:
+{components_context}
+
+Please fix the error and return ONLY the corrected FastHTML/MonsterUI component code. Common fixes:
+
+CRITICAL FIXES:
+- ApexChart MUST have opts parameter: ApexChart(opts={{"chart": {{"type": "bar"}}, "series": [...]}})
+- Badge component does NOT exist - use Alert, Span with classes, or colored Div instead
+- Card syntax: Card(cls="...")(content) not Card(content, cls="...")
+- Button cls error: Never pass cls as both positional and keyword - use Button("Text", cls=ButtonT.primary)
+- Duplicate cls error: Never pass cls parameter twice - merge into single cls="class1 class2"
+- Assignment in expression: Don't use = in expressions - use separate variables or data attributes
+- Footer cls error: Footer() doesn't accept cls parameter - use standard HTML Footer(*content)
+- Progress needs value/max: Progress(value=75, max=100)
+- UkIcon needs width/height: UkIcon("name", 16, 16)
+
+SYNTAX FIXES:
+- Check parentheses, brackets, and quotes are properly matched
+- Ensure proper component parameters and structure
+- Use correct DaisyUI/TailwindCSS class names"""
+
+
+FIX_REQUEST_TEMPLATE = """ORIGINAL REQUEST: {original_msg}
+
+GENERATED CODE THAT FAILED:
+```
+{failed_code}
+```
+
+ERROR MESSAGE: {error_message}
+
+Return ONLY the fixed component code:"""
+
+TREE_FIX_TEMPLATE = """The component tree could not be rendered:
+{error_message}
+
+Call render_component again with the corrected tree."""
+
+EDIT_INSTRUCTIONS = """Your last answer above is the component the user is looking at.
+If the user asks to change it, reply ONLY with SEARCH/REPLACE blocks that edit it. Copy each SEARCH part exactly from the component, and keep it short but unique:
+
+<<<<<<< SEARCH
+    P("Produces 70% of Earth's oxygen"),
+=======
+    P("Produces 70% of Earth's oxygen", cls="text-lg font-bold"),
+    P("Home to 230,000 known species"),
+>>>>>>> REPLACE
+
+Use several blocks for changes in several places. If the user asks for something new, answer with a complete new component as usual."""
+
+# Prompt name -> (builder, context file it is built from)
+PROMPT_BUILDERS = {
+    "system": (_build_system_prompt, COMPONENTS_CONTEXT),
+    "fix": (_build_fix_prompt, COMPONENTS_CONTEXT),
+    "tree": (_build_tree_prompt, COMPONENTS_CONTEXT),
+}
+
+
+def _mtime(path: str):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class PromptRegistry:
+    """Loads the context files once and keeps the compiled prompts until a file changes on disk.
+
+    Compiled prompts are plain strings that stay byte-identical between requests, so
+    provider-side prompt caching can reuse the shared prefix.
+    """
+
+    def __init__(self, base_dir: str = None, check_interval: float = PROMPT_RELOAD_CHECK_SECONDS,
+                 retrieval_files: list[str] = RETRIEVAL_FILES if RETRIEVAL_ENABLED else None):
+        self.base_dir = base_dir or os.path.dirname(os.path.abspath(__file__))
+        self.check_interval = check_interval
+        self.retrieval_files = retrieval_files
+        self.version = ""
+        self._contexts = {}  # file name -> (mtime, text)
+        self._prompts = {}   # prompt name -> compiled text
+        self._index = None   # ContextIndex over the retrieval files
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def _path(self, name: str):
+        return os.path.join(self.base_dir, name)
+
+    def _read(self, name: str):
+        path = self._path(name)
+        mtime = _mtime(path)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except FileNotFoundError:
+            text = CONTEXT_NOT_FOUND
+        self._contexts[name] = (mtime, text)
+        return text
+
+    def _stale(self):
+        """Names of loaded context files whose mtime changed since they were read"""
+        return [name for name, (mtime, _) in self._contexts.items() if _mtime(self._path(name)) != mtime]
+
+    def _text(self, name: str):
+        if name not in self._contexts:
+            self._read(name)
+        return self._contexts[name][1]
+
+    def _build_index(self):
+        """Index the retrieval files, returning the pinned components sections that stay in the prompts"""
+        start_time = time.perf_counter()
+        pinned, chunks = [], []
+        for name in self.retrieval_files:
+            for chunk in chunk_reference(name, self._text(name)):
+                is_pinned = name == COMPONENTS_CONTEXT and chunk.title.split(' › ')[-1] in PINNED_SECTIONS
+                (pinned if is_pinned else chunks).append(chunk)
+        self._index = ContextIndex(chunks)
+        print(f"📚 Indexed {len(self._index.chunks)} reference sections in {(time.perf_counter() - start_time) * 1000:.0f}ms")
+        return '\n\n'.join(chunk.render() for chunk in pinned) + '\n\n' + RETRIEVAL_NOTE
+
+    def _compile(self):
+        digest = hashlib.sha256()
+        pinned_context = None
+        if self.retrieval_files:
+            pinned_context = self._build_index()
+            for name in self.retrieval_files:
+                digest.update(self._text(name).encode('utf-8'))
+
+        prompts = {}
+        for prompt_name, (builder, context_name) in PROMPT_BUILDERS.items():
+            context = pinned_context if pinned_context and context_name == COMPONENTS_CONTEXT else self._text(context_name)
+            prompts[prompt_name] = builder(context)
+        for prompt_name in sorted(prompts):
+            digest.update(prompts[prompt_name].encode('utf-8'))
+        self._prompts = prompts
+        self.version = digest.hexdigest()[:12]
+
+    def refresh(self, force: bool = False):
+        """Recompile the prompts if a context file changed (checked at most every `check_interval` seconds)"""
+        now = time.monotonic()
+        if not force and self._prompts and now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            self._last_check = now
+            stale = list(self._contexts) if force else self._stale()
+            for name in stale:
+                self._read(name)
+            if stale or not self._prompts:
+                self._compile()
+                if stale:
+                    print(f"🔁 Reloaded prompt context: {', '.join(stale)} (version {self.version})")
+
+    def preload(self):
+        """Load all context files and compile the prompts, meant to be called once at startup"""
+        self.refresh(force=True)
+        return self
+
+    def _reference_messages(self, query: str, names: list[str] = ()):
+        """The reference sections retrieved for `query` as a system message (none without an index)"""
+        index = self._index
+        if index is None:
+            return []
+        chunks = index.select(query, names)
+        if not chunks:
+            return []
+        sections = '\n\n'.join(chunk.render() for chunk in chunks)
+        return [{"role": "system", "content": REFERENCE_TEMPLATE.format(sections=sections)}]
+
+    def system_messages(self, query: str, prompt: str = "system"):
+        """The cached system prompt (or the `prompt` named, e.g. "tree") followed by the reference sections relevant to `query`"""
+        self.refresh()
+        return [{"role": "system", "content": self._prompts[prompt]}, *self._reference_messages(query)]
+
+    def fix_messages(self, original_msg: str, failed_code: str, error_message: str):
+        """Messages for an error-fixing request: the cached static prefix followed by the request details.
+
+        The reference sections are looked up by the components named in the error message and
+        the identifiers of the failed code it mentions, not its prose; without any (e.g. a syntax
+        error), by the components the failed code uses.
+        """
+        self.refresh()
+        query = " ".join(code_identifiers(error_message, failed_code))
+        names = self._index.names_in(error_message) if self._index else []
+        if self._index and not names:
+            query += "\n" + " ".join(self._index.names_in(failed_code))
+        return [
+            {"role": "system", "content": self._prompts["fix"]},
+            *self._reference_messages(query, names),
+            {"role": "user", "content": FIX_REQUEST_TEMPLATE.format(
+                original_msg=original_msg, failed_code=failed_code, error_message=error_message)},
+        ]
+
+    def tree_fix_messages(self, messages: list, payload: str, error_message: str):
+        """The generation messages followed by the invalid tree and what is wrong with it"""
+        return [
+            *messages,
+            {"role": "assistant", "content": payload},
+            {"role": "user", "content": TREE_FIX_TEMPLATE.format(error_message=error_message)},
+        ]
+
+    def edit_history(self, history: list[dict], source: str):
+        """`history` with the model's last turn showing the source of its component, and the
+        instructions for editing it before the user's request"""
+        return [
+            *history[:-2],
+            {"role": "assistant", "content": f"```\n{source}\n```"},
+            {"role": "system", "content": EDIT_INSTRUCTIONS},
+            history[-1],
+        ]
+
+
+prompt_registry = PromptRegistry()
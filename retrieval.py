@@ -0,0 +1,183 @@
+import re
+import math
+import heapq
+from collections import Counter
+from conversations import estimate_tokens
+from config import RETRIEVAL_TOP_K, RETRIEVAL_TOKEN_BUDGET, RETRIEVAL_CHUNK_CHARS
+
+_HEADING_RE = re.compile(r'(#{1,4}) +(.+?)(?: +#+)?')
+# Lines of (unfenced) example code, whose comments look like headings
+_CODE_LINE_RE = re.compile(r'\s*(?:#|@|(?:def|class|from|import|return) |[A-Za-z_][\w.]*(?:\[[^\]]*\])? *(?:=|\())')
+# llms.txt structure: <project>, <docs>/<api>/<examples>/<optional> wrappers and <doc title="..."> documents
+_DOC_RE = re.compile(r'<doc title="([^"]*)"[^>]*>')
+_WRAPPER_RE = re.compile(r'</?(?:project|docs|api(?: reference)?|examples|optional|doc)\b[^>]*>')
+# API entries of the generated references: "- `def Card(*c, **kwargs)`" / "- `class ButtonT(Enum)`"
+_ENTRY_RE = re.compile(r'- `(?:def|class) +([A-Za-z_]\w*)')
+_IDENT_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*|\d+')
+_PART_RE = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+')
+_STOPWORDS = frozenset("""a an and are as at be by can do for from how i in is it me my of on or please
+should show so that the this to use using want what when with you your""".split())
+
+def tokenize(text: str):
+    """Lowercased terms; identifiers also contribute their camel-case and snake_case parts"""
+    terms = []
+    for word in _IDENT_RE.findall(text):
+        lowered = word.lower()
+        if lowered not in _STOPWORDS:
+            terms.append(lowered)
+        parts = _PART_RE.findall(word)
+        if len(parts) > 1:
+            terms.extend(p.lower() for p in parts if p.lower() not in _STOPWORDS)
+    return terms
+
+def code_identifiers(text: str, code: str):
+    """Identifiers of `text` (e.g. an error message) that occur in `code`, in order of appearance"""
+    known = set(_IDENT_RE.findall(code))
+    found = []
+    for word in _IDENT_RE.findall(text):
+        if word in known and not word.isdigit() and word not in found:
+            found.append(word)
+    return found
+
+class Chunk:
+    """One section of a reference file, or a single component entry of an API listing"""
+
+    def __init__(self, source, title, text, name=None):
+        self.source = source
+        self.title = title
+        self.text = text
+        self.name = name
+        self.tokens = estimate_tokens(text)
+
+    def render(self):
+        return f"### {self.title}\n{self.text}"
+
+def _split_long(lines: list[str], max_chars: int):
+    """Split a section at blank lines outside code fences once a piece exceeds `max_chars`,
+    and at any line outside a fence (e.g. inside a long table) past twice that"""
+    pieces, current, size, in_fence = [], [], 0, False
+    for line in lines:
+        if line.lstrip().startswith('```'):
+            in_fence = not in_fence
+        blank = not line.strip()
+        if not in_fence and (blank and size > max_chars or size > 2 * max_chars):
+            pieces.append(current)
+            current, size = [], 0
+            if blank:
+                continue
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        pieces.append(current)
+    return pieces
+
+def chunk_reference(source: str, text: str, max_chars: int = RETRIEVAL_CHUNK_CHARS):
+    """Chunks of a reference file, split at markdown headings and at API entries"""
+    chunks = []
+    headings = []  # (level, title) of the enclosing sections
+    title, name, lines = source, None, []
+    in_fence = False
+
+    def flush():
+        for piece in _split_long(lines, max_chars):
+            body = '\n'.join(piece).strip()
+            if body:
+                chunks.append(Chunk(source, title, body, name))
+
+    # Put every <doc title="..."> on its own line as a top level heading, drop the wrapper tags
+    text = _DOC_RE.sub(lambda m: f"\n\n# {m.group(1)}\n\n", text)
+    text = _WRAPPER_RE.sub("\n", text)
+    all_lines = text.splitlines()
+    for i, line in enumerate(all_lines):
+        if line.lstrip().startswith('```'):
+            in_fence = not in_fence
+        # A heading follows a blank line (or a code block) and is not followed by code;
+        # other `#` lines are comments of example code outside a fence
+        heading = None
+        if (not in_fence and (i == 0 or not all_lines[i - 1].strip() or all_lines[i - 1].lstrip().startswith('```'))
+                and (i + 1 == len(all_lines) or not _CODE_LINE_RE.match(all_lines[i + 1]))):
+            heading = _HEADING_RE.fullmatch(line)
+        entry = None if in_fence or heading else _ENTRY_RE.match(line)
+        if heading:
+            flush()
+            level = len(heading.group(1))
+            headings = [h for h in headings if h[0] < level] + [(level, heading.group(2).strip())]
+            title, name, lines = ' › '.join(h[1] for h in headings), None, []
+        elif entry:
+            flush()
+            section = ' › '.join(h[1] for h in headings) or source
+            name = entry.group(1)
+            title, lines = f"{section} › {name}", [line]
+        else:
+            lines.append(line)
+    flush()
+    return chunks
+
+class ContextIndex:
+    """BM25 index over reference chunks, built once and queried per request"""
+
+    def __init__(self, chunks: list[Chunk], k1: float = 1.5, b: float = 0.75):
+        # The same entry often appears in several reference files, keep the first copy
+        seen, unique = set(), []
+        for chunk in chunks:
+            key = ' '.join(chunk.text.split())
+            if key not in seen:
+                seen.add(key)
+                unique.append(chunk)
+        self.chunks = unique
+        self.k1 = k1
+        self.b = b
+
+        self._postings = {}  # term -> [(chunk index, term frequency)]
+        self._lengths = []
+        self._by_name = {}   # component name -> chunk indices
+        for i, chunk in enumerate(self.chunks):
+            terms = Counter(tokenize(f"{chunk.title}\n{chunk.text}"))
+            self._lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self._postings.setdefault(term, []).append((i, tf))
+            if chunk.name:
+                self._by_name.setdefault(chunk.name, []).append(i)
+        count = len(self.chunks)
+        self._avg_length = sum(self._lengths) / count if count else 0.0
+        self._idf = {term: math.log(1 + (count - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self._postings.items()}
+
+    @classmethod
+    def from_texts(cls, texts: dict[str, str], max_chars: int = RETRIEVAL_CHUNK_CHARS):
+        """Index of {source name: text}"""
+        chunks = []
+        for source, text in texts.items():
+            chunks.extend(chunk_reference(source, text, max_chars))
+        return cls(chunks)
+
+    def names_in(self, text: str):
+        """Indexed component names mentioned in `text`, in order of appearance"""
+        names = []
+        for word in _IDENT_RE.findall(text):
+            if word in self._by_name and word not in names:
+                names.append(word)
+        return names
+
+    def search(self, query: str, k: int = RETRIEVAL_TOP_K):
+        """The `k` best (score, chunk) pairs for `query`"""
+        scores = Counter()
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self._postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[i] / self._avg_length)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return [(score, self.chunks[i]) for i, score in heapq.nlargest(k, scores.items(), key=lambda item: item[1])]
+
+    def select(self, query: str, names: list[str] = (), k: int = RETRIEVAL_TOP_K, budget: int = RETRIEVAL_TOKEN_BUDGET):
+        """Chunks for the prompt: the entries of `names` first, then the top-k matches, within `budget` tokens"""
+        candidates = [self.chunks[i] for name in names for i in self._by_name.get(name, ())]
+        candidates.extend(chunk for _, chunk in self.search(query, k))
+        selected, used = [], 0
+        for chunk in candidates:
+            if chunk in selected or used + chunk.tokens > budget:
+                continue
+            selected.append(chunk)
+            used += chunk.tokens
+        return selected
@@ -0,0 +1,187 @@
+import re
+import time
+import asyncio
+from collections import deque
+from client import get_completion_async, get_completion_stream
+from metrics import HEDGED_REQUESTS, ROUTED_REQUESTS
+from config import (MODEL_NAME, FALLBACK_MODELS, FAST_MODEL, SIMPLE_REQUEST_MAX_CHARS, HEDGE_ENABLED, HEDGE_PERCENTILE,
+                    HEDGE_DEFAULT_DELAY, HEDGE_MIN_DELAY, HEDGE_MAX_DELAY, ROUTER_WINDOW_SECONDS, ROUTER_MAX_SAMPLES,
+                    ROUTER_MIN_SAMPLES, ROUTER_MAX_FAILURE_RATE)
+
+# Requests mentioning any of these need the primary model even when they are short
+_ELABORATE_RE = re.compile(r'''\b(?:chart|graph|plot|dashboard|table|form|timeline|compare|comparison|calculator|
+    data|analytics|kanban|calendar|map|game|quiz|wizard|steps|interactive|simulat\w*|visuali[sz]\w*)s?\b''', re.I | re.X)
+
+def is_simple_request(message: str, first_turn: bool = True):
+    """Whether a chat message can be answered by the fast model: a short first message asking for nothing elaborate"""
+    return first_turn and len(message) <= SIMPLE_REQUEST_MAX_CHARS and not _ELABORATE_RE.search(message)
+
+def _quantile(values: list, q: float):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+class ModelStats:
+    """Outcome and latency of a model's calls over the last `window` seconds"""
+
+    def __init__(self, window: float = ROUTER_WINDOW_SECONDS, max_samples: int = ROUTER_MAX_SAMPLES):
+        self.window = window
+        self._samples = deque(maxlen=max_samples)  # (finished at, ok, ttft, seconds)
+
+    def record(self, ok, ttft: float = None, seconds: float = None):
+        """Add a call; `ok` is None for a call cancelled before it answered, which only counts as a latency lower bound"""
+        self._samples.append((time.monotonic(), ok, ttft, seconds))
+
+    def _recent(self):
+        cutoff = time.monotonic() - self.window
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return self._samples
+
+    def failure_rate(self):
+        outcomes = [ok for _, ok, _, _ in self._recent() if ok is not None]
+        if len(outcomes) < ROUTER_MIN_SAMPLES:
+            return 0.0
+        return outcomes.count(False) / len(outcomes)
+
+    def latency(self, q: float, field: str = "ttft"):
+        """The q-quantile of time to first token ("ttft") or completion time ("seconds"), None without enough samples"""
+        index = 2 if field == "ttft" else 3
+        values = [sample[index] for sample in self._recent() if sample[index] is not None]
+        return _quantile(values, q) if len(values) >= ROUTER_MIN_SAMPLES else None
+
+class _Attempt:
+    """One in-flight request of a race: a completion, or the first chunk of a stream"""
+
+    def __init__(self, model: str, first, stream=None):
+        self.model = model
+        self.stream = stream
+        self.started = time.perf_counter()
+        self.task = asyncio.ensure_future(first)
+
+    async def cancel(self):
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        if self.stream is not None:
+            try:
+                await self.stream.aclose()
+            except Exception:
+                pass
+
+class ModelRouter:
+    """Picks the model for a generation and hedges slow calls with a duplicate to a fallback model"""
+
+    def __init__(self, primary: str = MODEL_NAME, fallbacks: list[str] = FALLBACK_MODELS, fast_model: str = FAST_MODEL,
+                 hedge: bool = HEDGE_ENABLED):
+        self.primary = primary
+        self.fallbacks = [m for m in fallbacks if m != primary]
+        self.fast_model = fast_model
+        self.hedge = hedge
+        self._stats = {}
+
+    def stats(self, model: str):
+        if model not in self._stats:
+            self._stats[model] = ModelStats()
+        return self._stats[model]
+
+    def _healthy(self, model: str):
+        return self.stats(model).failure_rate() <= ROUTER_MAX_FAILURE_RATE
+
+    def choose(self, message: str = "", first_turn: bool = False):
+        """Model for a generation: the fast model for simple requests, else the primary, skipping failing models"""
+        if self.fast_model and is_simple_request(message, first_turn) and self._healthy(self.fast_model):
+            model, reason = self.fast_model, "simple"
+        elif self._healthy(self.primary) or not self.fallbacks:
+            model, reason = self.primary, "primary"
+        else:
+            model, reason = self.fallback_for(self.primary) or self.primary, "unhealthy"
+        ROUTED_REQUESTS.inc(model=model, reason=reason)
+        return model
+
+    def fallback_for(self, model: str, field: str = "ttft"):
+        """The healthy fallback with the lowest median latency (configuration order until measured), or None"""
+        candidates = [m for m in [self.primary, *self.fallbacks] if m != model and self._healthy(m)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda m: self.stats(m).latency(0.5, field) or HEDGE_DEFAULT_DELAY)
+
+    def hedge_delay(self, model: str, field: str = "ttft"):
+        """Seconds to wait for `model` before hedging: its p95 latency, clamped"""
+        p95 = self.stats(model).latency(HEDGE_PERCENTILE, field)
+        if p95 is None:
+            return HEDGE_DEFAULT_DELAY
+        return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, p95))
+
+    async def _race(self, start, model: str, field: str):
+        """The first attempt to succeed, started with `start(model)`.
+
+        A second attempt on the fallback model starts once the first has taken longer than
+        its hedge delay, or right away if it fails. The loser is cancelled.
+        """
+        attempts = [start(model)]
+        fallback = self.fallback_for(model, field) if self.hedge else None
+        deadline = time.perf_counter() + self.hedge_delay(model, field)
+        reason, error = None, None
+        try:
+            while attempts:
+                timeout = None if reason or not fallback else max(0.0, deadline - time.perf_counter())
+                done, _ = await asyncio.wait([a.task for a in attempts], timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for attempt in [a for a in attempts if a.task in done]:
+                    attempts.remove(attempt)
+                    if attempt.task.exception() is None:
+                        if reason:
+                            HEDGED_REQUESTS.inc(reason=reason, winner="hedge" if attempt.model == fallback else "primary")
+                        return attempt
+                    error = attempt.task.exception()
+                    self.stats(attempt.model).record(False)
+                    print(f"⚠️ {attempt.model} failed: {error}")
+                if not reason and fallback and (not done or not attempts):
+                    reason = "slow" if not done else "failed"
+                    print(f"🔀 Hedging {model} ({reason}) with {fallback}")
+                    attempts.append(start(fallback))
+            if reason:
+                HEDGED_REQUESTS.inc(reason=reason, winner="none")
+            raise error
+        finally:
+            for attempt in attempts:
+                # Cancelled while still waiting: its latency is at least the time it took so far
+                self.stats(attempt.model).record(None, **{field: time.perf_counter() - attempt.started})
+                await attempt.cancel()
+
+    async def complete(self, client, messages: list, message: str = "", first_turn: bool = False, temperature: float = 0.7,
+                       tools=None):
+        """Hedged completion; the result also names the model that produced it"""
+        model = self.choose(message, first_turn)
+        start = lambda m: _Attempt(m, get_completion_async(client, messages, tools, model=m, temperature=temperature))
+        attempt = await self._race(start, model, "seconds")
+        self.stats(attempt.model).record(True, seconds=time.perf_counter() - attempt.started)
+        return {**attempt.task.result(), "model": attempt.model}
+
+    async def stream(self, client, messages: list, message: str = "", first_turn: bool = False, tools=None):
+        """Hedged streamed completion: chunks of the first model to produce a token. The final
+        {"tokens": usage} chunk also names the model."""
+        model = self.choose(message, first_turn)
+
+        def start(m):
+            stream = get_completion_stream(client, messages, tools, model=m)
+            return _Attempt(m, stream.__anext__(), stream)
+
+        attempt = await self._race(start, model, "ttft")
+        ttft = time.perf_counter() - attempt.started
+        try:
+            chunk = attempt.task.result()
+            while True:
+                if "tokens" in chunk:
+                    chunk = {**chunk, "model": attempt.model}
+                yield chunk
+                chunk = await attempt.stream.__anext__()
+        except StopAsyncIteration:
+            self.stats(attempt.model).record(True, ttft=ttft, seconds=time.perf_counter() - attempt.started)
+        except Exception:
+            self.stats(attempt.model).record(False)
+            raise
+        finally:
+            await attempt.stream.aclose()
+
+
+model_router = ModelRouter()
@@ -0,0 +1,225 @@
+import asyncio
+import multiprocessing as mp
+from config import SANDBOX_WORKERS, SANDBOX_TIMEOUT, SANDBOX_MEMORY_MB, SANDBOX_MAX_TASKS
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Seconds a new worker may take to import its dependencies
+WORKER_START_TIMEOUT = 60
+
+class SandboxError(Exception):
+    """Generated code failed inside a sandbox worker"""
+
+class SandboxTimeout(SandboxError):
+    """Generated code ran past the wall-clock limit"""
+
+def _worker_main(conn, memory_mb):
+    """Worker loop: receive (kind, code), reply with ('ok' | 'error' | 'fatal', result or error message).
+
+    The result of a 'component' is (html, stage timings), of a 'partial' the html or None.
+    """
+    if resource is not None and memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    # Already imported in the forkserver, so this is free
+    from components import execute_to_html, render_partial_component, to_html
+    conn.send(('ready', None))
+
+    while True:
+        try:
+            kind, code_text = conn.recv()
+        except EOFError:
+            return
+        try:
+            if kind == 'partial':
+                component = render_partial_component(code_text)
+                conn.send(('ok', None if component is None else to_html(component)))
+            else:
+                spans = {}
+                html = execute_to_html(code_text, spans)
+                conn.send(('ok', (html, spans)))
+        except MemoryError:
+            # The heap may be fragmented or exhausted, let the pool replace this worker
+            conn.send(('fatal', f"MemoryError: component exceeded the {memory_mb} MB memory limit"))
+            return
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+
+def _context():
+    # forkserver keeps a warm process with fasthtml/monsterui imported to fork workers from
+    if 'forkserver' in mp.get_all_start_methods():
+        ctx = mp.get_context('forkserver')
+        ctx.set_forkserver_preload(['components'])
+        return ctx
+    return mp.get_context('spawn')
+
+class _Worker:
+    def __init__(self, ctx, memory_mb):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, memory_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+        self.broken = False
+
+    def wait_ready(self, timeout):
+        """Block until the worker finished bootstrapping, so its first task is not slowed down"""
+        if not self.conn.poll(timeout):
+            raise SandboxError("Sandbox worker did not start in time")
+        self.conn.recv()
+        return self
+
+    def run(self, kind, code_text, timeout):
+        """Blocking round trip to the worker; returns the reply or raises SandboxError"""
+        self.tasks += 1
+        try:
+            self.conn.send((kind, code_text))
+            if not self.conn.poll(timeout):
+                self.broken = True
+                raise SandboxTimeout(f"Component took longer than {timeout:g}s to render")
+            status, payload = self.conn.recv()
+        except (EOFError, OSError):
+            self.broken = True
+            self.process.join(1)
+            raise SandboxError(f"Sandbox worker crashed (exit code {self.process.exitcode})")
+        if status != 'ok':
+            self.broken = status == 'fatal'
+            raise SandboxError(payload)
+        return payload
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+
+class SandboxPool:
+    """Pre-warmed pool of worker processes that execute generated components and return HTML.
+
+    Each call has a wall-clock timeout and workers run under a memory rlimit. Workers that
+    time out, crash or have served SANDBOX_MAX_TASKS calls are replaced.
+    """
+
+    def __init__(self, size: int = SANDBOX_WORKERS, timeout: float = SANDBOX_TIMEOUT,
+                 memory_mb: int = SANDBOX_MEMORY_MB, max_tasks: int = SANDBOX_MAX_TASKS):
+        self.size = size
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.max_tasks = max_tasks
+        self.recycled = 0
+        self._ctx = None
+        self._idle = None
+        self._workers = []
+        self._starting = None
+
+    async def start(self):
+        """Start the worker processes (call once the event loop is running)"""
+        if self._idle is not None:
+            return
+        if self._starting is None:
+            self._starting = asyncio.Lock()
+        async with self._starting:
+            if self._idle is not None:
+                return
+            self._ctx = _context()
+            self._workers = await asyncio.to_thread(self._spawn_all)
+            self._idle = asyncio.Queue()
+            for worker in self._workers:
+                self._idle.put_nowait(worker)
+        print(f"🧱 Sandbox pool ready: {self.size} workers, {self.timeout:g}s timeout, {self.memory_mb} MB limit")
+
+    async def close(self):
+        for worker in self._workers:
+            worker.kill()
+        self._workers = []
+        self._idle = None
+
+    def _spawn_all(self):
+        workers = [_Worker(self._ctx, self.memory_mb) for _ in range(self.size)]
+        try:
+            return [worker.wait_ready(WORKER_START_TIMEOUT) for worker in workers]
+        except Exception:
+            for worker in workers:
+                worker.kill()
+            raise
+
+    def _replace(self, worker):
+        """A ready worker in place of `worker`, or None (and the pool one worker smaller) if none starts"""
+        worker.kill()
+        self.recycled += 1
+        for attempt in range(2):
+            new_worker = None
+            try:
+                new_worker = _Worker(self._ctx, self.memory_mb)
+                new_worker.wait_ready(WORKER_START_TIMEOUT)
+            except Exception as e:
+                if new_worker is not None:
+                    new_worker.kill()
+                print(f"⚠️ Sandbox worker failed to start (attempt {attempt + 1}): {e}")
+                continue
+            if worker in self._workers:
+                self._workers[self._workers.index(worker)] = new_worker
+            return new_worker
+        if worker in self._workers:
+            self._workers.remove(worker)
+        print(f"⚠️ Sandbox pool down to {len(self._workers)} of {self.size} workers")
+        return None
+
+    def _run(self, worker, kind, code_text):
+        """Run a task on `worker`, returning (reply or exception, worker to put back)"""
+        try:
+            result = worker.run(kind, code_text, self.timeout)
+        except SandboxError as e:
+            result = e
+        if worker.broken or worker.tasks >= self.max_tasks:
+            worker = self._replace(worker)
+        return result, worker
+
+    def _release(self, worker, future):
+        """Put the worker (or its replacement) back once its task is really done"""
+        if self._idle is None:
+            return
+        if not future.cancelled() and future.exception() is None:
+            worker = future.result()[1]
+        if worker is None:
+            if not self._workers:
+                # No worker left: fail the waiting calls, the next one starts a new pool
+                self._idle.put_nowait(None)
+                self._idle = None
+            return
+        self._idle.put_nowait(worker)
+
+    async def _submit(self, kind, code_text):
+        await self.start()
+        idle = self._idle
+        worker = await idle.get()
+        if worker is None:
+            idle.put_nowait(None)  # for the other waiting calls
+            raise SandboxError("No sandbox worker could be started")
+        future = asyncio.ensure_future(asyncio.to_thread(self._run, worker, kind, code_text))
+        future.add_done_callback(lambda f: self._release(worker, f))
+        # A cancelled caller must not hand the worker out while it is still busy
+        result, _ = await asyncio.shield(future)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def render(self, code_text: str, spans: dict = None):
+        """HTML of the executed component, raises SandboxError with the failure message.
+
+        `spans` (a dict) receives the stage timings measured in the worker.
+        """
+        html, worker_spans = await self._submit('component', code_text)
+        if spans is not None:
+            spans.update(worker_spans)
+        return html
+
+    async def render_partial(self, code_text: str):
+        """HTML of a partially generated component, None if nothing renders yet"""
+        return await self._submit('partial', code_text)
+
+
+sandbox_pool = SandboxPool()
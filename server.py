@@ -0,0 +1,246 @@
+"""Production entry point: import the app once, then fork workers that share it copy-on-write.
+
+    python server.py [--workers 4] [--host 0.0.0.0] [--port 5001] [--max-requests 10000]
+
+The parent imports FastHTML/MonsterUI, the app, the context files and the reference
+index, freezes the heap and forks the workers, which serve a socket they all share.
+Workers are replaced when they exit: recycled after --max-requests, or crashed.
+SIGHUP restarts the workers one at a time, each after its replacement is ready.
+SIGTERM and SIGINT stop them gracefully. To deploy new code, restart the parent.
+
+Conversations and deferred chart data must be visible to every worker, so with more than
+one worker they are kept in CONVERSATION_DB and CHART_CACHE_DB (conversations.db and
+charts.db unless set). Each worker has its own metrics.
+"""
+import os
+import gc
+import sys
+import time
+import random
+import select
+import signal
+import socket
+import asyncio
+import argparse
+import traceback
+import config
+from config import HOST, PORT, WEB_WORKERS, WORKER_MAX_REQUESTS, WORKER_MAX_REQUESTS_JITTER, WORKER_GRACEFUL_TIMEOUT
+
+# A worker that has not started serving after this many seconds is reported
+WORKER_READY_TIMEOUT = 60
+# Workers dying faster than this are restarted with a delay, so a crash loop does not spin
+MIN_WORKER_UPTIME = 1.0
+
+def _ms(seconds: float):
+    return f"{seconds * 1000:.0f}ms"
+
+def _configure_for_workers(workers: int):
+    """Adjust settings read when the app is imported, which happens next"""
+    if "SANDBOX_WORKERS" not in os.environ:
+        # Every worker has its own sandbox pool, split the cores between them
+        config.SANDBOX_WORKERS = max(1, (os.cpu_count() or 2) // workers)
+    if workers > 1:
+        config.CONVERSATION_DB = config.CONVERSATION_DB or "conversations.db"
+        config.CONVERSATION_DB_SHARED = True
+        config.CHART_CACHE_DB = config.CHART_CACHE_DB or "charts.db"
+
+def _bind(host: str, port: int):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    return sock
+
+class Supervisor:
+    """Forks the workers and keeps WORKERS of them running"""
+
+    def __init__(self, app, sock, workers: int, max_requests: int, jitter: int, graceful_timeout: float,
+                 log_level: str = "info"):
+        self.app = app
+        self.sock = sock
+        self.count = workers
+        self.max_requests = max_requests
+        self.jitter = jitter
+        self.graceful_timeout = graceful_timeout
+        self.log_level = log_level
+        self.workers = {}      # pid -> forked at
+        self._ready = set()    # pids that are serving
+        self._retiring = set() # pids stopped on purpose, not to be replaced
+        self._ready_r, self._ready_w = os.pipe()
+        self._restart = False
+        self._stopping = False
+
+    def spawn(self):
+        forked_at = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._serve(forked_at)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = forked_at
+        return pid
+
+    def _serve(self, forked_at: float):
+        """Worker process: serve the shared socket until stopped or recycled"""
+        import uvicorn
+        os.close(self._ready_r)
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, signal.SIG_DFL)
+        # Forked workers share the parent's random state, draw the jitter from the OS
+        limit = self.max_requests + random.SystemRandom().randint(0, self.jitter) if self.max_requests else None
+        server_config = uvicorn.Config(self.app, lifespan="on", log_level=self.log_level, limit_max_requests=limit,
+                                       timeout_graceful_shutdown=self.graceful_timeout)
+        server_config.setup_event_loop()
+        server = uvicorn.Server(server_config)
+
+        async def serve():
+            serving = asyncio.ensure_future(server.serve(sockets=[self.sock]))
+            while not server.started and not serving.done():
+                await asyncio.sleep(0.01)
+            if server.started:
+                print(f"🚀 Worker {os.getpid()} ready in {_ms(time.perf_counter() - forked_at)}", flush=True)
+                os.write(self._ready_w, f"{os.getpid()}\n".encode())
+            await serving
+
+        asyncio.run(serve())
+
+    def _poll(self, timeout: float):
+        """Collect ready notifications for up to `timeout` seconds"""
+        readable, _, _ = select.select([self._ready_r], [], [], timeout)
+        if readable:
+            for line in os.read(self._ready_r, 4096).decode().split():
+                self._ready.add(int(line))
+
+    def _wait_ready(self, pids: set, timeout: float = WORKER_READY_TIMEOUT):
+        deadline = time.perf_counter() + timeout
+        while not pids <= self._ready and not self._stopping:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or not pids & set(self.workers):
+                return False
+            self._poll(min(remaining, 0.5))
+            self._reap()
+        return pids <= self._ready
+
+    def _reap(self):
+        """Wait for exited workers and replace them unless stopping"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            forked_at = self.workers.pop(pid, None)
+            self._ready.discard(pid)
+            if forked_at is None or self._stopping:
+                continue
+            if pid in self._retiring:
+                self._retiring.discard(pid)
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            uptime = time.perf_counter() - forked_at
+            if code == 0:
+                print(f"♻️ Worker {pid} recycled after {uptime:.0f}s")
+            else:
+                print(f"💥 Worker {pid} exited with {code} after {uptime:.1f}s")
+                if uptime < MIN_WORKER_UPTIME:
+                    time.sleep(MIN_WORKER_UPTIME)
+            self.spawn()
+
+    def _rolling_restart(self):
+        print(f"🔄 Restarting {len(self.workers)} worker(s) one at a time")
+        for old in list(self.workers):
+            if self._stopping:
+                return
+            new = self.spawn()
+            if not self._wait_ready({new}):
+                print(f"⚠️ Replacement worker {new} is not ready, stopping {old} anyway")
+            self._retiring.add(old)
+            try:
+                os.kill(old, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _shutdown(self):
+        print(f"👋 Stopping {len(self.workers)} worker(s)")
+        for pid in self.workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.perf_counter() + self.graceful_timeout + 5
+        while self.workers and time.perf_counter() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in self.workers:
+            os.kill(pid, signal.SIGKILL)
+
+    def run(self):
+        def stop(signum, frame):
+            self._stopping = True
+
+        def restart(signum, frame):
+            self._restart = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGHUP, restart)
+
+        start = time.perf_counter()
+        for _ in range(self.count):
+            self.spawn()
+        if self._wait_ready(set(self.workers)):
+            print(f"✅ {self.count} worker(s) ready in {_ms(time.perf_counter() - start)}")
+        else:
+            print(f"⚠️ Only {len(self._ready)} of {self.count} worker(s) ready after {WORKER_READY_TIMEOUT}s")
+
+        while not self._stopping:
+            self._poll(0.5)
+            self._reap()
+            if self._restart:
+                self._restart = False
+                self._rolling_restart()
+        self._shutdown()
+
+def main():
+    started = time.perf_counter()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=WEB_WORKERS)
+    parser.add_argument('--max-requests', type=int, default=WORKER_MAX_REQUESTS, help='recycle a worker after this many requests (0: never)')
+    parser.add_argument('--max-requests-jitter', type=int, default=WORKER_MAX_REQUESTS_JITTER)
+    parser.add_argument('--graceful-timeout', type=float, default=WORKER_GRACEFUL_TIMEOUT)
+    parser.add_argument('--log-level', default="info")
+    args = parser.parse_args()
+    _configure_for_workers(args.workers)
+
+    # Everything the workers need is imported here, once
+    t0 = time.perf_counter()
+    import fasthtml.common
+    import monsterui.all
+    t1 = time.perf_counter()
+    import main as app_module
+    t2 = time.perf_counter()
+    # Keep the collector from touching (and so copying) the preloaded objects in every worker
+    gc.collect()
+    gc.freeze()
+    print(f"⏱️ Imports {_ms(t2 - t0)} (fasthtml + monsterui {_ms(t1 - t0)}, app, prompts and reference index {_ms(t2 - t1)})")
+
+    sock = _bind(args.host, args.port)
+    print(f"🌐 Listening on http://{args.host}:{args.port} with {args.workers} worker(s), "
+          f"{config.SANDBOX_WORKERS} sandbox process(es) each")
+    supervisor = Supervisor(app_module.app, sock, args.workers, args.max_requests, args.max_requests_jitter,
+                            args.graceful_timeout, args.log_level)
+    print(f"⏱️ Parent ready to fork after {_ms(time.perf_counter() - started)}")
+    supervisor.run()
+    sys.exit(0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import asyncio
+
+class _Flight:
+    """One in-flight call shared by every caller with the same key"""
+
+    def __init__(self):
+        self.task = None
+        self.waiters = 0
+        self.listeners = []
+
+    def publish(self, value):
+        """Pass an intermediate value (e.g. a partial render) to every caller that asked for progress"""
+        for listener in list(self.listeners):
+            listener(value)
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one.
+
+    The first caller starts `fn(publish)` as its own task and later callers await the same
+    task, so all of them get its result or its exception. A caller that is cancelled only
+    stops waiting; the call itself is cancelled once no caller is left. The key is released
+    when the call finishes, so results are never reused after that.
+    """
+
+    def __init__(self):
+        self._flights = {}  # key -> _Flight
+
+    def in_flight(self):
+        return len(self._flights)
+
+    async def do(self, key: str, fn, on_progress=None):
+        """(result of `fn`, whether it was shared with an earlier caller)"""
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.ensure_future(fn(flight.publish))
+            flight.task.add_done_callback(lambda task: self._finished(key, flight))
+
+        flight.waiters += 1
+        if on_progress is not None:
+            flight.listeners.append(on_progress)
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if on_progress is not None:
+                flight.listeners.remove(on_progress)
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody wants the result any more; a new caller starts a fresh call
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+    def _finished(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Retrieve the exception so an error nobody waited for is not reported as unhandled
+        if not flight.task.cancelled():
+            flight.task.exception()
@@ -0,0 +1,251 @@
+"""Static checks and rule-based fixes for generated component code.
+
+Generated code keeps making the same few mistakes: a Badge component that does not exist,
+ApexChart without opts, the same keyword (usually cls) passed twice. These are rewritten
+on the syntax tree before the code runs, so they never cost a fix request. Whatever the
+rules cannot fix is reported in one go, checked against the signatures of the real
+FastHTML/MonsterUI exports, and left to the LLM.
+"""
+import ast
+import inspect
+import difflib
+import builtins
+
+# Components models expect that do not exist, rendered as a DaisyUI badge instead
+BADGE_NAMES = {'Badge', 'Chip', 'Pill'}
+# Other names models reach for, and the export that does the same thing
+NAME_ALIASES = {
+    'Icon': 'UkIcon',
+    'Image': 'Img',
+    'Paragraph': 'P',
+    'Heading': 'H2',
+    'Text': 'Span',
+}
+# Keywords models pass instead of ApexChart's opts
+_OPTS_ALIASES = ('options', 'config')
+
+class ComponentValidationError(Exception):
+    """Generated code uses names that do not exist, or calls components with arguments they do not take"""
+
+    def __init__(self, issues: list[str]):
+        super().__init__("; ".join(issues))
+        self.issues = issues
+
+def _signature(value):
+    """Signature to check calls against, None when it cannot be trusted"""
+    try:
+        signature = inspect.signature(value)
+    except (TypeError, ValueError):
+        return None
+    code = getattr(inspect.unwrap(value), '__code__', None)
+    if not inspect.iscode(code):
+        return signature
+    # fastcore's @delegates replaces **kwargs in the signature by the delegate's keywords,
+    # but the function still takes any keyword
+    kinds = {p.kind for p in signature.parameters.values()}
+    if code.co_flags & inspect.CO_VARARGS and inspect.Parameter.VAR_POSITIONAL not in kinds:
+        return None
+    if code.co_flags & inspect.CO_VARKEYWORDS and inspect.Parameter.VAR_KEYWORD not in kinds:
+        signature = signature.replace(parameters=[*signature.parameters.values(),
+                                                  inspect.Parameter('kwargs', inspect.Parameter.VAR_KEYWORD)])
+    return signature
+
+class ComponentRegistry:
+    """The names generated code can use, and the signatures of the callables among them"""
+
+    def __init__(self, namespace):
+        self.names = frozenset(namespace) | frozenset(dir(builtins))
+        self.signatures = {}
+        self._checked = {}  # (name, positional count, keywords) -> problem or None
+        for name, value in namespace.items():
+            if callable(value) and not name.startswith('_'):
+                signature = _signature(value)
+                if signature is not None:
+                    self.signatures[name] = signature
+
+    def parameters(self, name: str):
+        signature = self.signatures.get(name)
+        return signature.parameters if signature is not None else {}
+
+    def check_call(self, name: str, positional: int, keywords: list[str]):
+        """Why a call with this many positional arguments and these keywords fails, or None"""
+        key = (name, positional, tuple(keywords))
+        if key not in self._checked:
+            signature = self.signatures.get(name)
+            problem = None
+            if signature is not None:
+                try:
+                    signature.bind(*[None] * positional, **dict.fromkeys(keywords))
+                except TypeError as e:
+                    problem = str(e)
+            if len(self._checked) >= 4096:
+                self._checked.clear()
+            self._checked[key] = problem
+        return self._checked[key]
+
+    def suggest(self, name: str):
+        matches = difflib.get_close_matches(name, self.signatures, n=1)
+        return matches[0] if matches else None
+
+class _Scan:
+    """The calls, loaded names and bound names of a tree, collected in one pass.
+
+    Literal elements of lists, tuples, sets and dicts (most of a large chart's data) are
+    not visited one by one.
+    """
+
+    def __init__(self, tree: ast.AST):
+        self.calls = []
+        self.loads = []
+        self.bound = set()
+        self.star_import = False
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            kind = type(node)
+            if kind is ast.Name:
+                if type(node.ctx) is ast.Load:
+                    self.loads.append(node)
+                else:
+                    self.bound.add(node.id)
+                continue
+            if kind in (ast.List, ast.Tuple, ast.Set):
+                stack.extend(e for e in node.elts if type(e) is not ast.Constant)
+                continue
+            if kind is ast.Dict:
+                stack.extend(k for k in node.keys if k is not None and type(k) is not ast.Constant)
+                stack.extend(v for v in node.values if type(v) is not ast.Constant)
+                continue
+            if kind is ast.Call:
+                self.calls.append(node)
+            elif kind in (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef):
+                self.bound.add(node.name)
+            elif kind is ast.arg:
+                self.bound.add(node.arg)
+            elif kind is ast.alias:
+                if node.name == '*':
+                    self.star_import = True
+                self.bound.add(node.asname or node.name.split('.')[0])
+            elif kind in (ast.ExceptHandler, ast.MatchAs, ast.MatchStar) and node.name:
+                self.bound.add(node.name)
+            elif kind is ast.MatchMapping and node.rest:
+                self.bound.add(node.rest)
+            elif kind in (ast.Global, ast.Nonlocal):
+                self.bound.update(node.names)
+            stack.extend(ast.iter_child_nodes(node))
+
+def _join_cls(first: ast.expr, second: ast.expr):
+    """A cls value with the classes of both; FastHTML and MonsterUI join tuples of classes"""
+    if (isinstance(first, ast.Constant) and isinstance(first.value, str)
+            and isinstance(second, ast.Constant) and isinstance(second.value, str)):
+        return ast.Constant(f"{first.value} {second.value}".strip())
+    parts = first.elts if isinstance(first, ast.Tuple) else [first]
+    return ast.Tuple([*parts, second], ast.Load())
+
+class _Fixer:
+    def __init__(self, registry: ComponentRegistry, bound: set):
+        self.registry = registry
+        self.bound = bound
+        self.applied = []
+
+    def fix(self, node: ast.Call):
+        self._merge_repeated_keywords(node)
+        # Only calls of a plain name the code does not define itself
+        if not isinstance(node.func, ast.Name) or node.func.id in self.bound:
+            return
+        name = node.func.id
+        if name in self.registry.names:
+            if name == 'ApexChart':
+                self._fix_apex_chart(node)
+        elif name in BADGE_NAMES:
+            self._fix_badge(node)
+        elif name in NAME_ALIASES and NAME_ALIASES[name] in self.registry.names:
+            node.func.id = NAME_ALIASES[name]
+            self.applied.append(f"alias:{name}")
+
+    def _merge_repeated_keywords(self, node: ast.Call):
+        """cls=a, cls=b becomes cls=(a, b); for other keywords the last one wins"""
+        seen = {}
+        keywords = []
+        for keyword in node.keywords:
+            if keyword.arg is None or keyword.arg not in seen:
+                if keyword.arg is not None:
+                    seen[keyword.arg] = keyword
+                keywords.append(keyword)
+                continue
+            first = seen[keyword.arg]
+            first.value = _join_cls(first.value, keyword.value) if keyword.arg == 'cls' else keyword.value
+            self.applied.append("repeated_keyword")
+        node.keywords = keywords
+
+    def _fix_badge(self, node: ast.Call):
+        """Badge("New", cls="badge-primary") becomes Span("New", cls="badge badge-primary")"""
+        classes = ast.Constant("badge")
+        keywords = []
+        for keyword in node.keywords:
+            if keyword.arg in ('variant', 'color') and isinstance(keyword.value, ast.Constant):
+                classes = _join_cls(classes, ast.Constant(f"badge-{keyword.value.value}"))
+            elif keyword.arg == 'cls':
+                value = keyword.value
+                if isinstance(value, ast.Constant) and 'badge' in str(value.value).split():
+                    classes = value
+                else:
+                    classes = _join_cls(classes, value)
+            else:
+                keywords.append(keyword)
+        node.func.id = 'Span'
+        node.keywords = [*keywords, ast.keyword('cls', classes)]
+        self.applied.append("badge")
+
+    def _fix_apex_chart(self, node: ast.Call):
+        """Move the chart options passed positionally or as loose keywords into opts="""
+        if any(keyword.arg == 'opts' for keyword in node.keywords):
+            return
+        for keyword in node.keywords:
+            if keyword.arg in _OPTS_ALIASES:
+                keyword.arg = 'opts'
+                self.applied.append("apexchart_opts")
+                return
+        known = self.registry.parameters('ApexChart')
+        loose = [k for k in node.keywords if k.arg is not None and k.arg not in known]
+        if not node.args and not loose:
+            opts = ast.Dict([ast.Constant('series')], [ast.List([], ast.Load())])
+        elif len(node.args) == 1 and not loose:
+            opts = node.args[0]
+        else:
+            opts = ast.Dict([None] * len(node.args) + [ast.Constant(k.arg) for k in loose],
+                            [*node.args, *(k.value for k in loose)])
+        node.args = []
+        node.keywords = [k for k in node.keywords if k not in loose] + [ast.keyword('opts', opts)]
+        self.applied.append("apexchart_opts")
+
+def fix_and_validate(tree: ast.AST, registry: ComponentRegistry, validate: bool = True):
+    """Rewrite known mistakes in place, then look for problems that would make the code fail:
+    undefined names and calls the signatures reject. Returns (rules applied, problems left).
+    """
+    scan = _Scan(tree)
+    fixer = _Fixer(registry, scan.bound)
+    for call in scan.calls:
+        fixer.fix(call)
+    if fixer.applied:
+        ast.fix_missing_locations(tree)
+    if not validate or scan.star_import:
+        # Star imports can bring in any name
+        return fixer.applied, []
+
+    issues = []
+    unknown = set()
+    for node in scan.loads:
+        if node.id not in registry.names and node.id not in scan.bound and node.id not in unknown:
+            unknown.add(node.id)
+            suggestion = registry.suggest(node.id)
+            hint = f" (did you mean {suggestion}?)" if suggestion else ""
+            issues.append((node.lineno, f"name '{node.id}' is not defined{hint}"))
+    for node in scan.calls:
+        if (isinstance(node.func, ast.Name) and node.func.id not in scan.bound
+                and not any(isinstance(arg, ast.Starred) for arg in node.args)
+                and all(keyword.arg is not None for keyword in node.keywords)):
+            problem = registry.check_call(node.func.id, len(node.args), [k.arg for k in node.keywords])
+            if problem:
+                issues.append((node.lineno, f"{node.func.id}() {problem}"))
+    return fixer.applied, [f"line {line}: {issue}" for line, issue in sorted(issues)]